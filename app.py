@@ -1,16 +1,33 @@
 import os
 import shutil
 import datetime
-import re
 import json
-from flask import Flask, render_template, request, redirect, url_for, jsonify, send_from_directory, abort
-from printers import load_printers, save_printers
-import mqtt_client
-import psutil
+import re
+import time
+import threading
 import zipfile
+from flask import Flask, render_template, request, redirect, url_for, jsonify, send_file, abort, Response, stream_with_context
+from werkzeug.utils import safe_join
+from printers import registry as printer_registry, load_printers
+from mqtt_manager import MqttManager, probe as probe_mqtt
+from printer_status import PrinterStatusCache
+from telemetry import TelemetryStore, MAX_RATE as TELEMETRY_MAX_RATE
+from telemetry_history import TelemetryHistory, RESOLUTIONS
+from telemetry_recorder import TelemetryRecorder
+from command_dispatcher import CommandDispatcher, BATCH_DEADLINE
+from payloads import build_command, payload_print_file, FLEET_PRESETS
+from print_transfer import PrintTransfers
+import psutil
 import base64
-import xml.etree.ElementTree as ET
-from io import StringIO
+from extractor import extract_3mf, EXTRACTOR_VERSION
+from folder_scanner import scan_files
+from ingest_queue import IngestQueue, QueueFull
+from chunked_upload import ChunkedUploads, OffsetMismatch, SessionSuperseded, PART_SUFFIX, CHUNK_SIZE
+from library_watcher import LibraryWatcher
+from thumbnails import ensure_variant, etag_for, new_thumb_key, plate_file_name, legacy_plate_path, reset_thumb_dir, remove_thumbnails, remove_legacy_thumbnails, adopt_legacy_thumbnails, thumbnail_bytes, legacy_thumbnail_bytes
+from metadata_index import MetadataIndex, QuotaExceeded, file_sha256, usage_total, normalize_folder, SORT_KEYS, METADATA_SORTS, FILTERS, PENDING_VERSION, USAGE_FIELDS
+from search_index import SearchIndex, SEARCH_FACETS, SEARCH_RANGES
+from workers import WorkerGroup, LeaderUnavailable, atomic_write
 
 app = Flask(__name__)
 
@@ -26,43 +43,48 @@ HLAVNI_SLOZKA = os.path.join(UPLOAD_DIR, "hlavni_slozka")
 os.makedirs(HLAVNI_SLOZKA, exist_ok=True)
 os.makedirs(THUMBNAILS_DIR, exist_ok=True)
 
-def generate_thumbnails(source_path):
-    try:
-        base_filename = os.path.basename(source_path)
-        if source_path.lower().endswith('.3mf'):
-            with zipfile.ZipFile(source_path, 'r') as zf:
-                thumbnail_names = sorted(
-                    [name for name in zf.namelist() if name.startswith('Metadata/plate_') and name.lower().endswith(('.png', '.jpg', '.jpeg')) and 'small' not in name and 'no_light' not in name],
-                    key=lambda x: int(re.search(r'plate_(\d+)', x).group(1)) if re.search(r'plate_(\d+)', x) else 0
-                )
-                if not thumbnail_names and 'Metadata/thumbnail.png' in zf.namelist():
-                    thumbnail_names.append('Metadata/thumbnail.png')
-                if not thumbnail_names: return
-                for i, thumb_name in enumerate(thumbnail_names):
-                    plate_index_match = re.search(r'plate_(\d+)', thumb_name)
-                    plate_index = plate_index_match.group(1) if plate_index_match else (i + 1)
-                    new_thumb_filename = f"{base_filename}_plate_{plate_index}.png"
-                    thumbnail_path = os.path.join(THUMBNAILS_DIR, new_thumb_filename)
-                    with open(thumbnail_path, 'wb') as f: f.write(zf.read(thumb_name))
-    except Exception as e:
-        print(f"Chyba při generování miniatury pro {source_path}: {e}")
+DATA_DIR = os.path.dirname(UPLOAD_DIR)
+INDEX_DB = os.path.join(DATA_DIR, "metadata_index.sqlite3")
+LEGACY_CACHE_SUFFIX = ".metadata_cache.json"
+HISTORY_DEFAULT_RANGE = 3600
+# Víc worker procesů (viz workers.py): sdílený index a disk, tiskárny obsluhuje jen vedoucí proces
+workers = WorkerGroup(DATA_DIR)
+# Procesy poolu z folder_scanner.py (spawn) importují při `python app.py` tento modul jako __mp_main__;
+# v nich se index, fronty ani vlákna zakládat nesmí - potřebují jen folder_scanner a extractor
+if __name__ != "__mp_main__":
+    metadata_index = MetadataIndex(INDEX_DB)
+    search_index = SearchIndex(metadata_index)
+    ingest_queue = IngestQueue(lambda abs_path, **kwargs: ingest_file(abs_path, **kwargs), os.path.join(DATA_DIR, "ingest_jobs.sqlite3"))
+    chunked_uploads = ChunkedUploads(os.path.join(DATA_DIR, "chunked_uploads"))
+    library_watcher = LibraryWatcher(UPLOAD_DIR, on_changed=lambda p: watch_changed(p), on_deleted=lambda p: watch_deleted(p), on_moved=lambda s, d: watch_moved(s, d),
+                                     on_folder_deleted=lambda p: watch_folder_deleted(p), on_folder_moved=lambda s, d: watch_folder_moved(s, d), ignore=lambda p: not is_library_path(p))
+    telemetry = TelemetryStore()
+    telemetry_history = TelemetryHistory()
+    telemetry_recorder = TelemetryRecorder(os.path.join(DATA_DIR, "telemetry"))
+    mqtt_manager = MqttManager(on_report=lambda printer_id, report: on_printer_report(printer_id, report))
+    command_dispatcher = CommandDispatcher(mqtt_manager.publish)
+    print_transfers = PrintTransfers(lambda printer_id, remote_name: command_dispatcher.send(printer_id, payload_print_file(remote_name)))
+    printer_statuses = PrinterStatusCache(lambda printer: probe_printer(printer))
+LIST_PAGE_SIZE = 100
+THUMBNAIL_MAX_AGE = 365 * 24 * 3600
+LIST_PAGE_MAX = 500
+SEARCH_PAGE_SIZE = 50
+UPLOAD_COPY_BUFFER = 1024 * 1024
 
-def parse_gcode_header_params(gcode_content_stream):
-    params = {}
-    try:
-        lines = gcode_content_stream.readlines()
-        for line in lines[:2000]:
-            if isinstance(line, bytes): line = line.decode('utf-8', 'ignore')
-            line = line.strip()
-            if line.startswith(';'):
-                if "=" in line:
-                    parts = line.lstrip('; ').split('=', 1)
-                    if len(parts) == 2: params[parts[0].strip()] = parts[1].strip().strip('"')
-                elif ":" in line:
-                    parts = line.lstrip('; ').split(':', 1)
-                    if len(parts) == 2: params[parts[0].strip()] = parts[1].strip()
-    except Exception as e: print(f"Chyba při parsování G-kódu: {e}")
-    return params
+def generate_thumbnails(source_path, thumb_key):
+    # Náhledy vznikají jako vedlejší produkt jediného průchodu archivem; záznam se vrací dál
+    record = extract_3mf(source_path, thumbnails_dir=reset_thumb_dir(THUMBNAILS_DIR, thumb_key))
+    if record["error"]: print(f"Chyba při generování miniatury pro {source_path}: {record['error']}")
+    return record
+
+def thumbnail_url(thumb_key, base_filename, plate_index, size, file_stat):
+    # v= je otisk obsahu náhledu (ETag), takže se změní s každým novým náhledem a odpověď může být immutable;
+    # celé sekundy mtime nestačily - nové nahrání během stejné sekundy nechalo v prohlížeči starý náhled
+    if thumb_key: name = f"{thumb_key}/{plate_file_name(plate_index)}"
+    else: name = os.path.basename(legacy_plate_path(THUMBNAILS_DIR, base_filename, plate_index))
+    try: version = etag_for(os.path.join(THUMBNAILS_DIR, name))[:16]
+    except OSError: version = file_stat.st_mtime_ns
+    return f"/thumbnails/{name}?size={size}&v={version}"
 
 def seconds_to_hms(seconds_str):
     try:
@@ -74,7 +96,36 @@ def seconds_to_hms(seconds_str):
     except (ValueError, TypeError):
         return None
 
-def get_full_metadata(abs_path):
+def hms_to_seconds(hms_str):
+    # "1h 2m 3s; total estimated time: ..." z hlavičky G-kódu -> sekundy
+    if not hms_str: return None
+    total, found = 0, False
+    for value, unit in re.findall(r'(\d+)\s*([dhms])', hms_str.split(';')[0]):
+        total += int(value) * {"d": 86400, "h": 3600, "m": 60, "s": 1}[unit]
+        found = True
+    return total if found else None
+
+def record_totals(record):
+    # Celkový čas tisku (s) a hmotnost filamentu (g) přes všechny pláty - pro řazení výpisu
+    plates = (record["slice_info"] or {}).get("plates", {})
+    print_time_s = weight_g = None
+    try:
+        predictions = [int(float(p["prediction"])) for p in plates.values() if p.get("prediction")]
+        if predictions: print_time_s = sum(predictions)
+        weights = [float(p["weight"]) for p in plates.values() if p.get("weight")]
+        if weights: weight_g = round(sum(weights), 2)
+    except (TypeError, ValueError): pass
+    if print_time_s is None:
+        times = [hms_to_seconds(g["params"].get('model printing time')) for g in record["gcode_plates"]]
+        if any(t is not None for t in times): print_time_s = sum(t for t in times if t is not None)
+    if weight_g is None:
+        try:
+            weights = [float(w) for g in record["gcode_plates"] for w in g["params"].get('total filament weight [g]', '').split(',') if w.strip()]
+            if weights: weight_g = round(sum(weights), 2)
+        except ValueError: pass
+    return print_time_s, weight_g
+
+def get_full_metadata(abs_path, record=None, thumb_key=None):
     base_filename, file_stat = os.path.basename(abs_path), os.stat(abs_path)
     file_size_bytes = file_stat.st_size
     file_size_str = f"{round(file_size_bytes / 1024, 2)} kB" if file_size_bytes < 1024 * 1024 else f"{round(file_size_bytes / (1024 * 1024), 2)} MB"
@@ -87,195 +138,378 @@ def get_full_metadata(abs_path):
             try: notes = json.load(f)
             except json.JSONDecodeError: f.seek(0); notes = {"plate_1": f.read()}
 
-    if abs_path.lower().endswith('.3mf'):
-        with zipfile.ZipFile(abs_path, 'r') as zf:
-            plate_details, filaments_map = {}, {}
+    if record is None: record = extract_3mf(abs_path)
+    if record["error"]: data["file_type"] = "Chyba při čtení"
+    elif record["is_3mf"]:
+        slice_info = record["slice_info"] or {}
+        plate_details = {idx: dict(meta) for idx, meta in slice_info.get("plates", {}).items()}
+        if slice_info.get("printer_model"): data["global_info"]["printer_model"] = slice_info["printer_model"]
+        for idx, name in ((record["model_settings"] or {}).get("plate_names") or {}).items():
+            if idx in plate_details: plate_details[idx]['name'] = name
+
+        gcode_plates = record["gcode_plates"]
+        data["file_type"] = "Projekt Bambu Studio" if not gcode_plates else "Tiskový soubor (.3mf)"
+        
+        num_plates = len(gcode_plates) if gcode_plates else 1
+        for i in range(1, num_plates + 1):
+            idx = str(i)
+            plate_meta = plate_details.get(idx, {})
             
-            if "Metadata/slice_info.config" in zf.namelist():
-                try:
-                    root = ET.fromstring(zf.read("Metadata/slice_info.config").decode('utf-8', 'ignore'))
-                    model_map = {"C11": "P1S", "C12": "P1S Combo", "C13": "A1", "C14": "A1 Combo", "N2S": "A1"}
-                    for meta in root.findall(".//metadata"):
-                        if meta.attrib.get("key", "").lower() == "printer_model_id":
-                            data["global_info"]["printer_model"] = model_map.get(meta.attrib.get("value"), meta.attrib.get("value"))
-                    for filament_node in root.findall(".//filament"):
-                        filaments_map[filament_node.attrib.get("id")] = { "type": filament_node.attrib.get("type"), "color": filament_node.attrib.get("color", "AAAAAA")[:6] }
-                    for plate_node in root.findall("plate"):
-                        idx_node = plate_node.find('.//metadata[@key="index"]')
-                        if idx_node is not None:
-                            idx = idx_node.attrib.get('value')
-                            if idx:
-                                plate_details[idx] = {
-                                    'prediction': plate_node.find('.//metadata[@key="prediction"]').attrib.get('value') if plate_node.find('.//metadata[@key="prediction"]') is not None else None,
-                                    'weight': plate_node.find('.//metadata[@key="weight"]').attrib.get('value') if plate_node.find('.//metadata[@key="weight"]') is not None else None,
-                                    'filament_id': plate_node.find("filament").attrib.get("id") if plate_node.find("filament") is not None else None
-                                }
-                except Exception as e: print(f"Chyba při parsování slice_info.config: {e}")
+            gcode_params = gcode_plates[i-1]["params"] if i <= len(gcode_plates) else {}
+
+            time_from_gcode = gcode_params.get('model printing time')
+            time_from_xml = seconds_to_hms(plate_meta.get('prediction'))
+            final_print_time = time_from_xml or time_from_gcode
+
+            nozzle_temp_initial_str = str(gcode_params.get('nozzle_temperature_initial_layer') or gcode_params.get('nozzle_temperature', '0')).split(',')[0]
+            nozzle_temp_other_str = str(gcode_params.get('nozzle_temperature', nozzle_temp_initial_str)).split(',')[0]
+
+            bed_temp_initial_val = (gcode_params.get('textured_plate_temp_initial_layer') or gcode_params.get('hot_plate_temp_initial_layer') or gcode_params.get('cool_plate_temp_initial_layer') or gcode_params.get('bed_temperature_initial_layer'))
+            bed_temp_other_val = (gcode_params.get('textured_plate_temp') or gcode_params.get('hot_plate_temp') or gcode_params.get('cool_plate_temp') or gcode_params.get('bed_temperature'))
+            bed_temp_initial_str = str(bed_temp_initial_val or bed_temp_other_val or '0').split(',')[0]
+            bed_temp_other_str = str(bed_temp_other_val or bed_temp_initial_str).split(',')[0]
             
-            if "Metadata/model_settings.config" in zf.namelist():
-                try:
-                    root = ET.fromstring(zf.read("Metadata/model_settings.config").decode('utf-8', 'ignore'))
-                    for plate_node in root.findall("plate"):
-                        idx_node = plate_node.find('.//metadata[@key="plater_id"]')
-                        name_node = plate_node.find('.//metadata[@key="plater_name"]')
-                        if idx_node is not None and name_node is not None:
-                            idx = idx_node.attrib.get('value')
-                            name = name_node.attrib.get('value')
-                            if idx and idx in plate_details:
-                                plate_details[idx]['name'] = name
-                except Exception as e: print(f"Chyba při parsování model_settings.config: {e}")
-
-            gcode_files = sorted([n for n in zf.namelist() if n.startswith('Metadata/plate_') and n.lower().endswith('.gcode')], key=lambda x: int(re.search(r'plate_(\d+)', x).group(1)) if re.search(r'plate_(\d+)', x) else 0)
+            filaments_used = []
+            types = gcode_params.get('filament_type', '').split(';')
+            colors = gcode_params.get('filament_colour', '').split(';')
+            weights_list = gcode_params.get('total filament weight [g]', '').split(',')
+            lengths_list = gcode_params.get('total filament length [mm]', '').split(',')
             
-            data["file_type"] = "Projekt Bambu Studio" if not gcode_files else "Tiskový soubor (.3mf)"
+            total_weight = 0
+            total_length_mm = 0
             
-            num_plates = len(gcode_files) if gcode_files else 1
-            for i in range(1, num_plates + 1):
-                idx = str(i)
-                plate_meta = plate_details.get(idx, {})
-                
-                gcode_params = {}
-                if gcode_files and i <= len(gcode_files):
-                    gcode_file_name = gcode_files[i-1]
-                    gcode_params = parse_gcode_header_params(StringIO(zf.read(gcode_file_name).decode('utf-8', 'ignore')))
-
-                time_from_gcode = gcode_params.get('model printing time')
-                time_from_xml = seconds_to_hms(plate_meta.get('prediction'))
-                final_print_time = time_from_xml or time_from_gcode
-
-                nozzle_temp_initial_str = str(gcode_params.get('nozzle_temperature_initial_layer') or gcode_params.get('nozzle_temperature', '0')).split(',')[0]
-                nozzle_temp_other_str = str(gcode_params.get('nozzle_temperature', nozzle_temp_initial_str)).split(',')[0]
-
-                bed_temp_initial_val = (gcode_params.get('textured_plate_temp_initial_layer') or gcode_params.get('hot_plate_temp_initial_layer') or gcode_params.get('cool_plate_temp_initial_layer') or gcode_params.get('bed_temperature_initial_layer'))
-                bed_temp_other_val = (gcode_params.get('textured_plate_temp') or gcode_params.get('hot_plate_temp') or gcode_params.get('cool_plate_temp') or gcode_params.get('bed_temperature'))
-                bed_temp_initial_str = str(bed_temp_initial_val or bed_temp_other_val or '0').split(',')[0]
-                bed_temp_other_str = str(bed_temp_other_val or bed_temp_initial_str).split(',')[0]
-                
-                filaments_used = []
-                types = gcode_params.get('filament_type', '').split(';')
-                colors = gcode_params.get('filament_colour', '').split(';')
-                weights_list = gcode_params.get('total filament weight [g]', '').split(',')
-                lengths_list = gcode_params.get('total filament length [mm]', '').split(',')
-                
-                total_weight = 0
-                total_length_mm = 0
-                
-                num_filaments = len(types)
-                if num_filaments > 0 and types[0]:
-                    for f_idx in range(num_filaments):
-                        try:
-                            weight = float(weights_list[f_idx]) if f_idx < len(weights_list) else 0
-                            length_mm = float(lengths_list[f_idx]) if f_idx < len(lengths_list) else 0
-                        except (ValueError, IndexError):
-                            weight = 0
-                            length_mm = 0
-                        
-                        total_weight += weight
-                        total_length_mm += length_mm
-                        
-                        filaments_used.append({
-                            "type": types[f_idx] if f_idx < len(types) else 'N/A',
-                            "color": colors[f_idx].strip('#') if f_idx < len(colors) else 'AAAAAA',
-                            "weight": f"{weight:.2f}",
-                            "length": f"{length_mm / 1000:.2f}"
-                        })
-
-                final_plate_data = {
-                    "plate_index": i, "plate_name": plate_meta.get("name") or f"Plát {i}",
-                    "thumbnail": f"/thumbnails/{base_filename}_plate_{i}.png", "note": notes.get(f"plate_{i}", ""),
-                    "print_time": final_print_time,
-                    "weight": f"{total_weight:.2f}" if total_weight > 0 else None,
-                    "filament_length": f"{total_length_mm / 1000:.2f}" if total_length_mm > 0 else None,
-                    "nozzle_diameter": float(gcode_params.get('nozzle_diameter', 0)),
-                    "layer_height": float(gcode_params.get('layer_height', 0)),
-                    "layers": int(gcode_params.get('total layer number', 0)),
-                    "bed_temp_initial": int(float(bed_temp_initial_str)),
-                    "bed_temp_other": int(float(bed_temp_other_str)),
-                    "nozzle_temp_initial": int(float(nozzle_temp_initial_str)),
-                    "nozzle_temp_other": int(float(nozzle_temp_other_str)),
-                    "plate_type": gcode_params.get('curr_bed_type', 'N/A').replace('_', ' ').title(),
-                    "filaments_used": filaments_used,
-                    "initial_layer_print_height": float(gcode_params.get('initial_layer_print_height', 0)),
-                    "wall_loops": int(gcode_params.get('wall_loops', 0)),
-                    "sparse_infill_pattern": gcode_params.get('sparse_infill_pattern', 'N/A'),
-                    "sparse_infill_density": gcode_params.get('sparse_infill_density', 'N/A'),
-                    "enable_support": "Ano" if gcode_params.get('enable_support') == '1' else "Ne",
-                    "support_type": gcode_params.get('support_type', 'N/A'),
-                    "brim_type": gcode_params.get('brim_type', 'none').replace('_', ' ').title(),
-                    "brim_width": int(gcode_params.get('brim_width', 0))
-                }
-                if total_weight > 0:
-                    cost = (total_weight / 1000) * CONFIG["filament_price_per_kg"]
-                    final_plate_data['print_cost'] = f"{cost:.2f} Kč"
-                data["plates"].append(final_plate_data)
+            num_filaments = len(types)
+            if num_filaments > 0 and types[0]:
+                for f_idx in range(num_filaments):
+                    try:
+                        weight = float(weights_list[f_idx]) if f_idx < len(weights_list) else 0
+                        length_mm = float(lengths_list[f_idx]) if f_idx < len(lengths_list) else 0
+                    except (ValueError, IndexError):
+                        weight = 0
+                        length_mm = 0
+                    
+                    total_weight += weight
+                    total_length_mm += length_mm
+                    
+                    filaments_used.append({
+                        "type": types[f_idx] if f_idx < len(types) else 'N/A',
+                        "color": colors[f_idx].strip('#') if f_idx < len(colors) else 'AAAAAA',
+                        "weight": f"{weight:.2f}",
+                        "length": f"{length_mm / 1000:.2f}"
+                    })
+
+            final_plate_data = {
+                "plate_index": i, "plate_name": plate_meta.get("name") or f"Plát {i}",
+                "thumbnail": thumbnail_url(thumb_key, base_filename, i, "detail", file_stat), "thumbnail_small": thumbnail_url(thumb_key, base_filename, i, "grid", file_stat), "note": notes.get(f"plate_{i}", ""),
+                "print_time": final_print_time,
+                "weight": f"{total_weight:.2f}" if total_weight > 0 else None,
+                "filament_length": f"{total_length_mm / 1000:.2f}" if total_length_mm > 0 else None,
+                "nozzle_diameter": float(gcode_params.get('nozzle_diameter', 0)),
+                "layer_height": float(gcode_params.get('layer_height', 0)),
+                "layers": int(gcode_params.get('total layer number', 0)),
+                "bed_temp_initial": int(float(bed_temp_initial_str)),
+                "bed_temp_other": int(float(bed_temp_other_str)),
+                "nozzle_temp_initial": int(float(nozzle_temp_initial_str)),
+                "nozzle_temp_other": int(float(nozzle_temp_other_str)),
+                "plate_type": gcode_params.get('curr_bed_type', 'N/A').replace('_', ' ').title(),
+                "filaments_used": filaments_used,
+                "initial_layer_print_height": float(gcode_params.get('initial_layer_print_height', 0)),
+                "wall_loops": int(gcode_params.get('wall_loops', 0)),
+                "sparse_infill_pattern": gcode_params.get('sparse_infill_pattern', 'N/A'),
+                "sparse_infill_density": gcode_params.get('sparse_infill_density', 'N/A'),
+                "enable_support": "Ano" if gcode_params.get('enable_support') == '1' else "Ne",
+                "support_type": gcode_params.get('support_type', 'N/A'),
+                "brim_type": gcode_params.get('brim_type', 'none').replace('_', ' ').title(),
+                "brim_width": int(gcode_params.get('brim_width', 0))
+            }
+            if total_weight > 0:
+                cost = (total_weight / 1000) * CONFIG["filament_price_per_kg"]
+                final_plate_data['print_cost'] = f"{cost:.2f} Kč"
+            data["plates"].append(final_plate_data)
     return data
 
-def get_list_view_metadata(abs_path):
+def record_filaments(record):
+    # Typy a barvy ze všech plátů (G-kód) i z projektu (slice_info), bez duplicit
+    filaments = []
+    for plate in record["gcode_plates"]:
+        types, colors = plate["params"].get('filament_type', '').split(';'), plate["params"].get('filament_colour', '').split(';')
+        filaments += [{"type": t.strip(), "color": (colors[i] if i < len(colors) else '').strip().lstrip('#')[:6].upper()} for i, t in enumerate(types) if t.strip()]
+    filaments += [{"type": f.get("type") or "", "color": (f.get("color") or "").upper()} for f in (record["slice_info"] or {}).get("filaments", {}).values() if f.get("type")]
+    return [dict(f) for f in {(f["type"], f["color"]): f for f in filaments}.values()]
+
+def get_list_view_metadata(abs_path, record=None, thumb_key=None):
     base_filename, file_stat = os.path.basename(abs_path), os.stat(abs_path)
-    data = {"name": base_filename, "path": os.path.relpath(abs_path, UPLOAD_DIR).replace("\\", "/"), "modified": datetime.datetime.fromtimestamp(file_stat.st_mtime).strftime('%d.%m.%Y %H:%M'), "thumbnail_files": [], "note": "", "file_type": "N/A", "printer_model": "", "nozzle_diameter": None}
+    data = {"name": base_filename, "path": os.path.relpath(abs_path, UPLOAD_DIR).replace("\\", "/"), "modified": datetime.datetime.fromtimestamp(file_stat.st_mtime).strftime('%d.%m.%Y %H:%M'), "thumbnail_files": [], "note": "", "file_type": "N/A", "printer_model": "", "nozzle_diameter": None, "print_time": None, "print_time_s": None, "weight_g": None, "layer_height": None, "filaments": [], "notes": []}
     try:
-        if abs_path.lower().endswith('.3mf'):
-            with zipfile.ZipFile(abs_path, 'r') as zf:
-                thumb_name = next((name for name in zf.namelist() if name.startswith('Metadata/plate_') and name.lower().endswith('.png') and 'small' not in name and 'no_light' not in name), None)
-                if thumb_name:
-                    plate_index = (re.search(r'plate_(\d+)', thumb_name) or [None, '1'])[1]
-                    data["thumbnail_files"].append(f"/thumbnails/{base_filename}_plate_{plate_index}.png")
-                
-                printer_name = None
-                if "Metadata/slice_info.config" in zf.namelist():
-                    root = ET.fromstring(zf.read("Metadata/slice_info.config").decode('utf-8', 'ignore'))
-                    model_map = {"C11": "P1S", "C12": "P1S Combo", "C13": "A1", "C14": "A1 Combo", "N2S": "A1"}
-                    for meta in root.findall(".//metadata"):
-                        if meta.attrib.get("key", "").lower() == "printer_model_id": printer_name = model_map.get(meta.attrib.get("value"), meta.attrib.get("value"))
-                
-                if not printer_name and "Metadata/model_settings.config" in zf.namelist():
-                    config_content = zf.read("Metadata/model_settings.config").decode('utf-8', 'ignore')
-                    match = re.search(r'printer_model\s*=\s*"([^"]+)"', config_content)
-                    if match: printer_name = match.group(1)
-
-                if printer_name: data["printer_model"] = printer_name.replace("Bambu Lab ", "")
-                
-                gcode_files = [n for n in zf.namelist() if n.lower().endswith('.gcode')]
-                if not gcode_files: data["file_type"], data["printer_model"] = "Projekt Bambu Studio", ""
-                else: 
-                    data["file_type"] = "Tiskový soubor (.3mf)"
-                    params = parse_gcode_header_params(StringIO(zf.read(gcode_files[0]).decode('utf-8', 'ignore')))
-                    data["nozzle_diameter"] = params.get("nozzle_diameter")
+        if record is None: record = extract_3mf(abs_path)
+        if record["error"]: raise ValueError(record["error"])
+        if record["is_3mf"]:
+            data["print_time_s"], data["weight_g"] = record_totals(record)
+            data["print_time"] = seconds_to_hms(data["print_time_s"])
+            if record["thumbnails"]:
+                data["thumbnail_files"].append(thumbnail_url(thumb_key, base_filename, record['thumbnails'][0]['plate'], "grid", file_stat))
+
+            printer_name = (record["slice_info"] or {}).get("printer_model") or (record["model_settings"] or {}).get("printer_model")
+            if printer_name: data["printer_model"] = printer_name.replace("Bambu Lab ", "")
+
+            if not record["gcode_plates"]: data["file_type"], data["printer_model"] = "Projekt Bambu Studio", ""
+            else:
+                data["file_type"] = "Tiskový soubor (.3mf)"
+                data["nozzle_diameter"] = record["gcode_plates"][0]["params"].get("nozzle_diameter")
+                data["layer_height"] = record["gcode_plates"][0]["params"].get("layer_height")
+            data["filaments"] = record_filaments(record)
         
         note_path = abs_path + ".note"
         if os.path.exists(note_path):
             with open(note_path, 'r', encoding='utf-8') as f:
-                try: data["note"] = json.load(f).get("plate_1", "")
-                except json.JSONDecodeError: pass
+                try: notes = json.load(f)
+                except json.JSONDecodeError: notes = {}
+                data["note"] = notes.get("plate_1", "")
+                data["notes"] = [note for note in notes.values() if isinstance(note, str) and note]
     except Exception as e:
         print(f"Chyba při rychlém čtení metadat pro {base_filename}: {e}")
         data["file_type"] = "Chyba při čtení"
     return data
 
-def get_cached_list_view_metadata(abs_path):
-    cache_path = abs_path + ".metadata_cache.json"
-    if os.path.exists(cache_path):
-        try:
-            if os.path.getmtime(cache_path) > os.path.getmtime(abs_path):
-                with open(cache_path, 'r', encoding='utf-8') as f: return json.load(f)
-        except FileNotFoundError: pass
-    metadata = get_list_view_metadata(abs_path)
+def rel_path(abs_path):
+    return os.path.relpath(abs_path, UPLOAD_DIR).replace("\\", "/")
+
+def remove_legacy_cache(abs_path):
+    # Pozůstatek starší verze - cache teď žije v metadata_index
+    if os.path.exists(abs_path + LEGACY_CACHE_SUFFIX): os.remove(abs_path + LEGACY_CACHE_SUFFIX)
+
+def index_file(abs_path, record=None, file_stat=None, content_hash=None, thumb_key=None):
+    file_stat = file_stat or os.stat(abs_path)
+    if thumb_key is None: thumb_key = metadata_index.thumb_key(rel_path(abs_path))
+    if content_hash is None: content_hash = file_sha256(abs_path)
+    if record is None:
+        # Stejný obsah už mohl být zaindexován pod jinou cestou (přesun mimo aplikaci)
+        known = next((e for e in metadata_index.find_by_hash(content_hash, file_stat.st_size) if e["extractor_version"] == EXTRACTOR_VERSION), None)
+        record = known["record"] if known else extract_3mf(abs_path)
+    list_meta = get_list_view_metadata(abs_path, record, thumb_key)
+    metadata_index.upsert(rel_path(abs_path), file_stat.st_mtime, file_stat.st_size, content_hash, EXTRACTOR_VERSION, record, list_meta, thumb_key)
+    remove_legacy_cache(abs_path)
+    return {"record": record, "list_meta": list_meta, "thumb_key": thumb_key}
+
+def is_entry_fresh(entry, file_stat):
+    return entry is not None and entry["mtime"] == file_stat.st_mtime and entry["size"] == file_stat.st_size and entry["extractor_version"] == EXTRACTOR_VERSION
+
+def get_indexed_entry(abs_path, file_stat=None, entry=None):
+    file_stat = file_stat or os.stat(abs_path)
+    if entry is None: entry = metadata_index.get(rel_path(abs_path))
+    if is_entry_fresh(entry, file_stat): return entry
+    return index_file(abs_path, file_stat=file_stat)
+
+def index_files_parallel(abs_paths):
+    # Extrakce běží v procesech, zápis do indexu zůstává tady v hlavním procesu
+    for result in scan_files(abs_paths):
+        abs_path = result["abs_path"]
+        if not os.path.isfile(abs_path): continue
+        yield abs_path, index_file(abs_path, result["record"], content_hash=result["content_hash"])
+
+def ingest_file(abs_path, content_hash=None):
+    # Jeden průchod archivem: náhledy + záznam do indexu (hash z nahrávání po částech se nepočítá znovu).
+    # Zámek přes procesy: stejný soubor může současně hlásit watcher i nahrávání v jiném workeru.
+    with workers.path_lock(rel_path(abs_path)):
+        if not os.path.isfile(abs_path): return
+        entry = metadata_index.get(rel_path(abs_path))
+        if entry is not None and is_entry_fresh(entry, os.stat(abs_path)) and (entry["thumb_key"] or not record_plates(entry["record"])): return
+        if entry is not None and not entry["thumb_key"]: remove_file_thumbnails(abs_path, entry)
+        thumb_key = (entry or {}).get("thumb_key") or new_thumb_key()
+        index_file(abs_path, generate_thumbnails(abs_path, thumb_key), content_hash=content_hash, thumb_key=thumb_key)
+        update_file_usage(abs_path)
+
+def update_file_usage(abs_path, entry=None):
+    # Změří náhledy a poznámku jednoho souboru (pár stat volání); součty složek dopočítají triggery v indexu
+    if entry is None: entry = metadata_index.get(rel_path(abs_path))
+    if entry is None: return
+    if entry["thumb_key"]: thumbs = thumbnail_bytes(THUMBNAILS_DIR, entry["thumb_key"])
+    else: thumbs = legacy_thumbnail_bytes(THUMBNAILS_DIR, os.path.basename(abs_path), record_plates(entry["record"]))
+    extra = sum(os.path.getsize(abs_path + suffix) for suffix in (".note", LEGACY_CACHE_SUFFIX) if os.path.exists(abs_path + suffix))
+    metadata_index.set_usage(rel_path(abs_path), thumbs, extra)
+
+def stream_size(stream):
+    # Nahrávaný soubor je ve Flasku i ve Starlette dočasný soubor, délka se zjistí bez čtení
     try:
-        with open(cache_path, 'w', encoding='utf-8') as f: json.dump(metadata, f)
-    except IOError as e: print(f"Chyba při zápisu do cache souboru {cache_path}: {e}")
-    return metadata
+        position = stream.tell()
+        size = stream.seek(0, os.SEEK_END) - position
+        stream.seek(position)
+        return size
+    except (AttributeError, OSError, ValueError): return 0
+
+def record_plates(record):
+    return [thumb["plate"] for thumb in (record or {}).get("thumbnails", [])]
+
+def remove_file_thumbnails(abs_path, entry=None):
+    # Jen náhledy tohoto souboru podle jeho záznamu v indexu - žádné procházení THUMBNAILS_DIR
+    if entry is None: entry = metadata_index.get(rel_path(abs_path))
+    if entry is None: return
+    if entry["thumb_key"]: remove_thumbnails(THUMBNAILS_DIR, [entry["thumb_key"]])
+    else: remove_legacy_thumbnails(THUMBNAILS_DIR, os.path.basename(abs_path), record_plates(entry["record"]))
+
+def adopt_file_thumbnails(abs_path):
+    # Staré náhledy pojmenované podle souboru se při přejmenování přesunou pod klíč, dál už na názvu nezávisí
+    entry = metadata_index.get(rel_path(abs_path))
+    if entry is None or entry["thumb_key"] or not record_plates(entry["record"]): return
+    thumb_key = new_thumb_key()
+    if adopt_legacy_thumbnails(THUMBNAILS_DIR, os.path.basename(abs_path), record_plates(entry["record"]), thumb_key):
+        metadata_index.set_thumb_key(rel_path(abs_path), thumb_key)
+
+def list_meta_for(abs_path, entry):
+    # Cesta se bere vždy aktuální, takže přesun v indexu nevyžaduje přepočet metadat
+    return dict(entry["list_meta"], path=rel_path(abs_path), name=os.path.basename(abs_path))
+
+def is_library_path(abs_path):
+    # Náhledy, poznámky, staré cache a rozpracované uploady nejsou soubory knihovny
+    if os.path.abspath(abs_path) == os.path.abspath(THUMBNAILS_DIR) or os.path.abspath(abs_path).startswith(os.path.abspath(THUMBNAILS_DIR) + os.sep): return False
+    return not abs_path.endswith(('.note', '.json', PART_SUFFIX))
+
+# --- Hlídání knihovny (změny mimo aplikaci) ---
+def watch_changed(abs_path):
+    # Soubor už zpracovaný (i vlastním uploadem aplikace) se přeskočí; jinak se pošle do fronty zpracování
+    path = rel_path(abs_path)
+    entry = metadata_index.get(path)
+    if is_entry_fresh(entry, os.stat(abs_path)) and (entry["thumb_key"] or not record_plates(entry["record"])): return True
+    if ingest_queue.is_active(path): return True
+    try: ingest_queue.reserve(1)
+    except QueueFull: return False
+    ingest_queue.submit(abs_path, path)
+    return True
+
+def watch_deleted(abs_path):
+    remove_file_thumbnails(abs_path)
+    metadata_index.delete(rel_path(abs_path))
+
+def watch_moved(src, dst):
+    # Přesun provedený aplikací už je v indexu zapsaný; pak stačí ověřit cíl
+    if metadata_index.get(rel_path(src)) is None: return watch_changed(dst) if os.path.isfile(dst) else None
+    adopt_file_thumbnails(src)
+    remove_thumbnails(THUMBNAILS_DIR, metadata_index.move(rel_path(src), rel_path(dst)))
+    if os.path.isfile(dst):
+        refresh_list_meta(dst)
+        watch_changed(dst)
+
+def watch_folder_deleted(abs_path):
+    remove_thumbnails(THUMBNAILS_DIR, metadata_index.delete_folder(rel_path(abs_path)))
+
+def watch_folder_moved(src, dst):
+    metadata_index.move_folder(rel_path(src), rel_path(dst))
+
+def sync_folder_index(folder_path):
+    # Porovná disk s indexem (jen stat); nové a změněné soubory zapíše jako čekající, zmizelé odebere.
+    # Vrací cesty souborů, jejichž metadata ještě nejsou spočítaná.
+    states = metadata_index.folder_states(rel_path(folder_path))
+    changed, pending, seen = [], [], set()
+    for dir_entry in os.scandir(folder_path):
+        if not dir_entry.is_file() or not is_library_path(dir_entry.path): continue
+        path, file_stat = rel_path(dir_entry.path), dir_entry.stat()
+        seen.add(path)
+        state = states.get(path)
+        if state is None or state[0] != file_stat.st_mtime or state[1] != file_stat.st_size or state[2] not in (EXTRACTOR_VERSION, PENDING_VERSION):
+            changed.append((path, file_stat.st_mtime, file_stat.st_size))
+        if state is None or state[:2] != (file_stat.st_mtime, file_stat.st_size) or state[2] != EXTRACTOR_VERSION: pending.append(path)
+    gone = [path for path in states if path not in seen]
+    if gone: metadata_index.delete_many(gone)
+    if changed: metadata_index.add_pending(changed)
+    return pending
+
+def encode_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode('utf-8')).decode('ascii') if cursor else None
+
+def decode_cursor(token):
+    if not token: return None
+    try: cursor = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except Exception: raise ValueError(token)
+    if not isinstance(cursor, list) or len(cursor) != 3: raise ValueError(token)
+    return cursor
+
+def get_cached_list_view_metadata(abs_path):
+    return list_meta_for(abs_path, get_indexed_entry(abs_path))
+
+def refresh_list_meta(abs_path):
+    # Po změně poznámky/názvu stačí přestavět výpis ze záznamu v indexu, archiv se nečte
+    entry = metadata_index.get(rel_path(abs_path))
+    if entry is None or not os.path.isfile(abs_path): return
+    metadata_index.update_list_meta(rel_path(abs_path), get_list_view_metadata(abs_path, entry["record"], entry["thumb_key"]))
 
 # --- Routes ---
 @app.route('/folder_contents/')
 def folder_contents():
     foldername = request.args.get('foldername', 'hlavni_slozka')
     folder_path = os.path.join(UPLOAD_DIR, foldername)
-    if not os.path.isdir(folder_path): return jsonify(files=[])
+    if not os.path.isdir(folder_path): return jsonify(files=[], next_cursor=None, total=0, filter_options={})
+    sort = request.args.get('sort', 'name')
+    if sort not in SORT_KEYS: return jsonify(error="Neplatné řazení"), 400
+    descending = request.args.get('order', 'asc') == 'desc'
+    filters = {key: request.args.get(key) for key in FILTERS if request.args.get(key)}
+    limit = min(max(request.args.get('limit', LIST_PAGE_SIZE, type=int), 1), LIST_PAGE_MAX)
+    try: cursor = decode_cursor(request.args.get('cursor'))
+    except ValueError: return jsonify(error="Neplatný kurzor"), 400
+
+    pending = sync_folder_index(folder_path)
+    # Řazení podle názvu/data zná index i bez metadat, takže se dopočítá jen aktuální stránka.
+    # Řazení a filtry podle metadat potřebují znát všechny soubory složky.
+    if sort in METADATA_SORTS or filters:
+        for _ in index_files_parallel([os.path.join(UPLOAD_DIR, path) for path in pending]): pass
+        pending = []
+    rows, next_cursor, total = metadata_index.query_folder(rel_path(folder_path), sort, descending, filters, cursor, limit)
+    cold = {row["path"]: os.path.join(UPLOAD_DIR, row["path"]) for row in rows if row["extractor_version"] != EXTRACTOR_VERSION}
+    fresh = {path: entry["list_meta"] for path, entry in ((rel_path(abs_path), entry) for abs_path, entry in index_files_parallel(cold.values()))}
     all_files_data = []
-    for filename in os.listdir(folder_path):
-        if os.path.isfile(os.path.join(folder_path, filename)) and not filename.endswith(('.note', '.json')):
-            all_files_data.append(get_cached_list_view_metadata(os.path.join(folder_path, filename)))
-    return jsonify(files=all_files_data)
+    for row in rows:
+        list_meta = fresh.get(row["path"]) if row["path"] in cold else json.loads(row["list_meta"])
+        if list_meta is None: continue
+        all_files_data.append(dict(list_meta, path=row["path"], name=row["name"]))
+    return jsonify(files=all_files_data, next_cursor=encode_cursor(next_cursor), total=total, pending=len(set(pending) - set(cold)), filter_options=metadata_index.filter_options(rel_path(folder_path)))
+
+@app.route('/search')
+def search():
+    # ?q=benchy&filament_type=PETG&nozzle_diameter=0.2&printer_model=A1&max_print_time=7200 (s) &min_weight=&max_weight= (g)
+    # &print_time=1-2 h &folder= (i podsložky); fasetu lze zadat víckrát (nebo čárkami) = kterákoli z hodnot. Vrací výsledky + počty pro fasety.
+    filters = {key: [v for value in request.args.getlist(key) for v in value.split(',') if v] for key in SEARCH_FACETS}
+    filters["folder"] = request.args.get('folder', '')
+    try:
+        for key in SEARCH_RANGES:
+            for bound in ("min", "max"): filters[f"{bound}_{key}"] = request.args.get(f"{bound}_{key}", type=float)
+        for key in ("nozzle_diameter", "layer_height"): filters[key] = [float(v) for v in filters[key]]
+    except ValueError: return jsonify(error="Neplatné číslo ve filtru"), 400
+    limit = min(max(request.args.get('limit', SEARCH_PAGE_SIZE, type=int), 1), LIST_PAGE_MAX)
+    offset = max(request.args.get('offset', 0, type=int), 0)
+    started = time.perf_counter()
+    rows, total, facets = search_index.search(request.args.get('q', ''), filters, limit, offset)
+    took_ms = round((time.perf_counter() - started) * 1000, 2)
+    # Soubory známé jen podle názvu (ještě nezpracované) se dopočítají stejně jako ve výpisu složky
+    cold = [os.path.join(UPLOAD_DIR, row["path"]) for row in rows if row["extractor_version"] != EXTRACTOR_VERSION]
+    fresh = {rel_path(abs_path): entry["list_meta"] for abs_path, entry in index_files_parallel(cold)}
+    files = [dict(fresh.get(row["path"]) or json.loads(row["list_meta"]), path=row["path"], name=row["name"]) for row in rows]
+    return jsonify(files=files, total=total, facets=facets, offset=offset, took_ms=took_ms)
+
+def backfill_index():
+    # Soubory zpracované starší verzí: přestavět list_meta ze záznamu v indexu (archiv se nečte) a změřit náhledy a poznámky
+    for pending_paths, update in ((metadata_index.unsearchable_paths, refresh_list_meta), (metadata_index.unmeasured_paths, update_file_usage)):
+        while True:
+            paths = pending_paths()
+            if not paths: break
+            for path in paths:
+                abs_path = os.path.join(UPLOAD_DIR, path)
+                if os.path.isfile(abs_path): update(abs_path)
+                else: watch_deleted(abs_path)
+
+@app.route('/folder_scan/')
+def folder_scan():
+    # Zahřátí indexu celé složky; výsledky chodí jako NDJSON v pořadí, v jakém procesy doběhnou
+    foldername = request.args.get('foldername', 'hlavni_slozka')
+    folder_path = os.path.join(UPLOAD_DIR, foldername)
+    if not os.path.isdir(folder_path): return jsonify(error="Složka neexistuje"), 404
+    pending = sync_folder_index(folder_path)
+    def generate():
+        yield json.dumps({"pending": len(pending)}) + "\n"
+        done = 0
+        for abs_path, entry in index_files_parallel([os.path.join(UPLOAD_DIR, path) for path in pending]):
+            done += 1
+            yield json.dumps({"file": list_meta_for(abs_path, entry), "done": done}, ensure_ascii=False) + "\n"
+        yield json.dumps({"finished": True, "done": done}) + "\n"
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
 
 @app.route('/files/')
 def list_root_files():
@@ -285,20 +519,49 @@ def list_root_files():
 def file_detail_route(filepath):
     abs_path = os.path.join(UPLOAD_DIR, filepath)
     if not os.path.isfile(abs_path): return "Soubor nenalezen", 404
-    metadata = get_full_metadata(abs_path)
-    return render_template('file_detail.html', data=metadata)
+    entry = get_indexed_entry(abs_path)
+    metadata = get_full_metadata(abs_path, entry["record"], entry["thumb_key"])
+    return render_template('file_detail.html', data=metadata, printers=load_printers() if entry["record"]["gcode_plates"] else [])
 
 @app.route('/settings/')
 def settings_page():
     return render_template('settings.html', current_config=CONFIG)
 
+def on_printer_report(printer_id, report):
+    # Volá se z vlákna MQTT pro každou zprávu: záznam na disk, sloučení do živého stavu a zápis změn do historie
+    command_dispatcher.handle_report(printer_id, report)
+    connection = mqtt_manager.get(printer_id)
+    telemetry_recorder.record(printer_id, report, connection.serial if connection else None)
+    changed = telemetry.apply(printer_id, report)
+    if changed: telemetry_history.record(printer_id, (telemetry.get(printer_id, changed) or {}).get("fields", {}))
+
+def probe_printer(printer):
+    # Živé MQTT spojení stačí; jinak krátká sonda na port tiskárny (běží na pozadí, ne v requestu)
+    if mqtt_manager.is_connected(printer["id"]): return "online"
+    return "online" if probe_mqtt(printer["ip"], timeout=printer_statuses.deadline) else "offline"
+
+@workers.operation
+def printer_status_map(printers):
+    return printer_statuses.get_all(printers)
+
+def with_statuses(printers):
+    statuses = printer_status_map(printers)
+    for printer in printers: printer["status"] = statuses[printer["id"]]
+    return printers
+
+@workers.operation
+def printers_changed(updated=None, removed=None):
+    # Po změně printers.json (v kterémkoli workeru) srovná spojení s tiskárnami ve vedoucím procesu
+    printer_registry.refresh()
+    mqtt_manager.sync(load_printers())
+    if updated is not None: printer_statuses.invalidate(updated)
+    if removed is not None:
+        telemetry.forget(removed)
+        telemetry_history.forget(removed)
+
 @app.route('/')
 def index():
-    printers = load_printers()
-    for printer in printers:
-        printer["status"] = mqtt_client.check_status(printer["ip"], printer["access_code"])
-    save_printers(printers)
-    return render_template('index.html', printers=printers)
+    return render_template('index.html', printers=with_statuses(load_printers()))
 
 @app.route('/all_folders/')
 def all_folders():
@@ -313,55 +576,262 @@ def all_folders():
 
 @app.route('/upload/', methods=['POST'])
 def upload():
-    path = request.form.get('path', '')
+    # Plná fronta = odmítnout hned, ještě než se začne číst tělo požadavku
+    if not ingest_queue.has_capacity(): return jsonify(error="Server zpracovává příliš mnoho souborů, zkuste to za chvíli"), 503, {"Retry-After": "10"}
+    uploads = [(file.filename, file.stream) for file in request.files.getlist('file') if file and file.filename != '']
+    try: jobs = save_uploads(request.form.get('path', ''), uploads)
+    except QueueFull as e: return jsonify(error=str(e)), 503, {"Retry-After": "10"}
+    except QuotaExceeded as e: return jsonify(error=str(e)), 413
+    return jsonify(message="Soubory nahrány", jobs=jobs)
+
+def save_uploads(path, uploads):
+    # uploads: [(název, otevřený soubor)] z Flasku i z ASGI vstupu; při plné frontě QueueFull, nad kvótou složky QuotaExceeded
     target_dir = os.path.join(UPLOAD_DIR, path)
+    metadata_index.check_quota(rel_path(target_dir), sum(stream_size(stream) for _, stream in uploads),
+                               replaced=[rel_path(os.path.join(target_dir, filename)) for filename, _ in uploads])
+    ingest_queue.reserve(len(uploads))
     os.makedirs(target_dir, exist_ok=True)
-    for file in request.files.getlist('file'):
-        if file and file.filename != '':
-            file_dest = os.path.join(target_dir, file.filename)
-            file.save(file_dest)
-            generate_thumbnails(file_dest)
-            cache_path = file_dest + ".metadata_cache.json"
-            if os.path.exists(cache_path): os.remove(cache_path)
-    return jsonify(message="Soubory nahrány")
+    jobs = []
+    for i, (filename, stream) in enumerate(uploads):
+        file_dest = os.path.join(target_dir, filename)
+        try:
+            with open(file_dest, 'wb') as f: shutil.copyfileobj(stream, f, UPLOAD_COPY_BUFFER)
+        except Exception:
+            ingest_queue.release(len(uploads) - i)
+            raise
+        # Náhledy a metadata dopočítá fronta na pozadí, request končí hned po uložení
+        jobs.append(ingest_queue.submit(file_dest, rel_path(file_dest)))
+    return jobs
+
+def chunked_response(session, job=None):
+    return jsonify(upload_id=session["id"], path=session["path"], offset=session["offset"], size=session["size"], complete=session["complete"], content_hash=session["content_hash"], chunk_size=CHUNK_SIZE, job=job)
+
+@app.route('/upload/chunked/', methods=['POST'])
+def chunked_upload_start():
+    path = request.form.get('path', '')
+    filename = request.form.get('filename')
+    size = request.form.get('size', type=int)
+    if not filename or size is None or size < 0: return jsonify(error="Chybí název nebo velikost souboru"), 400
+    file_dest = os.path.join(UPLOAD_DIR, path, filename)
+    try: metadata_index.check_quota(rel_path(os.path.dirname(file_dest)), size, replaced=[rel_path(file_dest)])
+    except QuotaExceeded as e: return jsonify(error=str(e)), 413
+    session = chunked_uploads.create(file_dest, rel_path(file_dest), size, request.form.get('fingerprint', ''))
+    return chunked_response(session)
+
+@app.route('/upload/chunked/<upload_id>', methods=['GET'])
+def chunked_upload_status(upload_id):
+    session = chunked_uploads.get(upload_id)
+    if session is None: return jsonify(error="Nahrávání neexistuje"), 404
+    if session.get("superseded"): return jsonify(error="Nahrávání bylo nahrazeno novějším nahráváním stejného souboru"), 410
+    return chunked_response(session)
+
+@app.route('/upload/chunked/<upload_id>', methods=['PUT'])
+def chunked_upload_chunk(upload_id):
+    offset = request.args.get('offset', type=int)
+    if offset is None: return jsonify(error="Chybí offset"), 400
+    try: session = chunked_uploads.write(upload_id, offset, request.stream)
+    except KeyError: return jsonify(error="Nahrávání neexistuje"), 404
+    except OffsetMismatch as e: return jsonify(error=str(e), offset=e.offset), 409
+    except SessionSuperseded as e: return jsonify(error=str(e)), 410
+    if session["offset"] < session["size"]: return chunked_response(session)
+    # Poslední část: přejmenování na cílový název a předání frontě zpracování
+    try: ingest_queue.reserve(1)
+    except QueueFull as e: return jsonify(error=str(e), offset=session["offset"]), 503, {"Retry-After": "10"}
+    try: session = chunked_uploads.finalize(upload_id)
+    except SessionSuperseded as e:
+        ingest_queue.release(1)
+        return jsonify(error=str(e)), 410
+    except Exception:
+        ingest_queue.release(1)
+        raise
+    job = ingest_queue.submit(session["dest"], session["path"], content_hash=session["content_hash"])
+    return chunked_response(session, job)
+
+@app.route('/upload/chunked/<upload_id>', methods=['DELETE'])
+def chunked_upload_abort(upload_id):
+    if not chunked_uploads.abort(upload_id): return jsonify(error="Nahrávání neexistuje"), 404
+    return jsonify(message="Nahrávání zrušeno")
+
+@app.route('/ingest/jobs/')
+def ingest_jobs():
+    job_ids = [job_id for job_id in request.args.get('ids', '').split(',') if job_id]
+    wait = min(request.args.get('wait', 0, type=float), 30)
+    jobs = ingest_queue.wait_for_change(job_ids, wait) if wait > 0 else ingest_queue.get(job_ids)
+    return jsonify(jobs=jobs)
 
 @app.route('/printer/add', methods=['POST'])
 def add_printer():
-    printers = load_printers()
-    max_id = max([p["id"] for p in printers], default=0)
-    new_printer = { "id": max_id + 1, "name": request.form.get("name", ""), "ip": request.form.get("ip", ""), "access_code": request.form.get("access_code", ""), "serial": request.form.get("serial", ""), "img": request.form.get("img", "default.png"), }
-    printers.append(new_printer)
-    save_printers(printers)
+    printer_registry.add({"name": request.form.get("name", ""), "ip": request.form.get("ip", ""), "access_code": request.form.get("access_code", ""), "serial": request.form.get("serial", ""), "img": request.form.get("img", "default.png")})
+    printers_changed()
     return redirect(url_for('index'))
 
 @app.route('/printer/<int:pid>')
 def printer_detail(pid):
-    printers = load_printers()
-    printer = next((p for p in printers if p["id"] == pid), None)
+    printer = printer_registry.get(pid)
     if not printer: return "Tiskárna nenalezena", 404
-    return render_template('printer_detail.html', printer=printer)
+    return render_template('printer_detail.html', printer=with_statuses([printer])[0])
 
 @app.route('/printer/<int:pid>/update', methods=['POST'])
 def printer_update(pid):
-    printers = load_printers()
-    for p in printers:
-        if p["id"] == pid:
-            p["name"] = request.form.get("name", p["name"])
-            p["ip"] = request.form.get("ip", p["ip"])
-            p["access_code"] = request.form.get("access_code", p["access_code"])
-            p["serial"] = request.form.get("serial", p["serial"])
-    save_printers(printers)
+    fields = {key: request.form[key] for key in ("name", "ip", "access_code", "serial") if key in request.form}
+    if printer_registry.update(pid, fields) is None: return "Tiskárna nenalezena", 404
+    printers_changed(updated=pid)
     return redirect(url_for('printer_detail', pid=pid))
 
+@workers.operation
+def run_printer_command(pid, name, arg=None):
+    # Skutečný výsledek podle potvrzení od tiskárny (sequence_id), ne jen "publish nespadl"
+    try: payload, idempotent = build_command(name, arg)
+    except ValueError as e: return {"ok": False, "result": "invalid", "reason": str(e), "latency_ms": None, "attempts": 0, "sequence_id": None}
+    return command_dispatcher.send(pid, payload, idempotent=idempotent)
+
 @app.route('/printer/<int:pid>/cmd/<cmd>')
 def printer_command(pid, cmd):
-    return redirect(url_for('printer_detail', pid=pid))
+    if printer_registry.get(pid) is None: return "Tiskárna nenalezena", 404
+    result = run_printer_command(pid, cmd, request.args.get('arg'))
+    return redirect(url_for('printer_detail', pid=pid, cmd=cmd, cmd_result=result["result"], cmd_reason=result["reason"] or ""))
+
+@app.route('/api/printers/<int:pid>/command', methods=['POST'])
+def api_printer_command(pid):
+    if printer_registry.get(pid) is None: return jsonify(error="Tiskárna nenalezena"), 404
+    data = request.get_json(silent=True) or request.form
+    result = run_printer_command(pid, data.get('cmd', ''), data.get('arg'))
+    return jsonify(printer_id=pid, **result), 400 if result["result"] == "invalid" else 200
+
+def select_printers(printers, selector):
+    # "all", seznam id, nebo {"ids": [...]} / {"model": "P1S"} (model z printers.json, jinak podle názvu tiskárny)
+    if selector in (None, "all"): return printers
+    if isinstance(selector, list): selector = {"ids": selector}
+    if not isinstance(selector, dict): raise ValueError("Neplatný výběr tiskáren")
+    selected = printers
+    if "ids" in selector:
+        ids = {int(i) for i in selector["ids"]}
+        selected = [p for p in selected if p["id"] in ids]
+    if selector.get("model"):
+        model = str(selector["model"]).lower()
+        selected = [p for p in selected if model in (p.get("model") or p.get("name") or "").lower()]
+    return selected
+
+@workers.operation
+def run_fleet_command(data, deadline=BATCH_DEADLINE):
+    # {"cmd": "bed_temp", "arg": 0} nebo {"commands": [{"cmd", "arg"}, ...]} nebo {"preset": "end_of_shift"},
+    # výběr "printers": "all" | [id, ...] | {"model": "..."}; vrací (tabulka výsledků po tiskárnách, HTTP status)
+    if data.get("preset"):
+        if data["preset"] not in FLEET_PRESETS: return {"error": "Neznámá sada příkazů", "presets": list(FLEET_PRESETS)}, 400
+        commands = FLEET_PRESETS[data["preset"]]
+    else:
+        commands = [(c.get("cmd", ""), c.get("arg")) for c in data.get("commands", [])] or [(data.get("cmd", ""), data.get("arg"))]
+    try:
+        targets = select_printers(load_printers(), data.get("printers", "all"))
+        # Nejdřív ověření všech příkazů, ať se dávka neodešle napůl
+        for name, arg in commands: build_command(name, None if arg is None else str(arg))
+    except (ValueError, TypeError) as e: return {"error": str(e)}, 400
+    if not targets: return {"error": "Výběru neodpovídá žádná tiskárna"}, 404
+    jobs = {p["id"]: [build_command(name, None if arg is None else str(arg)) for name, arg in commands] for p in targets}
+    table = command_dispatcher.send_batch(jobs, min(deadline, BATCH_DEADLINE))
+    names = {p["id"]: p["name"] for p in targets}
+    results = [dict(printer_id=pid, name=names[pid], **row) for pid, row in table.items()]
+    return {"ok": all(r["ok"] for r in results), "commands": [name for name, _ in commands], "results": results}, 200
+
+@app.route('/api/fleet/command', methods=['POST'])
+def fleet_command():
+    body, status = run_fleet_command(request.get_json(silent=True) or {}, request.args.get('deadline', BATCH_DEADLINE, type=float))
+    return jsonify(body), status
+
+@workers.operation
+def submit_print(printers, data):
+    # Společné pro jednu tiskárnu i celou farmu: ověří soubor a plát, úlohy běží na pozadí
+    rel = data.get('path', '')
+    abs_path = safe_join(UPLOAD_DIR, rel) if rel else None
+    if not abs_path or not os.path.isfile(abs_path): raise FileNotFoundError("Soubor nenalezen")
+    start = str(data.get('start', True)).lower() not in ("0", "false", "no")
+    return [print_transfers.submit(printer, abs_path, rel_path(abs_path), int(data.get('plate') or 1), start) for printer in printers]
+
+@app.route('/api/printers/<int:pid>/print', methods=['POST'])
+def api_printer_print(pid):
+    # {"path": "slozka/model.3mf", "plate": 1, "start": true} -> 202 a úloha pro sledování průběhu
+    printer = printer_registry.get(pid)
+    if printer is None: return jsonify(error="Tiskárna nenalezena"), 404
+    try: jobs = submit_print([printer], request.get_json(silent=True) or request.form.to_dict())
+    except FileNotFoundError as e: return jsonify(error=str(e)), 404
+    except (ValueError, zipfile.BadZipFile) as e: return jsonify(error=str(e)), 400
+    return jsonify(job=jobs[0]), 202
+
+@app.route('/api/fleet/print', methods=['POST'])
+def fleet_print():
+    # Stejný plát na víc tiskáren najednou; "printers" jako u /api/fleet/command
+    data = request.get_json(silent=True) or {}
+    try:
+        targets = select_printers(load_printers(), data.get("printers", "all"))
+        if not targets: return jsonify(error="Výběru neodpovídá žádná tiskárna"), 404
+        jobs = submit_print(targets, data)
+    except FileNotFoundError as e: return jsonify(error=str(e)), 404
+    except (ValueError, TypeError, zipfile.BadZipFile) as e: return jsonify(error=str(e)), 400
+    return jsonify(jobs=jobs), 202
+
+@workers.operation
+def print_job_status(job_ids=None, wait=0):
+    if not job_ids: return print_transfers.get()
+    return print_transfers.wait_for_change(job_ids, wait) if wait > 0 else print_transfers.get(job_ids)
+
+@app.route('/api/print/jobs')
+def print_jobs():
+    job_ids = [job_id for job_id in request.args.get('ids', '').split(',') if job_id]
+    return jsonify(jobs=print_job_status(job_ids, min(request.args.get('wait', 0, type=float), 30)))
+
+@workers.operation
+def dispatcher_metrics():
+    return command_dispatcher.metrics()
+
+@app.route('/api/commands/metrics')
+def command_metrics():
+    # Histogramy latence potvrzení a počty výsledků po tiskárnách
+    return jsonify(dispatcher_metrics())
+
+@workers.operation
+def live_state(pid, fields=None):
+    state = telemetry.get(pid, fields) or {"fields": {}, "updated_at": None, "messages": 0}
+    return dict(connection=mqtt_manager.state(pid), **state)
+
+@app.route('/api/printers/<int:pid>/state')
+def printer_state(pid):
+    # Stav z paměti (slučované push_status zprávy), bez otevírání MQTT spojení; ?fields=a,b omezí výstup
+    if printer_registry.get(pid) is None: return jsonify(error="Tiskárna nenalezena"), 404
+    fields = [f for f in request.args.get('fields', '').split(',') if f] or None
+    return jsonify(printer_id=pid, **live_state(pid, fields))
+
+@workers.operation
+def history_query(pid, metric, start, end, resolution):
+    return telemetry_history.query(pid, metric, start, end, resolution)
+
+@app.route('/api/printers/<int:pid>/history')
+def printer_history(pid):
+    # ?metric=bed_temper&start=&end= (unix čas) &resolution=auto|raw|1m|1h; sloupcový výstup t/v(/min/max) pro graf
+    if printer_registry.get(pid) is None: return jsonify(error="Tiskárna nenalezena"), 404
+    metric = request.args.get('metric', 'bed_temper')
+    if metric not in telemetry_history.metrics: return jsonify(error="Neznámá veličina", metrics=list(telemetry_history.metrics)), 400
+    resolution = request.args.get('resolution', 'auto')
+    if resolution != 'auto' and resolution not in RESOLUTIONS: return jsonify(error="Neplatné rozlišení"), 400
+    end = request.args.get('end', time.time(), type=float)
+    start = request.args.get('start', end - HISTORY_DEFAULT_RANGE, type=float)
+    return jsonify(printer_id=pid, start=start, end=end, **history_query(pid, metric, start, end, resolution))
+
+@workers.stream
+def telemetry_events(printer_ids, rate):
+    return telemetry.stream(printer_ids, rate)
+
+@app.route('/api/printers/stream')
+def printer_state_stream():
+    # Server-Sent Events: změny telemetrie všem otevřeným stránkám z jednoho MQTT odběru na tiskárnu
+    printer_ids = [p["id"] for p in load_printers()]
+    wanted = {int(i) for i in request.args.get('ids', '').split(',') if i.isdigit()}
+    if wanted: printer_ids = [pid for pid in printer_ids if pid in wanted]
+    rate = request.args.get('rate', TELEMETRY_MAX_RATE, type=float)
+    return Response(stream_with_context(telemetry_events(printer_ids, rate)), mimetype='text/event-stream', headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
 
 @app.route('/printer/<int:pid>/upload_image', methods=['POST'])
 def upload_printer_image(pid):
-    printers = load_printers()
-    printer = next((p for p in printers if p["id"] == pid), None)
-    if not printer: return "Tiskárna nenalezena", 404
+    if printer_registry.get(pid) is None: return "Tiskárna nenalezena", 404
     if 'image' not in request.files: return redirect(url_for('printer_detail', pid=pid))
     file = request.files['image']
     if file.filename == '': return redirect(url_for('printer_detail', pid=pid))
@@ -369,34 +839,29 @@ def upload_printer_image(pid):
     filename = f"printer_{pid}{extension}"
     filepath = os.path.join(IMAGE_DIR, filename)
     file.save(filepath)
-    printer['img'] = filename
-    save_printers(printers)
+    printer_registry.update(pid, {"img": filename})
     return redirect(url_for('printer_detail', pid=pid))
 
 @app.route('/printer/<int:pid>/delete_image', methods=['POST'])
 def delete_printer_image(pid):
-    printers = load_printers()
-    printer = next((p for p in printers if p["id"] == pid), None)
+    printer = printer_registry.get(pid)
     if not printer: return "Tiskárna nenalezena", 404
     img = printer.get('img')
     if img and img != 'default.png':
         img_path = os.path.join(IMAGE_DIR, img)
         if os.path.exists(img_path): os.remove(img_path)
-        printer['img'] = 'default.png'
-        save_printers(printers)
+        printer_registry.update(pid, {"img": "default.png"})
     return redirect(url_for('printer_detail', pid=pid))
 
 @app.route('/printer/<int:pid>/delete', methods=['POST'])
 def delete_printer(pid):
-    printers = load_printers()
-    printer_to_delete = next((p for p in printers if p["id"] == pid), None)
+    printer_to_delete = printer_registry.remove(pid)
     if not printer_to_delete: return "Tiskárna nenalezena", 404
     img = printer_to_delete.get('img')
     if img and img != 'default.png':
         img_path = os.path.join(IMAGE_DIR, img)
         if os.path.exists(img_path): os.remove(img_path)
-    printers = [p for p in printers if p["id"] != pid]
-    save_printers(printers)
+    printers_changed(removed=pid)
     return redirect(url_for('index'))
 
 @app.route('/folders/', methods=['POST'])
@@ -415,6 +880,7 @@ def delete_folder():
     path = os.path.join(UPLOAD_DIR, foldername)
     if os.path.isdir(path):
         shutil.rmtree(path)
+        remove_thumbnails(THUMBNAILS_DIR, metadata_index.delete_folder(rel_path(path)))
         return jsonify(message="Složka smazána")
     return jsonify(error="Složka neexistuje"), 404
 
@@ -427,6 +893,7 @@ def rename_folder():
     tgt = os.path.join(os.path.dirname(src), target)
     if os.path.isdir(src):
         os.rename(src, tgt)
+        metadata_index.move_folder(rel_path(src), rel_path(tgt))
         return jsonify(message="Složka přejmenována")
     return jsonify(error="Složka neexistuje"), 404
 
@@ -438,9 +905,11 @@ def move_file():
     dest_dir = os.path.join(UPLOAD_DIR, target_folder)
     if not os.path.exists(src): return jsonify(error="Soubor neexistuje"), 404
     os.makedirs(dest_dir, exist_ok=True)
-    shutil.move(src, os.path.join(dest_dir, os.path.basename(filename)))
-    for ext in [".note", ".metadata_cache.json"]:
-        if os.path.exists(src + ext): shutil.move(src + ext, os.path.join(dest_dir, os.path.basename(src + ext)))
+    dst = os.path.join(dest_dir, os.path.basename(filename))
+    shutil.move(src, dst)
+    if os.path.exists(src + ".note"): shutil.move(src + ".note", dst + ".note")
+    remove_legacy_cache(src)
+    remove_thumbnails(THUMBNAILS_DIR, metadata_index.move(filename, rel_path(dst)))
     return jsonify(message="Soubor přesunut")
 
 @app.route('/rename_file/', methods=['POST'])
@@ -458,23 +927,20 @@ def rename_file():
         return jsonify(error="Zdrojový soubor neexistuje."), 404
 
     try:
+        adopt_file_thumbnails(src)
         os.rename(src, dst)
 
         if os.path.exists(src + ".note"):
             os.rename(src + ".note", dst + ".note")
 
-        if os.path.exists(src + ".metadata_cache.json"):
-            os.remove(src + ".metadata_cache.json")
+        remove_legacy_cache(src)
 
-        old_base_name = os.path.basename(old_name_path)
-        new_base_name_for_thumb = os.path.basename(new_name_base)
-        for thumb_file in os.listdir(THUMBNAILS_DIR):
-            if thumb_file.startswith(old_base_name):
-                new_thumb_name = thumb_file.replace(old_base_name, new_base_name_for_thumb, 1)
-                os.rename(os.path.join(THUMBNAILS_DIR, thumb_file), os.path.join(THUMBNAILS_DIR, new_thumb_name))
+        remove_thumbnails(THUMBNAILS_DIR, metadata_index.move(old_name_path, rel_path(dst)))
+        refresh_list_meta(dst)
+        entry = metadata_index.get(rel_path(dst))
 
         new_full_path = os.path.relpath(dst, UPLOAD_DIR).replace("\\", "/")
-        return jsonify(message="Soubor úspěšně přejmenován.", new_path=new_full_path)
+        return jsonify(message="Soubor úspěšně přejmenován.", new_path=new_full_path, thumbnail_files=entry["list_meta"].get("thumbnail_files", []) if entry else [])
 
     except Exception as e:
         print(f"!!! KRITICKÁ CHYBA BĚHEM PŘEJMENOVÁNÍ: {e} !!!")
@@ -489,14 +955,16 @@ def save_note():
     note = request.form.get('note')
     note_path = os.path.join(UPLOAD_DIR, file_path) + ".note"
     notes = {}
-    if os.path.exists(note_path):
-        with open(note_path, 'r', encoding='utf-8') as f:
-            try: notes = json.load(f)
-            except json.JSONDecodeError: pass 
-    notes[f"plate_{plate_index}"] = note
-    with open(note_path, "w", encoding="utf-8") as f: json.dump(notes, f, ensure_ascii=False, indent=4)
-    cache_path = os.path.join(UPLOAD_DIR, file_path) + ".metadata_cache.json"
-    if os.path.exists(cache_path): os.remove(cache_path)
+    # Poznámky k různým plátům ze dvou workerů najednou: čtení i zápis pod zámkem, zápis atomicky
+    with workers.path_lock(note_path):
+        if os.path.exists(note_path):
+            with open(note_path, 'r', encoding='utf-8') as f:
+                try: notes = json.load(f)
+                except json.JSONDecodeError: pass 
+        notes[f"plate_{plate_index}"] = note
+        atomic_write(note_path, json.dumps(notes, ensure_ascii=False, indent=4))
+    refresh_list_meta(os.path.join(UPLOAD_DIR, file_path))
+    update_file_usage(os.path.join(UPLOAD_DIR, file_path))
     return jsonify(message="Poznámka uložena")
 
 @app.route('/get_note/')
@@ -518,12 +986,10 @@ def delete_file():
     file_path = os.path.join(UPLOAD_DIR, filename)
     if os.path.isfile(file_path):
         os.remove(file_path)
-        for ext in [".note", ".metadata_cache.json"]:
+        for ext in [".note", LEGACY_CACHE_SUFFIX]:
             if os.path.exists(file_path + ext): os.remove(file_path + ext)
-        base_name = os.path.basename(filename)
-        for thumb_file in os.listdir(THUMBNAILS_DIR):
-            if thumb_file.startswith(base_name):
-                os.remove(os.path.join(THUMBNAILS_DIR, thumb_file))
+        remove_file_thumbnails(file_path)
+        metadata_index.delete(filename)
         return jsonify(message="Soubor smazán")
     return jsonify(error="Soubor neexistuje"), 404
 
@@ -537,12 +1003,10 @@ def delete_multiple_files():
         if os.path.isfile(file_path):
             try:
                 os.remove(file_path)
-                for ext in [".note", ".metadata_cache.json"]:
+                for ext in [".note", LEGACY_CACHE_SUFFIX]:
                     if os.path.exists(file_path + ext): os.remove(file_path + ext)
-                base_name = os.path.basename(filename)
-                for thumb_file in os.listdir(THUMBNAILS_DIR):
-                    if thumb_file.startswith(base_name):
-                        os.remove(os.path.join(THUMBNAILS_DIR, thumb_file))
+                remove_file_thumbnails(file_path)
+                metadata_index.delete(filename)
                 deleted_count += 1
             except Exception as e:
                 errors.append(f"Chyba při mazání souboru {filename}: {e}")
@@ -552,14 +1016,83 @@ def delete_multiple_files():
         return jsonify(message=f"Smazáno {deleted_count} souborů, ale vyskytly se chyby.", errors=errors), 500
     return jsonify(message=f"Úspěšně smazáno {deleted_count} souborů.")
 
+def usage_breakdown(folder=""):
+    # Součty za složku včetně podsložek a za každou přímou podsložku; jen z tabulky součtů v indexu
+    folder = normalize_folder(folder)
+    usage, quotas = metadata_index.folder_usage(), metadata_index.quotas()
+    def totals(name):
+        rows = [row for path, row in usage.items() if not name or path == name or path.startswith(name + "/")]
+        result = {key: sum(row[key] for row in rows) for key in USAGE_FIELDS}
+        result["total_bytes"] = usage_total(result)
+        result["quota_bytes"] = quotas.get(name)
+        result["quota_used_percent"] = round(result["total_bytes"] * 100 / quotas[name], 1) if quotas.get(name) else None
+        return dict(folder=name, **result)
+    prefix = folder + "/" if folder else ""
+    children = {(path[len(prefix):].split("/")[0]) for path in list(usage) + list(quotas) if path.startswith(prefix) and path != folder}
+    return dict(totals(folder), children=sorted((totals(prefix + child) for child in children if child), key=lambda row: -row["total_bytes"]))
+
+@app.route('/api/usage')
+def api_usage():
+    # ?folder=zakaznik -> obsazené místo (originály, náhledy, poznámky) složky a jejích podsložek + kvóty
+    return jsonify(usage_breakdown(request.args.get('folder', '')))
+
+@app.route('/api/usage/quota', methods=['POST'])
+def api_usage_quota():
+    # {"folder": "zakaznik", "quota_bytes": 5000000000}; prázdná / null kvóta ji zruší
+    data = request.get_json(silent=True) or request.form
+    folder = normalize_folder(str(data.get('folder', '')))
+    quota = data.get('quota_bytes')
+    try: quota = None if quota in (None, "") else int(quota)
+    except (TypeError, ValueError): return jsonify(error="Neplatná kvóta"), 400
+    if quota is not None and quota < 0: return jsonify(error="Neplatná kvóta"), 400
+    metadata_index.set_quota(folder, quota)
+    return jsonify(usage_breakdown(folder))
+
 @app.route('/disk_usage/')
 def disk_usage():
     usage = psutil.disk_usage(UPLOAD_DIR).percent
-    return jsonify(disk_usage_percent=usage)
+    if 'folder' not in request.args: return jsonify(disk_usage_percent=usage)
+    folder = usage_breakdown(request.args.get('folder', ''))
+    return jsonify(disk_usage_percent=usage, folder_bytes=folder["total_bytes"], folder_quota_bytes=folder["quota_bytes"])
 
 @app.route('/thumbnails/<path:filename>')
 def serve_thumbnail(filename):
-    return send_from_directory(THUMBNAILS_DIR, filename)
+    original_path = safe_join(THUMBNAILS_DIR, filename)
+    if original_path is None or not os.path.isfile(original_path): abort(404)
+    path = ensure_variant(original_path, request.args.get('size'))
+    versioned = bool(request.args.get('v'))
+    response = send_file(path, etag=etag_for(path), conditional=True, max_age=THUMBNAIL_MAX_AGE if versioned else 0)
+    # Verzovaná URL se nikdy nemění; bez verze musí prohlížeč vždy ověřit ETag (odpověď 304)
+    if versioned: response.cache_control.immutable = True
+    else: response.cache_control.no_cache = True
+    return response
+
+@app.errorhandler(LeaderUnavailable)
+def leader_unavailable(e):
+    return jsonify(error=str(e)), 503, {"Retry-After": "5"}
+
+def start_printer_services():
+    # Hlídání knihovny a spojení s tiskárnami; jen v jednom procesu (vedoucím), ostatní mu operace předávají
+    library_watcher.start()
+    threading.Thread(target=backfill_index, name="index-backfill", daemon=True).start()
+    telemetry_recorder.start()
+    mqtt_manager.sync(load_printers())
+    printer_statuses.start(load_printers)
+
+_services_started = False
+_services_lock = threading.Lock()
+
+def start_background_services():
+    # Volá se v každém procesu, který obsluhuje požadavky (lifespan v asgi.py, hook v gunicorn.conf.py,
+    # vývojový server); další volání nic nedělá. Index vyhledávání má každý proces svůj.
+    global _services_started
+    with _services_lock:
+        if _services_started: return
+        _services_started = True
+    threading.Thread(target=search_index.refresh, name="search-index", daemon=True).start()
+    workers.start(start_printer_services)
 
 if __name__ == '__main__':
+    # S reloaderem se služby spouští jen v procesu, který obsluhuje požadavky
+    if os.environ.get("WERKZEUG_RUN_MAIN") == "true": start_background_services()
     app.run(host='0.0.0.0', port=8000, debug=True)
@@ -0,0 +1,111 @@
+import asyncio
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse, StreamingResponse
+try:
+    from a2wsgi import WSGIMiddleware
+except ImportError:
+    from fastapi.middleware.wsgi import WSGIMiddleware  # starší varianta ze Starlette, bez vlastního poolu vláken
+import app as printernest
+from ingest_queue import QueueFull
+from metadata_index import QuotaExceeded
+from telemetry import KEEPALIVE_SECONDS, KEEPALIVE_EVENT, MAX_RATE, stream_interval
+
+# ASGI vstup se stejnými cestami jako app.py:  uvicorn asgi:api --host 0.0.0.0 --port 8000
+# Víc procesů:  uvicorn asgi:api --host 0.0.0.0 --port 8000 --workers 4  (viz workers.py)
+# Dlouho čekající a I/O cesty (SSE, upload, příkazy tiskárnám) běží nativně v asyncio, ostatní
+# jde do Flask aplikace přes WSGI most s vlastním poolem vláken. Extrakce metadat má svoje
+# executory (fronta zpracování, pool procesů pro složky), takže pomalý archiv neblokuje smyčku.
+WSGI_WORKERS = 32
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+@asynccontextmanager
+async def lifespan(api):
+    printernest.start_background_services()
+    yield
+    printernest.mqtt_manager.stop()
+    printernest.telemetry_recorder.stop()
+    printernest.printer_registry.flush()
+
+api = FastAPI(lifespan=lifespan, docs_url=None, redoc_url=None, openapi_url=None)
+
+def _printer_ids(ids):
+    printer_ids = [p["id"] for p in printernest.load_printers()]
+    wanted = {int(i) for i in (ids or "").split(',') if i.isdigit()}
+    return [pid for pid in printer_ids if pid in wanted] if wanted else printer_ids
+
+async def _telemetry_events(printer_ids, rate):
+    # Bez vlákna na klienta: MQTT vlákno jen nastaví asyncio.Event, změny se čtou až při odeslání
+    loop = asyncio.get_running_loop()
+    changed = asyncio.Event()
+
+    def wake():
+        try: loop.call_soon_threadsafe(changed.set)
+        except RuntimeError: pass  # smyčka už skončila
+
+    subscription = printernest.telemetry.subscribe(printer_ids, listener=wake)
+    min_interval = stream_interval(rate)
+    try:
+        for event in printernest.telemetry.snapshot_events(printer_ids): yield event
+        while True:
+            try: await asyncio.wait_for(changed.wait(), KEEPALIVE_SECONDS)
+            except asyncio.TimeoutError:
+                yield KEEPALIVE_EVENT
+                continue
+            changed.clear()
+            for event in printernest.telemetry.update_events(subscription.wait(0)): yield event
+            # Změny, které přijdou během pauzy, se sloučí do další zprávy
+            await asyncio.sleep(min_interval)
+    finally:
+        printernest.telemetry.unsubscribe(subscription)
+
+@api.get("/api/printers/stream")
+async def printer_state_stream(ids: str = "", rate: float = MAX_RATE):
+    # Worker bez spojení s tiskárnami dostává události od vedoucího procesu (synchronní generátor běží v poolu vláken)
+    events = _telemetry_events(_printer_ids(ids), rate) if printernest.workers.is_leader else printernest.telemetry_events(_printer_ids(ids), rate)
+    return StreamingResponse(events, media_type="text/event-stream", headers=SSE_HEADERS)
+
+@api.post("/upload/")
+async def upload(request: Request):
+    # Plná fronta = odmítnout hned, ještě než se začne číst tělo požadavku
+    if not printernest.ingest_queue.has_capacity():
+        return JSONResponse({"error": "Server zpracovává příliš mnoho souborů, zkuste to za chvíli"}, 503, {"Retry-After": "10"})
+    # Tělo se čte asynchronně (python-multipart ho ukládá do dočasných souborů), zápis do knihovny běží ve vlákně
+    async with request.form(max_files=printernest.ingest_queue.capacity) as form:
+        uploads = [(file.filename, file.file) for file in form.getlist('file') if getattr(file, "filename", "")]
+        try: jobs = await run_in_threadpool(printernest.save_uploads, form.get('path', ''), uploads)
+        except QueueFull as e: return JSONResponse({"error": str(e)}, 503, {"Retry-After": "10"})
+        except QuotaExceeded as e: return JSONResponse({"error": str(e)}, 413)
+    return {"message": "Soubory nahrány", "jobs": jobs}
+
+@api.post("/api/printers/{pid}/command")
+async def api_printer_command(pid: int, request: Request):
+    if printernest.printer_registry.get(pid) is None: return JSONResponse({"error": "Tiskárna nenalezena"}, 404)
+    data = await _request_data(request)
+    # Čekání na potvrzení tiskárny (až ACK_TIMEOUT s) drží jen vlákno poolu, ne smyčku
+    result = await run_in_threadpool(printernest.run_printer_command, pid, data.get('cmd', ''), data.get('arg'))
+    return JSONResponse(dict(printer_id=pid, **result), 400 if result["result"] == "invalid" else 200)
+
+@api.post("/api/fleet/command")
+async def fleet_command(request: Request, deadline: float = printernest.BATCH_DEADLINE):
+    body, status = await run_in_threadpool(printernest.run_fleet_command, await _request_json(request), deadline)
+    return JSONResponse(body, status)
+
+async def _request_json(request):
+    try: data = await request.json()
+    except ValueError: return {}
+    return data if isinstance(data, dict) else {}
+
+async def _request_data(request):
+    # JSON nebo formulář, stejně jako request.get_json(silent=True) or request.form ve Flasku
+    if request.headers.get("content-type", "").startswith("application/json"): return await _request_json(request)
+    return dict(await request.form())
+
+try: flask_bridge = WSGIMiddleware(printernest.app, workers=WSGI_WORKERS)
+except TypeError: flask_bridge = WSGIMiddleware(printernest.app)
+api.mount("/", flask_bridge)
+
+if __name__ == "__main__":
+    import uvicorn
+    uvicorn.run(api, host="0.0.0.0", port=8000)
@@ -0,0 +1,159 @@
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+import zlib
+from contextlib import contextmanager
+from workers import file_lock
+
+# Nahrávání po částech s možností navázání. Data se zapisují rovnou do cílové složky
+# (do <soubor>.upload_part, na konci jen rename), hash se počítá průběžně při zápisu.
+# Stav relace je v malém JSONu, takže navázat jde i po restartu serveru a části můžou přijít
+# do různých worker procesů (zámky relací jsou i souborové, průběžný hash si proces dopočítá).
+PART_SUFFIX = ".upload_part"
+CHUNK_SIZE = 8 * 1024 * 1024
+WRITE_BLOCK = 256 * 1024
+SESSION_MAX_AGE = 7 * 24 * 3600
+# Zámky relací: pevná sada podle hashe id, ať počet zámků (i zámkových souborů) neroste s každým nahráváním
+LOCK_STRIPES = 64
+
+class OffsetMismatch(Exception):
+    def __init__(self, offset):
+        super().__init__(f"Očekávaný offset {offset}")
+        self.offset = offset
+
+class SessionSuperseded(Exception):
+    pass
+
+class ChunkedUploads:
+    def __init__(self, state_dir):
+        self.state_dir = state_dir
+        os.makedirs(state_dir, exist_ok=True)
+        self._lock = threading.Lock()
+        self._session_locks = [threading.Lock() for _ in range(LOCK_STRIPES)]
+        self._hashers = {}
+
+    def _state_path(self, upload_id):
+        return os.path.join(self.state_dir, f"{upload_id}.json")
+
+    def _save(self, session):
+        tmp_path = self._state_path(session["id"]) + ".tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f: json.dump(session, f)
+        os.replace(tmp_path, self._state_path(session["id"]))
+
+    @contextmanager
+    def _session_lock(self, upload_id):
+        stripe = zlib.crc32(upload_id.encode("utf-8")) % LOCK_STRIPES
+        with self._session_locks[stripe], file_lock(os.path.join(self.state_dir, f"session-{stripe:02d}.lock")): yield
+
+    def get(self, upload_id):
+        if not upload_id.isalnum(): return None
+        try:
+            with open(self._state_path(upload_id), 'r', encoding='utf-8') as f: return json.load(f)
+        except (OSError, json.JSONDecodeError): return None
+
+    def create(self, dest_abs, rel_path, size, fingerprint=""):
+        # Stejný cíl + velikost + otisk od klienta = pokračování přerušeného nahrávání. Jiné rozpracované
+        # nahrávání do stejného cíle (jiná verze souboru) sdílí .upload_part, proto se zneplatní.
+        self.cleanup_stale()
+        with self._lock, file_lock(os.path.join(self.state_dir, "create.lock")):
+            for name in os.listdir(self.state_dir):
+                if not name.endswith(".json"): continue
+                session = self.get(name[:-5])
+                if not session or session["dest"] != dest_abs or session["complete"] or session.get("superseded"): continue
+                if session["size"] == size and session["fingerprint"] == fingerprint: return session
+                self._supersede(session["id"])
+            session = {"id": uuid.uuid4().hex, "dest": dest_abs, "path": rel_path, "size": size, "fingerprint": fingerprint, "offset": 0, "complete": False, "content_hash": None, "created_at": time.time(), "updated_at": time.time()}
+            os.makedirs(os.path.dirname(dest_abs), exist_ok=True)
+            open(dest_abs + PART_SUFFIX, 'wb').close()
+            self._save(session)
+            return session
+
+    def _hasher(self, session):
+        # Po restartu se stav hashe obnoví přečtením už potvrzené části souboru
+        hasher = self._hashers.get(session["id"])
+        if hasher is None or hasher[1] != session["offset"]:
+            digest = hashlib.sha256()
+            with open(session["dest"] + PART_SUFFIX, 'rb') as f:
+                remaining = session["offset"]
+                while remaining > 0:
+                    block = f.read(min(WRITE_BLOCK, remaining))
+                    if not block: break
+                    digest.update(block)
+                    remaining -= len(block)
+            hasher = [digest, session["offset"]]
+            self._hashers[session["id"]] = hasher
+        return hasher
+
+    def _supersede(self, upload_id):
+        # Stav zůstane (do cleanup_stale), aby klient starého nahrávání dostal srozumitelnou chybu místo 404
+        with self._session_lock(upload_id):
+            session = self.get(upload_id)
+            if session is None or session["complete"]: return
+            session["superseded"] = True
+            session["updated_at"] = time.time()
+            self._save(session)
+            self._hashers.pop(upload_id, None)
+
+    def _active(self, upload_id):
+        session = self.get(upload_id)
+        if session is None: raise KeyError(upload_id)
+        if session.get("superseded"): raise SessionSuperseded("Nahrávání bylo nahrazeno novějším nahráváním stejného souboru")
+        return session
+
+    def write(self, upload_id, offset, stream):
+        with self._session_lock(upload_id):
+            session = self._active(upload_id)
+            if session["complete"] or offset != session["offset"]: raise OffsetMismatch(session["offset"])
+            hasher = self._hasher(session)
+            try:
+                with open(session["dest"] + PART_SUFFIX, 'r+b') as f:
+                    f.seek(offset)
+                    f.truncate()
+                    while session["offset"] < session["size"]:
+                        block = stream.read(min(WRITE_BLOCK, session["size"] - session["offset"]))
+                        if not block: break
+                        f.write(block)
+                        hasher[0].update(block)
+                        session["offset"] += len(block)
+                        hasher[1] = session["offset"]
+            finally:
+                # Potvrzeno je vše, co se stihlo zapsat - i když spojení spadlo uprostřed části
+                session["updated_at"] = time.time()
+                self._save(session)
+            return session
+
+    def finalize(self, upload_id):
+        with self._session_lock(upload_id):
+            session = self._active(upload_id)
+            if session["complete"]: return session
+            if session["offset"] != session["size"]: raise OffsetMismatch(session["offset"])
+            session["content_hash"] = self._hasher(session)[0].hexdigest()
+            os.replace(session["dest"] + PART_SUFFIX, session["dest"])
+            session["complete"] = True
+            self._save(session)
+            self._hashers.pop(upload_id, None)
+            return session
+
+    def abort(self, upload_id):
+        with self._session_lock(upload_id):
+            session = self.get(upload_id)
+            if session is None: return False
+            # Část souboru zneplatněné relace už patří novější relaci
+            if not session["complete"] and not session.get("superseded") and os.path.exists(session["dest"] + PART_SUFFIX): os.remove(session["dest"] + PART_SUFFIX)
+            os.remove(self._state_path(upload_id))
+            self._hashers.pop(upload_id, None)
+            return True
+
+    def cleanup_stale(self, max_age=SESSION_MAX_AGE):
+        now = time.time()
+        for name in os.listdir(self.state_dir):
+            if not name.endswith(".json"): continue
+            session = self.get(name[:-5])
+            if session and now - session["updated_at"] > max_age: self.abort(session["id"])
+        # Hash relace, kterou dokončil nebo zrušil jiný proces
+        for upload_id in list(self._hashers):
+            session = self.get(upload_id)
+            if session is None or session["complete"] or session.get("superseded"): self._hashers.pop(upload_id, None)
@@ -0,0 +1,133 @@
+import threading
+import time
+from bisect import bisect_left
+from concurrent.futures import ThreadPoolExecutor, wait
+from payloads import sequence_id_of, next_sequence_id
+
+# Odeslání příkazu a čekání na potvrzení: tiskárna vrací na report topicu stejné sequence_id
+# s "result": "success"/"failed". Bez potvrzení do ACK_TIMEOUT s se bezpečně opakovatelné
+# příkazy pošlou znovu (nejvýš RETRIES krát), ostatní skončí jako timeout.
+ACK_TIMEOUT = 5.0
+RETRIES = 1
+RETRY_DELAY = 0.5
+LATENCY_BUCKETS_MS = (25, 50, 100, 250, 500, 1000, 2500, 5000)
+# Dávka pro víc tiskáren: tiskárny souběžně, příkazy pro jednu tiskárnu po sobě, celé pod jedním limitem
+BATCH_DEADLINE = 15.0
+BATCH_WORKERS = 16
+
+class LatencyHistogram:
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.total_ms = 0.0
+        self.results = {}
+
+    def observe(self, result, latency_ms=None):
+        self.results[result] = self.results.get(result, 0) + 1
+        if latency_ms is None: return
+        self.counts[bisect_left(LATENCY_BUCKETS_MS, latency_ms)] += 1
+        self.total_ms += latency_ms
+
+    def as_dict(self):
+        acked = sum(self.counts)
+        buckets = {f"le_{bound}": count for bound, count in zip(LATENCY_BUCKETS_MS, self.counts)}
+        buckets["inf"] = self.counts[-1]
+        return {"buckets_ms": buckets, "acked": acked, "mean_ms": round(self.total_ms / acked, 1) if acked else None, "results": dict(self.results)}
+
+class PendingCommand:
+    __slots__ = ("printer_id", "done", "result", "reason", "acked_at")
+
+    def __init__(self, printer_id):
+        self.printer_id = printer_id
+        self.done = threading.Event()
+        self.result = self.reason = self.acked_at = None
+
+class CommandDispatcher:
+    def __init__(self, publish, ack_timeout=ACK_TIMEOUT, retries=RETRIES):
+        # publish(printer_id, payload) -> (ok, zpráva), typicky MqttManager.publish
+        self.publish = publish
+        self.ack_timeout = ack_timeout
+        self.retries = retries
+        self._pending = {}
+        self._histograms = {}
+        self._lock = threading.Lock()
+        self._batch_executor = ThreadPoolExecutor(max_workers=BATCH_WORKERS, thread_name_prefix="fleet-command")
+
+    def handle_report(self, printer_id, report):
+        # Volá se pro každou zprávu z report topicu; push_status má vlastní číslování, to se přeskočí
+        for body in report.values():
+            if not isinstance(body, dict) or body.get("command") == "push_status" or "result" not in body: continue
+            with self._lock:
+                pending = self._pending.get(str(body.get("sequence_id")))
+            if pending is None or pending.printer_id != printer_id or pending.done.is_set(): continue
+            pending.result = "success" if str(body["result"]).lower() == "success" else "failed"
+            pending.reason = body.get("reason")
+            pending.acked_at = time.monotonic()
+            pending.done.set()
+
+    def send(self, printer_id, payload, idempotent=False, timeout=None):
+        # Vrací výsledek: {"ok", "result": success/failed/timeout/not_sent, "reason", "latency_ms", "attempts", "sequence_id"}
+        timeout = self.ack_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout * (1 + self.retries)
+        pending = PendingCommand(printer_id)
+        sequence_ids, attempts, ok, reason, latency_ms = [], 0, False, None, None
+        try:
+            while True:
+                attempts += 1
+                if attempts > 1: _set_sequence_id(payload, next_sequence_id())
+                sequence_ids.append(sequence_id_of(payload))
+                with self._lock: self._pending[sequence_ids[-1]] = pending
+                sent_at = time.monotonic()
+                ok, reason = self.publish(printer_id, payload)
+                if ok:
+                    if pending.done.wait(max(0.0, min(timeout, deadline - sent_at))):
+                        latency_ms = (pending.acked_at - sent_at) * 1000
+                        break
+                    # Doručený, ale nepotvrzený příkaz se opakuje jen když je to bezpečné (ne např. pohyb)
+                    if not idempotent: break
+                if attempts > self.retries or time.monotonic() + (0 if ok else RETRY_DELAY) >= deadline: break
+                if not ok: time.sleep(RETRY_DELAY)
+            if pending.done.is_set(): result, reason = pending.result, pending.reason
+            elif ok: result, reason = "timeout", "Tiskárna příkaz nepotvrdila"
+            else: result = "not_sent"
+        finally:
+            with self._lock:
+                for sequence_id in sequence_ids: self._pending.pop(sequence_id, None)
+        with self._lock:
+            self._histograms.setdefault(printer_id, LatencyHistogram()).observe(result, latency_ms)
+        return {"ok": result == "success", "result": result, "reason": reason if result != "success" else None,
+                "latency_ms": round(latency_ms, 1) if latency_ms is not None else None, "attempts": attempts, "sequence_id": sequence_ids[-1]}
+
+    def send_batch(self, jobs, deadline=BATCH_DEADLINE):
+        # jobs: {printer_id: [(payload, idempotent), ...]}; vrací {printer_id: {"ok", "results": [...]}}
+        # Co nestihne limit, je v tabulce jako timeout (odeslání na pozadí doběhne samo).
+        end = time.monotonic() + deadline
+
+        def run(printer_id, commands):
+            results = []
+            for payload, idempotent in commands:
+                remaining = end - time.monotonic()
+                if remaining <= 0:
+                    results.append({"ok": False, "result": "timeout", "reason": "Vypršel časový limit dávky", "latency_ms": None, "attempts": 0, "sequence_id": sequence_id_of(payload)})
+                    continue
+                results.append(self.send(printer_id, payload, idempotent, timeout=min(self.ack_timeout, remaining / (1 + self.retries))))
+            return results
+
+        futures = {self._batch_executor.submit(run, printer_id, commands): printer_id for printer_id, commands in jobs.items()}
+        wait(futures, timeout=max(0.0, end - time.monotonic()) + RETRY_DELAY)
+        table = {}
+        for future, printer_id in futures.items():
+            if future.done() and future.exception() is None: results = future.result()
+            else: results = [{"ok": False, "result": "timeout", "reason": "Vypršel časový limit dávky", "latency_ms": None, "attempts": None, "sequence_id": None}]
+            table[printer_id] = {"ok": all(r["ok"] for r in results), "results": results}
+        return table
+
+    def metrics(self, printer_id=None):
+        with self._lock:
+            if printer_id is not None:
+                histogram = self._histograms.get(printer_id)
+                return histogram.as_dict() if histogram else LatencyHistogram().as_dict()
+            return {pid: histogram.as_dict() for pid, histogram in self._histograms.items()}
+
+def _set_sequence_id(payload, sequence_id):
+    for body in payload.values():
+        if isinstance(body, dict) and "sequence_id" in body: body["sequence_id"] = sequence_id
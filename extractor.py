@@ -0,0 +1,95 @@
+import os
+import re
+import zipfile
+import xml.etree.ElementTree as ET
+from gcode_header import parse_zip_gcode_header
+from thumbnails import save_plate_thumbnail, plate_file_name
+
+# Verze záznamu - při změně struktury zvýšit, aby se staré cache přepočítaly
+EXTRACTOR_VERSION = 3
+
+PRINTER_MODEL_MAP = {"C11": "P1S", "C12": "P1S Combo", "C13": "A1", "C14": "A1 Combo", "N2S": "A1"}
+THUMBNAIL_EXTS = ('.png', '.jpg', '.jpeg')
+
+def plate_number(name, default=0):
+    match = re.search(r'plate_(\d+)', name)
+    return int(match.group(1)) if match else default
+
+def _metadata_values(node):
+    # Jeden průchod přímými potomky <metadata> místo opakovaného find() na každý klíč;
+    # jako find() platí první výskyt klíče, vnořená metadata (např. model_instance) se nečtou
+    values = {}
+    for meta in node.findall("metadata"):
+        key = meta.attrib.get("key")
+        if key: values.setdefault(key, meta.attrib.get("value"))
+    return values
+
+def _parse_slice_info(xml_text):
+    info = {"printer_model": None, "filaments": {}, "plates": {}}
+    root = ET.fromstring(xml_text)
+    for meta in root.iter("metadata"):
+        if meta.attrib.get("key", "").lower() == "printer_model_id":
+            info["printer_model"] = PRINTER_MODEL_MAP.get(meta.attrib.get("value"), meta.attrib.get("value"))
+    for filament_node in root.iter("filament"):
+        info["filaments"][filament_node.attrib.get("id")] = {"type": filament_node.attrib.get("type"), "color": filament_node.attrib.get("color", "AAAAAA").lstrip("#")[:6]}
+    for plate_node in root.findall("plate"):
+        values = _metadata_values(plate_node)
+        idx = values.get("index")
+        if idx:
+            filament_node = plate_node.find("filament")
+            info["plates"][idx] = {"prediction": values.get("prediction"), "weight": values.get("weight"), "filament_id": filament_node.attrib.get("id") if filament_node is not None else None}
+    return info
+
+def _parse_model_settings(xml_text):
+    settings = {"printer_model": None, "plate_names": {}}
+    match = re.search(r'printer_model\s*=\s*"([^"]+)"', xml_text)
+    if match: settings["printer_model"] = match.group(1)
+    root = ET.fromstring(xml_text)
+    for plate_node in root.findall("plate"):
+        values = _metadata_values(plate_node)
+        if values.get("plater_id") and values.get("plater_name") is not None:
+            settings["plate_names"][values["plater_id"]] = values["plater_name"]
+    return settings
+
+def empty_record():
+    return {"version": EXTRACTOR_VERSION, "is_3mf": False, "thumbnails": [], "slice_info": None, "model_settings": None, "gcode_plates": [], "error": None}
+
+def extract_3mf(abs_path, thumbnails_dir=None):
+    # Jediný průchod archivem: náhledy, slice_info, model_settings a hlavičky všech plátů.
+    # Když je zadán thumbnails_dir (složka náhledů tohoto souboru), náhledy se rovnou zapíší jako plate_<n>.png (+ zmenšené varianty).
+    record = empty_record()
+    if not abs_path.lower().endswith('.3mf'): return record
+    record["is_3mf"] = True
+    try:
+        with zipfile.ZipFile(abs_path, 'r') as zf:
+            names = zf.namelist()
+            plate_images, gcode_members = [], []
+            for name in names:
+                lower = name.lower()
+                if not name.startswith('Metadata/plate_'): continue
+                if lower.endswith(THUMBNAIL_EXTS) and 'small' not in name and 'no_light' not in name: plate_images.append(name)
+                elif lower.endswith('.gcode'): gcode_members.append(name)
+            plate_images.sort(key=plate_number)
+            gcode_members.sort(key=plate_number)
+            if not plate_images and 'Metadata/thumbnail.png' in names: plate_images.append('Metadata/thumbnail.png')
+
+            for i, member in enumerate(plate_images):
+                plate_index = str(plate_number(member, i + 1))
+                record["thumbnails"].append({"plate": plate_index, "member": member})
+                if thumbnails_dir:
+                    try: save_plate_thumbnail(os.path.join(thumbnails_dir, plate_file_name(plate_index)), zf.read(member))
+                    except OSError as e: print(f"Chyba při generování miniatury pro {abs_path}: {e}")
+
+            if "Metadata/slice_info.config" in names:
+                try: record["slice_info"] = _parse_slice_info(zf.read("Metadata/slice_info.config").decode('utf-8', 'ignore'))
+                except Exception as e: print(f"Chyba při parsování slice_info.config: {e}")
+            if "Metadata/model_settings.config" in names:
+                try: record["model_settings"] = _parse_model_settings(zf.read("Metadata/model_settings.config").decode('utf-8', 'ignore'))
+                except Exception as e: print(f"Chyba při parsování model_settings.config: {e}")
+
+            for member in gcode_members:
+                record["gcode_plates"].append({"member": member, "plate": str(plate_number(member)), "params": parse_zip_gcode_header(zf, member)})
+    except Exception as e:
+        print(f"Chyba při čtení archivu {abs_path}: {e}")
+        record["error"] = str(e)
+    return record
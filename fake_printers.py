@@ -0,0 +1,336 @@
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import ssl
+import struct
+import subprocess
+import time
+from telemetry import merge_delta
+
+# Simulátor tiskáren pro zátěžové testy bez hardwaru: každá falešná tiskárna je malý MQTT 3.1.1
+# broker s TLS na vlastní adrese 127.0.1.N:8883 (jako skutečná tiskárna v LAN). Přehrává reporty
+# ve formátu light_capture.log a potvrzuje příkazy (ledctrl, gcode_line, ...) se stejným sequence_id.
+#   python fake_printers.py --count 50 --rate 2 --printers-json /tmp/printers_sim.json
+#   PRINTERNEST_PRINTERS=/tmp/printers_sim.json python app.py
+DEFAULT_LOG = os.path.join(os.path.dirname(os.path.abspath(__file__)), "light_capture.log")
+CERT_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".fake_printers")
+MQTT_PORT = 8883
+FTP_PORT = 990
+# Simulátor běží bez práv roota, port 990 by nešel otevřít
+SIM_FTP_PORT = 9990
+FTP_DATA_TIMEOUT = 30
+ACCESS_CODE = "12345678"
+LOG_LINE = re.compile(r"^\[[^\]]*\] (\S+): (.*)$")
+
+CONNECT, CONNACK, PUBLISH, PUBACK, SUBSCRIBE, SUBACK, UNSUBSCRIBE, UNSUBACK, PINGREQ, PINGRESP, DISCONNECT = 1, 2, 3, 4, 8, 9, 10, 11, 12, 13, 14
+
+def load_reports(path):
+    # Jen zprávy z report topicu; sequence_id se při přehrávání přepisuje
+    reports = []
+    with open(path, encoding="utf-8", errors="replace") as f:
+        for line in f:
+            match = LOG_LINE.match(line.strip())
+            if not match or not match.group(1).endswith("/report"): continue
+            try: report = json.loads(match.group(2))
+            except ValueError: continue
+            if isinstance(report.get("print"), dict) and report["print"].get("command") == "push_status": reports.append(report)
+    return reports
+
+def ensure_certificate(cert_dir=CERT_DIR):
+    cert_path, key_path = os.path.join(cert_dir, "cert.pem"), os.path.join(cert_dir, "key.pem")
+    if not (os.path.exists(cert_path) and os.path.exists(key_path)):
+        os.makedirs(cert_dir, exist_ok=True)
+        subprocess.run(["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-days", "3650", "-subj", "/CN=fake-printer",
+                        "-keyout", key_path, "-out", cert_path], check=True, capture_output=True)
+    return cert_path, key_path
+
+# --- MQTT 3.1.1: jen to, co používá paho klient aplikace ---
+def _encode_length(length):
+    out = bytearray()
+    while True:
+        length, digit = length // 128, length % 128
+        out.append(digit | (0x80 if length else 0))
+        if not length: return bytes(out)
+
+def _string(value):
+    data = value.encode("utf-8") if isinstance(value, str) else value
+    return struct.pack("!H", len(data)) + data
+
+def packet(packet_type, flags, body):
+    return bytes([(packet_type << 4) | flags]) + _encode_length(len(body)) + body
+
+async def read_packet(reader):
+    header = await reader.readexactly(1)
+    length, multiplier = 0, 1
+    while True:
+        digit = (await reader.readexactly(1))[0]
+        length += (digit & 0x7F) * multiplier
+        if not digit & 0x80: break
+        multiplier *= 128
+    return header[0] >> 4, header[0] & 0x0F, await reader.readexactly(length)
+
+def _read_string(body, offset):
+    length = struct.unpack_from("!H", body, offset)[0]
+    return body[offset + 2:offset + 2 + length], offset + 2 + length
+
+def topic_matches(pattern, topic):
+    pattern_parts, topic_parts = pattern.split("/"), topic.split("/")
+    for i, part in enumerate(pattern_parts):
+        if part == "#": return True
+        if i >= len(topic_parts) or (part != "+" and part != topic_parts[i]): return False
+    return len(pattern_parts) == len(topic_parts)
+
+class FakePrinter:
+    def __init__(self, index, host, reports, rate, access_code=ACCESS_CODE, ack_delay=0.0, fail_rate=0.0):
+        self.index, self.host = index, host
+        self.serial = f"SIM{index:012d}"
+        self.access_code = access_code
+        self.reports, self.rate = reports, rate
+        self.ack_delay, self.fail_rate = ack_delay, fail_rate
+        self.state = {}
+        self.sessions = {}
+        self.sequence = itertools.count(1)
+        self.stats = {"connections": 0, "reports": 0, "requests": 0, "acks": 0, "uploads": 0}
+        self.files = {}
+        self.sdcard = None
+        self.report_topic, self.request_topic = f"device/{self.serial}/report", f"device/{self.serial}/request"
+        for report in reports: merge_delta(self.state, _status_fields(report))
+
+    def printer_entry(self, ftp_port=FTP_PORT):
+        entry = {"id": self.index, "name": f"Simulátor {self.index}", "ip": self.host, "access_code": self.access_code, "serial": self.serial, "img": "default.png", "model": "SIM"}
+        # Nestandardní port FTPS (bez práv roota) si přečte print_transfer.py
+        if ftp_port and ftp_port != FTP_PORT: entry["ftp_port"] = ftp_port
+        return entry
+
+    async def serve(self, ssl_context, port=MQTT_PORT):
+        return await asyncio.start_server(self._session, self.host, port, ssl=ssl_context)
+
+    async def _session(self, reader, writer):
+        session = {"writer": writer, "subscriptions": []}
+        try:
+            packet_type, _, body = await read_packet(reader)
+            if packet_type != CONNECT: return
+            if not self._authorized(body):
+                writer.write(packet(CONNACK, 0, b"\x00\x05"))
+                await writer.drain()
+                return
+            writer.write(packet(CONNACK, 0, b"\x00\x00"))
+            self.sessions[id(session)] = session
+            self.stats["connections"] += 1
+            while True:
+                packet_type, flags, body = await read_packet(reader)
+                if packet_type == PUBLISH: await self._on_publish(session, flags, body)
+                elif packet_type == SUBSCRIBE:
+                    packet_id, offset, granted = body[:2], 2, b""
+                    while offset < len(body):
+                        topic, offset = _read_string(body, offset)
+                        session["subscriptions"].append(topic.decode())
+                        granted += b"\x00"
+                        offset += 1
+                    writer.write(packet(SUBACK, 0, packet_id + granted))
+                elif packet_type == UNSUBSCRIBE:
+                    writer.write(packet(UNSUBACK, 0, body[:2]))
+                elif packet_type == PINGREQ: writer.write(packet(PINGRESP, 0, b""))
+                elif packet_type == DISCONNECT: return
+                await writer.drain()
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            self.sessions.pop(id(session), None)
+            writer.close()
+
+    def _authorized(self, body):
+        _, offset = _read_string(body, 0)
+        flags = body[offset + 1]
+        offset += 4
+        _, offset = _read_string(body, offset)
+        if flags & 0x04:
+            _, offset = _read_string(body, offset)
+            _, offset = _read_string(body, offset)
+        username = password = b""
+        if flags & 0x80: username, offset = _read_string(body, offset)
+        if flags & 0x40: password, offset = _read_string(body, offset)
+        return username == b"bblp" and password.decode(errors="replace") == self.access_code
+
+    async def _on_publish(self, session, flags, body):
+        qos = (flags >> 1) & 0x03
+        topic, offset = _read_string(body, 0)
+        if qos:
+            session["writer"].write(packet(PUBACK, 0, body[offset:offset + 2]))
+            offset += 2
+        if topic.decode() != self.request_topic: return
+        self.stats["requests"] += 1
+        try: request = json.loads(body[offset:])
+        except ValueError: return
+        asyncio.ensure_future(self._answer(request))
+
+    async def _answer(self, request):
+        # Potvrzení příkazu jako skutečná tiskárna: stejné tělo + result (a u ledctrl i změna stavu)
+        if "pushing" in request:
+            self.publish_report({"print": dict(self.state, command="push_status", msg=0, sequence_id=str(next(self.sequence)))})
+            return
+        for key in ("print", "system"):
+            body = request.get(key)
+            if not isinstance(body, dict) or "sequence_id" not in body: continue
+            if self.ack_delay: await asyncio.sleep(self.ack_delay * random.uniform(0.5, 1.5))
+            reason = "simulated" if random.random() < self.fail_rate else self._reject_reason(body)
+            failed = reason is not None
+            self.publish_report({key: dict(body, result="failed" if failed else "success", reason=reason or "")})
+            self.stats["acks"] += 1
+            if not failed: self._apply_command(body)
+
+    def _reject_reason(self, body):
+        if body.get("command") == "gcode_file" and body.get("param", "").rsplit("/", 1)[-1] not in self.files: return "file not found"
+        return None
+
+    def _apply_command(self, body):
+        delta = {}
+        if body.get("command") == "ledctrl": delta["lights_report"] = [{"node": body.get("led_node"), "mode": body.get("led_mode")}]
+        elif body.get("command") == "gcode_line":
+            match = re.match(r"M1(40|04) S(\d+)", body.get("param", ""))
+            if match: delta["bed_target_temper" if match.group(1) == "40" else "nozzle_target_temper"] = int(match.group(2))
+        elif body.get("command") == "gcode_file":
+            name = body["param"].rsplit("/", 1)[-1]
+            delta = {"gcode_state": "RUNNING", "gcode_file": name, "subtask_name": name, "mc_percent": 0, "print_type": "local"}
+        if delta:
+            merge_delta(self.state, delta)
+            self.publish_report({"print": dict(delta, command="push_status", msg=1, sequence_id=str(next(self.sequence)))})
+
+    def publish_report(self, report):
+        data = packet(PUBLISH, 0, _string(self.report_topic) + json.dumps(report, separators=(",", ":")).encode())
+        for session in list(self.sessions.values()):
+            if any(topic_matches(pattern, self.report_topic) for pattern in session["subscriptions"]):
+                session["writer"].write(data)
+                self.stats["reports"] += 1
+
+    # --- FTPS (implicitní TLS, port 990) pro nahrání tiskových souborů: jen příkazy, které posílá ftplib ---
+    async def serve_ftp(self, ssl_context, port=FTP_PORT):
+        return await asyncio.start_server(lambda r, w: self._ftp_session(r, w, ssl_context), self.host, port, ssl=ssl_context)
+
+    async def _ftp_session(self, reader, writer, ssl_context):
+        def reply(line): writer.write((line + "\r\n").encode())
+        user, logged_in, data_connection, data_server = None, False, None, None
+        reply("220 Fake printer FTPS ready")
+        try:
+            while True:
+                await writer.drain()
+                line = (await reader.readline()).decode(errors="replace").strip()
+                if not line: return
+                command, _, arg = line.partition(" ")
+                command = command.upper()
+                if command == "USER": user = arg; reply("331 Password required")
+                elif command == "PASS":
+                    logged_in = user == "bblp" and arg == self.access_code
+                    reply("230 Logged in" if logged_in else "530 Login incorrect")
+                elif not logged_in: reply("530 Please login")
+                elif command in ("PBSZ", "PROT", "TYPE", "NOOP", "OPTS"): reply("200 Ok")
+                elif command == "PWD": reply('257 "/"')
+                elif command == "CWD": reply("250 Ok")
+                elif command == "SIZE": reply(f"213 {self.files[arg]}" if arg in self.files else "550 Not found")
+                elif command == "PASV":
+                    data_connection = asyncio.get_running_loop().create_future()
+                    def accept(data_reader, data_writer, future=data_connection):
+                        if not future.done(): future.set_result((data_reader, data_writer))
+                    data_server = await asyncio.start_server(accept, self.host, 0, ssl=ssl_context)
+                    port = data_server.sockets[0].getsockname()[1]
+                    reply(f"227 Entering Passive Mode ({self.host.replace('.', ',')},{port >> 8},{port & 0xFF})")
+                elif command == "STOR" and data_connection is not None:
+                    reply("150 Ok to send data")
+                    await writer.drain()
+                    size = await self._receive_file(arg, data_connection)
+                    data_server.close()
+                    data_connection = data_server = None
+                    reply("226 Transfer complete" if size is not None else "426 Transfer aborted")
+                elif command == "QUIT":
+                    reply("221 Bye")
+                    await writer.drain()
+                    return
+                else: reply("502 Command not implemented")
+        except (asyncio.IncompleteReadError, ConnectionError, ssl.SSLError):
+            pass
+        finally:
+            if data_server is not None: data_server.close()
+            writer.close()
+
+    async def _receive_file(self, name, data_connection):
+        # Obsah se jen spočítá, případně uloží do --sdcard/<serial>/
+        try: data_reader, data_writer = await asyncio.wait_for(data_connection, FTP_DATA_TIMEOUT)
+        except asyncio.TimeoutError: return None
+        size, target = 0, None
+        if self.sdcard:
+            os.makedirs(os.path.join(self.sdcard, self.serial), exist_ok=True)
+            target = open(os.path.join(self.sdcard, self.serial, os.path.basename(name)), "wb")
+        try:
+            while True:
+                try: chunk = await data_reader.read(256 * 1024)
+                except (ConnectionError, ssl.SSLError): break  # klient zavírá bez TLS close_notify (jako Bambu Studio)
+                if not chunk: break
+                size += len(chunk)
+                if target: target.write(chunk)
+        finally:
+            if target: target.close()
+            data_writer.close()
+        self.files[name] = size
+        self.stats["uploads"] += 1
+        return size
+
+    async def replay(self):
+        # Přehrává zachycené delty dokola rychlostí `rate` zpráv/s (s náhodným rozptylem)
+        if not self.reports or self.rate <= 0: return
+        await asyncio.sleep(random.uniform(0, 1 / self.rate))
+        for report in itertools.cycle(self.reports):
+            delta = _status_fields(report)
+            if "bed_temper" in delta: delta["bed_temper"] = round(delta["bed_temper"] + random.uniform(-0.5, 0.5), 3)
+            merge_delta(self.state, delta)
+            self.publish_report({"print": dict(delta, command="push_status", msg=1, sequence_id=str(next(self.sequence)))})
+            await asyncio.sleep(random.expovariate(self.rate))
+
+def _status_fields(report):
+    return {key: value for key, value in report["print"].items() if key not in ("command", "msg", "sequence_id")}
+
+def host_for(index, network="127.0.1."):
+    return f"{network}{index}"
+
+async def run(args):
+    cert_path, key_path = ensure_certificate()
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    reports = load_reports(args.log)
+    printers = [FakePrinter(i, host_for(i, args.network), reports, args.rate, ack_delay=args.ack_delay / 1000, fail_rate=args.fail_rate) for i in range(1, args.count + 1)]
+    for printer in printers: printer.sdcard = args.sdcard
+    servers = [await printer.serve(context, args.port) for printer in printers]
+    if args.ftp_port: servers += [await printer.serve_ftp(context, args.ftp_port) for printer in printers]
+    if args.printers_json:
+        with open(args.printers_json, "w", encoding="utf-8") as f: json.dump([p.printer_entry(args.ftp_port) for p in printers], f, indent=2, ensure_ascii=False)
+    print(f"Simulátor: {len(printers)} tiskáren na {printers[0].host}..{printers[-1].host}:{args.port}, {len(reports)} vzorových reportů, {args.rate} zpráv/s na tiskárnu")
+    tasks = [asyncio.ensure_future(printer.replay()) for printer in printers]
+    try:
+        while True:
+            await asyncio.sleep(args.stats_interval)
+            totals = {key: sum(p.stats[key] for p in printers) for key in printers[0].stats}
+            print(f"[{time.strftime('%H:%M:%S')}] spojení {sum(len(p.sessions) for p in printers)}, celkem {totals}")
+    finally:
+        for task in tasks: task.cancel()
+        for server in servers: server.close()
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulátor tiskáren Bambu (MQTT přes TLS) pro zátěžové testy")
+    parser.add_argument("--count", type=int, default=10, help="počet tiskáren")
+    parser.add_argument("--rate", type=float, default=1.0, help="reportů za sekundu na tiskárnu")
+    parser.add_argument("--log", default=DEFAULT_LOG, help="zdroj reportů ve formátu light_capture.log")
+    parser.add_argument("--network", default="127.0.1.", help="prefix adres tiskáren (127.0.1.N)")
+    parser.add_argument("--port", type=int, default=MQTT_PORT)
+    parser.add_argument("--ftp-port", type=int, default=SIM_FTP_PORT, help=f"port FTPS pro nahrávání tiskových souborů (0 = vypnout, skutečná tiskárna {FTP_PORT} vyžaduje roota)")
+    parser.add_argument("--sdcard", help="ukládat nahrané soubory do tohoto adresáře (jinak se jen spočítají)")
+    parser.add_argument("--ack-delay", type=float, default=20, help="průměrné zpoždění potvrzení v ms")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="podíl příkazů potvrzených jako failed")
+    parser.add_argument("--printers-json", help="zapsat seznam tiskáren ve formátu printers.json")
+    parser.add_argument("--stats-interval", type=float, default=10)
+    asyncio.run(run(parser.parse_args()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,99 @@
+import atexit
+import multiprocessing
+import os
+import queue
+import threading
+import time
+from collections import deque
+from extractor import extract_3mf, empty_record
+from metadata_index import file_sha256
+
+# Studená složka se čte paralelně v procesech (zip + XML + hlavička G-kódu jsou CPU náročné).
+# Jeden poškozený archiv nesmí zastavit výpis - po SCAN_TIMEOUT s se vzdáme a pool restartujeme.
+# Pool je jeden na proces a žije dál: spawn potomek stojí start interpretu a import, to se platí jen jednou.
+SCAN_TIMEOUT = 120
+PARALLEL_THRESHOLD = 4
+POOL_SIZE = os.cpu_count() or 1
+POOL_CHECK_INTERVAL = 1.0
+_pool = None
+_pool_lock = threading.Lock()
+
+def _scan_file(abs_path):
+    file_stat = os.stat(abs_path)
+    return {"abs_path": abs_path, "record": extract_3mf(abs_path), "content_hash": file_sha256(abs_path), "mtime": file_stat.st_mtime, "size": file_stat.st_size, "error": None}
+
+def _failed_result(abs_path, error):
+    record = empty_record()
+    record["is_3mf"] = abs_path.lower().endswith('.3mf')
+    record["error"] = error
+    return {"abs_path": abs_path, "record": record, "content_hash": None, "mtime": None, "size": None, "error": error}
+
+def scan_files(abs_paths, workers=None, timeout=SCAN_TIMEOUT):
+    # Generátor výsledků v pořadí dokončení. Malé dávky se zpracují rovnou v tomto vlákně.
+    abs_paths = list(abs_paths)
+    if len(abs_paths) < PARALLEL_THRESHOLD:
+        for abs_path in abs_paths:
+            try: yield _scan_file(abs_path)
+            except Exception as e: yield _failed_result(abs_path, str(e))
+        return
+    workers = max(1, min(workers or POOL_SIZE, POOL_SIZE, len(abs_paths)))
+    yield from _scan_parallel(abs_paths, workers, timeout)
+
+def _get_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is None: _pool = multiprocessing.get_context("spawn").Pool(POOL_SIZE)
+        return _pool
+
+def _replace_pool(stuck):
+    # Zaseknutý proces nejde zrušit samostatně - ukončí se celý pool a příští výpis založí nový
+    global _pool
+    with _pool_lock:
+        if _pool is not stuck: return
+        _pool = None
+    stuck.terminate()
+
+def shutdown():
+    global _pool
+    with _pool_lock: pool, _pool = _pool, None
+    if pool is not None: pool.terminate()
+
+atexit.register(shutdown)
+
+def _scan_parallel(abs_paths, workers, timeout):
+    done_queue = queue.Queue()
+    pending, in_flight = deque(abs_paths), {}
+    pool = None
+    while pending or in_flight:
+        current = _get_pool()
+        if current is not pool:
+            # Pool mezitím kvůli timeoutu vyměnil jiný výpis - rozpracované soubory se pošlou znovu
+            pool = current
+            pending.extendleft(reversed(list(in_flight)))
+            in_flight.clear()
+        try:
+            # Posíláme jen tolik úloh, kolik je procesů, takže čas odeslání ~ začátek zpracování
+            while pending and len(in_flight) < workers:
+                abs_path = pending[0]
+                pool.apply_async(_scan_file, (abs_path,),
+                                 callback=lambda result, owner=pool, p=abs_path: done_queue.put((owner, p, result, None)),
+                                 error_callback=lambda exc, owner=pool, p=abs_path: done_queue.put((owner, p, None, exc)))
+                in_flight[pending.popleft()] = time.monotonic()
+        except ValueError:
+            continue  # pool byl právě ukončen jiným výpisem
+        wait = max(0.0, min(started + timeout for started in in_flight.values()) - time.monotonic())
+        try:
+            owner, abs_path, result, exc = done_queue.get(timeout=min(wait, POOL_CHECK_INTERVAL))
+            if owner is pool and in_flight.pop(abs_path, None) is not None:
+                yield result if exc is None else _failed_result(abs_path, str(exc))
+            continue
+        except queue.Empty:
+            pass
+        now = time.monotonic()
+        timed_out = [p for p, started in in_flight.items() if now - started >= timeout]
+        if not timed_out: continue
+        for abs_path in timed_out:
+            del in_flight[abs_path]
+            print(f"Časový limit při čtení metadat pro {abs_path}")
+            yield _failed_result(abs_path, "Časový limit při čtení archivu")
+        _replace_pool(pool)
@@ -0,0 +1,69 @@
+import io
+
+# Bambu/Orca G-kód má na začátku blok hlavičky a blok konfigurace, zbytek jsou
+# samotné pohyby. Čteme proto jen po kouscích a skončíme hned, jak bloky skončí.
+HEADER_END_MARKERS = ("CONFIG_BLOCK_END", "EXECUTABLE_BLOCK_START")
+CHUNK_SIZE = 64 * 1024
+MAX_LINES = 2000
+MAX_LINE_LENGTH = 64 * 1024
+
+def _parse_header_line(line, params):
+    if not line.startswith(';'): return
+    if "=" in line:
+        parts = line.lstrip('; ').split('=', 1)
+        if len(parts) == 2: params[parts[0].strip()] = parts[1].strip().strip('"')
+    elif ":" in line:
+        parts = line.lstrip('; ').split(':', 1)
+        if len(parts) == 2: params[parts[0].strip()] = parts[1].strip()
+
+def iter_header_lines(stream, max_lines=MAX_LINES, chunk_size=CHUNK_SIZE):
+    # Vrací řádky hlavičky jako text; paměť je omezená velikostí jednoho kousku.
+    pending = b""
+    line_count = 0
+    in_header = False
+    skipping = False
+    while line_count < max_lines:
+        chunk = stream.read(chunk_size)
+        if not chunk: break
+        if isinstance(chunk, str): chunk = chunk.encode('utf-8')
+        pending += chunk
+        if skipping:
+            # Zbytek příliš dlouhého řádku zahodíme až po jeho konec
+            newline = pending.find(b"\n")
+            if newline < 0:
+                pending = b""
+                continue
+            pending = pending[newline + 1:]
+            skipping = False
+        *lines, pending = pending.split(b"\n")
+        if len(pending) > MAX_LINE_LENGTH: pending, skipping = b"", True
+        for raw in lines:
+            line = raw.decode('utf-8', 'ignore').strip()
+            line_count += 1
+            if line and not line.startswith(';') and in_header: return
+            if line.startswith(';'):
+                in_header = True
+                if any(marker in line for marker in HEADER_END_MARKERS): return
+                yield line
+            if line_count >= max_lines: return
+    if pending and line_count < max_lines:
+        line = pending.decode('utf-8', 'ignore').strip()
+        if line.startswith(';') and not any(marker in line for marker in HEADER_END_MARKERS): yield line
+
+def parse_gcode_header_params(gcode_stream, max_lines=MAX_LINES):
+    params = {}
+    try:
+        if isinstance(gcode_stream, (bytes, str)): gcode_stream = io.BytesIO(gcode_stream if isinstance(gcode_stream, bytes) else gcode_stream.encode('utf-8'))
+        for line in iter_header_lines(gcode_stream, max_lines=max_lines):
+            _parse_header_line(line, params)
+    except Exception as e: print(f"Chyba při parsování G-kódu: {e}")
+    return params
+
+def parse_zip_gcode_header(zf, gcode_name, max_lines=MAX_LINES):
+    # zf.open() dekomprimuje průběžně, takže se nikdy nerozbalí celý plát.
+    try:
+        with zf.open(gcode_name) as gcode_stream:
+            return parse_gcode_header_params(gcode_stream, max_lines=max_lines)
+    except (KeyError, OSError) as e:
+        print(f"Chyba při čtení G-kódu {gcode_name}: {e}")
+        return {}
@@ -0,0 +1,17 @@
+import os
+
+# gunicorn -w 4 app:app  (tento soubor načte gunicorn sám z aktuální složky, viz workers.py)
+bind = "0.0.0.0:8000"
+# Long-poll a SSE drží vlákno po dobu spojení
+worker_class = "gthread"
+threads = 16
+
+def on_starting(server):
+    # Aplikace se musí importovat až ve workeru: spojení se SQLite, vlákna fronty a zámek vedoucího nepřežijí fork
+    if server.cfg.preload_app: raise RuntimeError("Printernest nepodporuje --preload")
+    # Workery podle toho zapnou sdílený režim (printers.json pod zámkem apod.)
+    os.environ["WEB_CONCURRENCY"] = str(server.cfg.workers)
+
+def post_worker_init(worker):
+    import app
+    app.start_background_services()
@@ -0,0 +1,144 @@
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from workers import file_lock
+
+# Zpracování nahraných souborů (náhledy + metadata) mimo HTTP request.
+# Kapacita je omezená: když je fronta plná, upload se odmítne dřív, než se soubory uloží.
+# Soubor zpracuje proces, který ho přijal; stav úloh je v malé SQLite databázi sdílené všemi
+# worker procesy, takže dotaz na průběh může přijít do kteréhokoli z nich.
+INGEST_WORKERS = 2
+INGEST_CAPACITY = 64
+FINISHED_JOBS_KEPT = 1000
+# Jak často long-poll kontroluje změny z jiných procesů (změny ve vlastním procesu ho probudí hned)
+JOB_POLL_INTERVAL = 0.5
+ACTIVE_STATUSES = ("queued", "running")
+JOB_FIELDS = ("id", "path", "status", "error", "queued_at", "started_at", "finished_at")
+
+JOBS_SCHEMA = """
+CREATE TABLE IF NOT EXISTS ingest_jobs (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    path TEXT NOT NULL,
+    status TEXT NOT NULL,
+    error TEXT,
+    pid INTEGER NOT NULL,
+    queued_at REAL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_ingest_jobs_active ON ingest_jobs(path) WHERE status IN ('queued', 'running');
+"""
+
+class QueueFull(Exception):
+    pass
+
+class IngestQueue:
+    def __init__(self, handler, db_path, workers=INGEST_WORKERS, capacity=INGEST_CAPACITY):
+        self.handler = handler
+        self.db_path = db_path
+        self.capacity = capacity
+        self._slots = threading.BoundedSemaphore(capacity)
+        self._queue = queue.Queue()
+        self._local = threading.local()
+        self._changed = threading.Condition()
+        with file_lock(f"{db_path}.lock"), self._conn() as conn: conn.executescript(JOBS_SCHEMA)
+        self._workers = [threading.Thread(target=self._worker, name=f"ingest-{i}", daemon=True) for i in range(workers)]
+        for worker in self._workers: worker.start()
+
+    def reserve(self, count):
+        # Zarezervuje místa pro celou dávku najednou, nebo žádné
+        taken = 0
+        while taken < count and self._slots.acquire(blocking=False): taken += 1
+        if taken < count:
+            for _ in range(taken): self._slots.release()
+            raise QueueFull(f"Fronta zpracování je plná ({self.capacity} souborů)")
+        return count
+
+    def release(self, count):
+        for _ in range(count): self._slots.release()
+
+    def submit(self, abs_path, rel_path, **handler_kwargs):
+        # Volat jen s místem získaným přes reserve()
+        job = {"id": uuid.uuid4().hex, "path": rel_path, "status": "queued", "error": None, "queued_at": time.time(), "started_at": None, "finished_at": None}
+        with self._conn() as conn:
+            conn.execute("INSERT INTO ingest_jobs (id, path, status, pid, queued_at) VALUES (?, ?, ?, ?, ?)", (job["id"], rel_path, "queued", os.getpid(), job["queued_at"]))
+            # Hotových úloh se drží posledních FINISHED_JOBS_KEPT
+            conn.execute("DELETE FROM ingest_jobs WHERE status IN ('done', 'error') AND seq < (SELECT seq FROM ingest_jobs WHERE status IN ('done', 'error') ORDER BY seq DESC LIMIT 1 OFFSET ?)",
+                         (FINISHED_JOBS_KEPT - 1,))
+        self._queue.put((job["id"], abs_path, handler_kwargs))
+        return dict(job)
+
+    def has_capacity(self):
+        if not self._slots.acquire(blocking=False): return False
+        self._slots.release()
+        return True
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _reap(self, conn):
+        # Úlohy procesu, který mezitím skončil (pád, restart workeru), by jinak zůstaly navždy rozpracované
+        pids = [row[0] for row in conn.execute("SELECT DISTINCT pid FROM ingest_jobs WHERE status IN ('queued', 'running') AND pid != ?", (os.getpid(),))]
+        dead = [pid for pid in pids if not _process_alive(pid)]
+        if not dead: return
+        with conn:
+            conn.executemany("UPDATE ingest_jobs SET status = 'error', error = 'Zpracování přerušeno, proces skončil', finished_at = ? WHERE pid = ? AND status IN ('queued', 'running')",
+                             [(time.time(), pid) for pid in dead])
+
+    def is_active(self, rel_path):
+        conn = self._conn()
+        self._reap(conn)
+        return conn.execute("SELECT 1 FROM ingest_jobs WHERE path = ? AND status IN ('queued', 'running') LIMIT 1", (rel_path,)).fetchone() is not None
+
+    def get(self, job_ids):
+        if not job_ids: return []
+        conn = self._conn()
+        self._reap(conn)
+        rows = {row["id"]: row for row in conn.execute(f"SELECT * FROM ingest_jobs WHERE id IN ({', '.join('?' * len(job_ids))})", list(job_ids))}
+        return [{key: rows[job_id][key] for key in JOB_FIELDS} for job_id in job_ids if job_id in rows]
+
+    def wait_for_change(self, job_ids, timeout):
+        # Long-poll: vrátí se, jakmile jsou všechny sledované úlohy hotové, nebo po timeoutu
+        deadline = time.monotonic() + timeout
+        while True:
+            jobs = self.get(job_ids)
+            remaining = deadline - time.monotonic()
+            if remaining <= 0 or not any(job["status"] in ACTIVE_STATUSES for job in jobs): return jobs
+            with self._changed: self._changed.wait(min(remaining, JOB_POLL_INTERVAL))
+
+    def _set(self, job_id, **fields):
+        with self._conn() as conn: conn.execute(f"UPDATE ingest_jobs SET {', '.join(f'{key} = ?' for key in fields)} WHERE id = ?", (*fields.values(), job_id))
+        with self._changed: self._changed.notify_all()
+
+    def _worker(self):
+        while True:
+            job_id, abs_path, handler_kwargs = self._queue.get()
+            self._set(job_id, status="running", started_at=time.time())
+            try:
+                self.handler(abs_path, **handler_kwargs)
+                self._set(job_id, status="done", finished_at=time.time())
+            except Exception as e:
+                print(f"Chyba při zpracování nahraného souboru {abs_path}: {e}")
+                self._set(job_id, status="error", error=str(e), finished_at=time.time())
+            finally:
+                self._slots.release()
+                self._queue.task_done()
+
+def _process_alive(pid):
+    # Signál 0 jen ověří existenci procesu; mimo POSIX běží jediný proces (os.kill by ho tam ukončil)
+    if os.name != "posix": return True
+    try: os.kill(pid, 0)
+    except ProcessLookupError: return False
+    except PermissionError: pass
+    return True
@@ -0,0 +1,140 @@
+import os
+import queue
+import threading
+import time
+
+try:
+    from watchdog.observers import Observer
+    from watchdog.events import FileSystemEventHandler
+except ImportError:
+    Observer = None
+    FileSystemEventHandler = object
+
+# Hlídání knihovny (inotify přes watchdog): soubory nahrané přes SMB nebo přímo ze sliceru
+# se zpracují hned, ne až při výpisu složky. Zápis po SMB chodí jako série událostí,
+# proto se změna zpracuje až po SETTLE_SECONDS klidu. Bez watchdog hlídání neběží.
+SETTLE_SECONDS = 2.0
+POLL_INTERVAL = 0.5
+
+class _EventHandler(FileSystemEventHandler):
+    def __init__(self, events):
+        self.events = events
+
+    def on_any_event(self, event):
+        if event.event_type in ("created", "modified", "closed", "deleted", "moved"):
+            self.events.put((event.event_type, event.is_directory, os.fsdecode(event.src_path), os.fsdecode(getattr(event, "dest_path", "") or "")))
+
+class LibraryWatcher:
+    # Callbacky dostávají absolutní cesty: on_changed(path), on_deleted(path), on_moved(src, dst),
+    # on_folder_deleted(path), on_folder_moved(src, dst). on_changed vrací False, když se změna
+    # nedá zpracovat hned (plná fronta) - zkusí se znovu po dalším intervalu.
+    def __init__(self, root, on_changed, on_deleted, on_moved, on_folder_deleted, on_folder_moved, ignore=None, settle=SETTLE_SECONDS):
+        self.root = os.path.abspath(root)
+        self.on_changed, self.on_deleted, self.on_moved = on_changed, on_deleted, on_moved
+        self.on_folder_deleted, self.on_folder_moved = on_folder_deleted, on_folder_moved
+        self.ignore = ignore or (lambda path: False)
+        self.settle = settle
+        self._events = queue.Queue()
+        self._pending = {}
+        self._observer = None
+        self._thread = None
+
+    @property
+    def available(self):
+        return Observer is not None
+
+    def start(self):
+        if self._thread is not None: return True
+        if Observer is None:
+            print("Hlídání knihovny je vypnuté (chybí balíček watchdog)")
+            return False
+        self._observer = Observer()
+        self._observer.schedule(_EventHandler(self._events), self.root, recursive=True)
+        self._observer.daemon = True
+        self._observer.start()
+        self._thread = threading.Thread(target=self._run, name="library-watcher", daemon=True)
+        self._thread.start()
+        return True
+
+    def stop(self):
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._thread is not None:
+            self._events.put(None)
+            self._thread.join()
+        self._observer = self._thread = None
+
+    def _inside(self, path):
+        return path == self.root or path.startswith(self.root + os.sep)
+
+    def _run(self):
+        while True:
+            try: item = self._events.get(timeout=POLL_INTERVAL)
+            except queue.Empty: item = ()
+            if item is None: return
+            try:
+                if item: self._handle(*item)
+                self._flush()
+            except Exception as e:
+                print(f"Chyba při zpracování změny v knihovně {item}: {e}")
+
+    def _handle(self, event_type, is_directory, src, dst):
+        if event_type == "moved":
+            src_inside, dst_inside = self._inside(src) and not self.ignore(src), self._inside(dst) and not self.ignore(dst)
+            if src_inside and dst_inside:
+                if is_directory:
+                    self._move_pending(src, dst)
+                    self.on_folder_moved(src, dst)
+                elif src in self._pending:
+                    # Ještě nezpracovaný soubor (např. dočasný název při ukládání) - zpracuje se pod novým jménem
+                    self._pending[dst] = self._pending.pop(src)
+                else:
+                    self.on_moved(src, dst)
+                return
+            if src_inside: event_type, dst = "deleted", ""
+            elif dst_inside: event_type, src = "created", dst
+            else: return
+        if not self._inside(src) or self.ignore(src): return
+        if event_type == "deleted":
+            if is_directory:
+                self._drop_pending(src)
+                self.on_folder_deleted(src)
+            else:
+                self._pending.pop(src, None)
+                self.on_deleted(src)
+        elif is_directory:
+            # Složka přesunutá do knihovny nemusí vygenerovat události pro svůj obsah
+            if event_type == "created":
+                for folder, _, names in os.walk(src):
+                    for name in names:
+                        path = os.path.join(folder, name)
+                        if not self.ignore(path): self._pending[path] = time.monotonic()
+        else:
+            self._pending[src] = time.monotonic()
+
+    def _move_pending(self, src, dst):
+        prefix = src + os.sep
+        for path in [p for p in self._pending if p.startswith(prefix)]:
+            self._pending[dst + path[len(src):]] = self._pending.pop(path)
+
+    def _drop_pending(self, folder):
+        prefix = folder + os.sep
+        for path in [p for p in self._pending if p.startswith(prefix)]: del self._pending[path]
+
+    def _flush(self):
+        now = time.monotonic()
+        for path, last_event in list(self._pending.items()):
+            if now - last_event < self.settle: continue
+            if not os.path.isfile(path):
+                del self._pending[path]
+                continue
+            try: processed = self.on_changed(path) is not False
+            except Exception as e:
+                # Chyba jednoho souboru nesmí blokovat ostatní ani se opakovat při každém průchodu
+                print(f"Chyba při zpracování změny v knihovně {path}: {e}")
+                processed = True
+            if not processed:
+                self._pending[path] = now
+                continue
+            del self._pending[path]
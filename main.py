@@ -1,9 +1,9 @@
 from flask import Flask, render_template, request, jsonify
-import time
 import json
 import ssl
 import threading
 import paho.mqtt.client as mqtt
+from payloads import payload_home, payload_light, payload_gcode_line as payload_gcode
 
 app = Flask(__name__)
 
@@ -57,20 +57,6 @@ mqtt_thread = threading.Thread(target=mqtt_client.loop_forever)
 mqtt_thread.daemon = True
 mqtt_thread.start()
 
-# ===== Funkce pro payloady =====
-def payload_home():
-    return {"print": {"command": "gcode_line", "param": "G28\n",
-                      "sequence_id": str(int(time.time()*1000)), "user_id": "123456789"}}
-
-def payload_gcode(line):
-    return {"print": {"command": "gcode_line", "param": line + "\n",
-                      "sequence_id": str(int(time.time()*1000)), "user_id": "123456789"}}
-
-def payload_light(mode):
-    return {"system": {"sequence_id": str(int(time.time()*1000)), "command": "ledctrl",
-                       "led_node": "chamber_light", "led_mode": mode, "led_on_time": 500,
-                       "led_off_time": 500, "loop_times": 1, "interval_time": 1000}}
-
 def send(topic, payload):
     mqtt_client.publish(topic, json.dumps(payload))
 
@@ -0,0 +1,446 @@
+import hashlib
+import json
+import re
+import sqlite3
+import threading
+import time
+from workers import file_lock
+
+# Jedna SQLite databáze místo .metadata_cache.json vedle každého souboru.
+# Klíčem je relativní cesta; platnost záznamu hlídá mtime + velikost + verze extraktoru,
+# hash obsahu slouží k poznání souboru přesunutého mimo aplikaci (SMB apod.).
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS files (
+    path TEXT PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    mtime REAL NOT NULL,
+    size INTEGER NOT NULL,
+    content_hash TEXT,
+    extractor_version INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    list_meta TEXT NOT NULL,
+    indexed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_files_folder ON files(folder, name);
+CREATE INDEX IF NOT EXISTS idx_files_hash ON files(content_hash, size);
+"""
+
+# Sloupce pro řazení a filtrování výpisu; plní se z list_meta při upsert()
+SORT_COLUMNS = {"print_time_s": "INTEGER", "weight_g": "REAL", "printer_model": "TEXT", "nozzle_diameter": "REAL", "file_type": "TEXT"}
+# Klíč složky s náhledy souboru (thumbnails/<klíč>/); drží se s řádkem i při přejmenování a přesunu
+EXTRA_COLUMNS = {"thumb_key": "TEXT", "layer_height": "REAL", "search_text": "TEXT", "thumb_bytes": "INTEGER", "extra_bytes": "INTEGER"}
+
+# Vyhledávání: fulltext (název + poznámky, model, filamenty) v FTS5 a úzká tabulka faset vedle files
+# (řádky files nesou velké JSONy). Obojí drží triggery, takže každý upsert / přesun / smazání je
+# aktualizuje ve stejné transakci, a zapíšou změnu do search_changes - podle toho si index faset
+# v paměti (search_index.py) každého procesu dočte jen změněné řádky. Filamentů má soubor víc,
+# proto vlastní tabulka. file_id = rowid řádku v files, ten se při přejmenování ani přesunu nemění.
+SEARCH_SCHEMA = """
+CREATE TABLE IF NOT EXISTS file_facets (
+    file_id INTEGER PRIMARY KEY,
+    folder TEXT NOT NULL,
+    name TEXT NOT NULL,
+    printer_model TEXT,
+    file_type TEXT,
+    nozzle_diameter REAL,
+    layer_height REAL,
+    print_time_s INTEGER,
+    weight_g REAL
+);
+CREATE TABLE IF NOT EXISTS search_changes (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    file_id INTEGER NOT NULL
+);
+-- Log drží posledních 10000 změn; kdo je pozadu víc, načte fasety znovu celé
+CREATE TRIGGER IF NOT EXISTS search_changes_trim AFTER INSERT ON search_changes BEGIN
+    DELETE FROM search_changes WHERE seq <= new.seq - 10000;
+END;
+CREATE TABLE IF NOT EXISTS file_filaments (
+    file_id INTEGER NOT NULL,
+    type TEXT,
+    colour TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_filaments_file ON file_filaments(file_id);
+CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(name, search_text, content='files', content_rowid='rowid', tokenize='unicode61 remove_diacritics 2', prefix='2 3');
+-- Žádné INSERT OR REPLACE / OR IGNORE: v triggeru spuštěném z UPSERT (INSERT ... ON CONFLICT DO UPDATE)
+-- SQLite konfliktní klauzuli triggeru nepoužije a insert skončí chybou UNIQUE
+CREATE TRIGGER IF NOT EXISTS files_search_insert AFTER INSERT ON files BEGIN
+    INSERT INTO search_changes (file_id) VALUES (new.rowid);
+    INSERT INTO files_fts(rowid, name, search_text) VALUES (new.rowid, new.name, new.search_text);
+    DELETE FROM file_facets WHERE file_id = new.rowid;
+    INSERT INTO file_facets VALUES (new.rowid, new.folder, new.name, new.printer_model, new.file_type, round(new.nozzle_diameter, 3), round(new.layer_height, 3), new.print_time_s, new.weight_g);
+END;
+CREATE TRIGGER IF NOT EXISTS files_search_delete AFTER DELETE ON files BEGIN
+    INSERT INTO search_changes (file_id) VALUES (old.rowid);
+    INSERT INTO files_fts(files_fts, rowid, name, search_text) VALUES ('delete', old.rowid, old.name, old.search_text);
+    DELETE FROM file_facets WHERE file_id = old.rowid;
+    DELETE FROM file_filaments WHERE file_id = old.rowid;
+END;
+CREATE TRIGGER IF NOT EXISTS files_facets_update AFTER UPDATE ON files BEGIN
+    INSERT INTO search_changes (file_id) VALUES (new.rowid);
+    DELETE FROM file_facets WHERE file_id = new.rowid;
+    INSERT INTO file_facets VALUES (new.rowid, new.folder, new.name, new.printer_model, new.file_type, round(new.nozzle_diameter, 3), round(new.layer_height, 3), new.print_time_s, new.weight_g);
+END;
+CREATE TRIGGER IF NOT EXISTS files_search_update AFTER UPDATE OF name, search_text ON files BEGIN
+    INSERT INTO files_fts(files_fts, rowid, name, search_text) VALUES ('delete', old.rowid, old.name, old.search_text);
+    INSERT INTO files_fts(rowid, name, search_text) VALUES (new.rowid, new.name, new.search_text);
+END;
+CREATE INDEX IF NOT EXISTS idx_files_search_pending ON files(extractor_version) WHERE search_text IS NULL;
+"""
+
+# Řadicí klíč pro každý podporovaný způsob řazení; NULL (ještě neznámé) jde vždy na konec
+SORT_KEYS = {"name": "lower(name)", "modified": "mtime", "print_time": "print_time_s", "weight": "weight_g"}
+METADATA_SORTS = ("print_time", "weight")
+FILTERS = ("printer_model", "nozzle_diameter", "file_type")
+PENDING_VERSION = 0
+
+# Obsazené místo po složkách: originály (size), náhledy (thumb_bytes) a poznámky / staré cache (extra_bytes)
+# se přičítají a odečítají triggery při každém zápisu, přesunu a smazání řádku v files, takže přehled
+# i kontrola kvóty jsou jeden dotaz na malou tabulku bez procházení disku. thumb_bytes NULL = ještě nezměřeno.
+USAGE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS folder_usage (
+    folder TEXT PRIMARY KEY,
+    files INTEGER NOT NULL DEFAULT 0,
+    original_bytes INTEGER NOT NULL DEFAULT 0,
+    thumbnail_bytes INTEGER NOT NULL DEFAULT 0,
+    extra_bytes INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS folder_quotas (
+    folder TEXT PRIMARY KEY,
+    quota_bytes INTEGER NOT NULL
+);
+CREATE TRIGGER IF NOT EXISTS files_usage_insert AFTER INSERT ON files BEGIN
+    INSERT INTO folder_usage (folder) SELECT new.folder WHERE NOT EXISTS (SELECT 1 FROM folder_usage WHERE folder = new.folder);
+    UPDATE folder_usage SET files = files + 1, original_bytes = original_bytes + new.size, thumbnail_bytes = thumbnail_bytes + COALESCE(new.thumb_bytes, 0),
+        extra_bytes = extra_bytes + COALESCE(new.extra_bytes, 0) WHERE folder = new.folder;
+END;
+CREATE TRIGGER IF NOT EXISTS files_usage_delete AFTER DELETE ON files BEGIN
+    UPDATE folder_usage SET files = files - 1, original_bytes = original_bytes - old.size, thumbnail_bytes = thumbnail_bytes - COALESCE(old.thumb_bytes, 0),
+        extra_bytes = extra_bytes - COALESCE(old.extra_bytes, 0) WHERE folder = old.folder;
+    DELETE FROM folder_usage WHERE folder = old.folder AND files <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS files_usage_update AFTER UPDATE OF folder, size, thumb_bytes, extra_bytes ON files BEGIN
+    UPDATE folder_usage SET files = files - 1, original_bytes = original_bytes - old.size, thumbnail_bytes = thumbnail_bytes - COALESCE(old.thumb_bytes, 0),
+        extra_bytes = extra_bytes - COALESCE(old.extra_bytes, 0) WHERE folder = old.folder;
+    INSERT INTO folder_usage (folder) SELECT new.folder WHERE NOT EXISTS (SELECT 1 FROM folder_usage WHERE folder = new.folder);
+    UPDATE folder_usage SET files = files + 1, original_bytes = original_bytes + new.size, thumbnail_bytes = thumbnail_bytes + COALESCE(new.thumb_bytes, 0),
+        extra_bytes = extra_bytes + COALESCE(new.extra_bytes, 0) WHERE folder = new.folder;
+    DELETE FROM folder_usage WHERE folder = old.folder AND files <= 0;
+END;
+"""
+USAGE_FIELDS = ("files", "original_bytes", "thumbnail_bytes", "extra_bytes")
+
+class QuotaExceeded(Exception):
+    def __init__(self, folder, quota_bytes, used_bytes, incoming_bytes):
+        super().__init__(f"Složka {folder or '/'} má kvótu {quota_bytes} B, obsazeno {used_bytes} B, nahrávaný soubor má {incoming_bytes} B")
+        self.folder, self.quota_bytes, self.used_bytes, self.incoming_bytes = folder, quota_bytes, used_bytes, incoming_bytes
+
+HASH_CHUNK_SIZE = 1024 * 1024
+
+def file_sha256(abs_path):
+    digest = hashlib.sha256()
+    with open(abs_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b""): digest.update(chunk)
+    return digest.hexdigest()
+
+def normalize_folder(folder):
+    folder = folder.replace("\\", "/").strip("/")
+    return "" if folder == "." else folder
+
+def split_rel_path(rel_path):
+    rel_path = rel_path.replace("\\", "/").strip("/")
+    folder, _, name = rel_path.rpartition("/")
+    return rel_path, folder, name
+
+class MetadataIndex:
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+        # Víc worker procesů startuje najednou: úpravu schématu dělá vždy jen jeden
+        with file_lock(f"{db_path}.lock"), self._conn() as conn:
+            conn.executescript(SCHEMA)
+            existing = {row["name"] for row in conn.execute("PRAGMA table_info(files)")}
+            for column, column_type in {**SORT_COLUMNS, **EXTRA_COLUMNS}.items():
+                if column not in existing: conn.execute(f"ALTER TABLE files ADD COLUMN {column} {column_type}")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_files_folder_mtime ON files(folder, mtime)")
+            fts_exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'files_fts'").fetchone() is not None
+            usage_exists = conn.execute("SELECT 1 FROM sqlite_master WHERE name = 'folder_usage'").fetchone() is not None
+            # Triggery ze starší verze s INSERT OR REPLACE / OR IGNORE selhávaly při UPSERT - vytvoří se znovu
+            for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger' AND (sql LIKE '%INSERT OR REPLACE INTO file_facets%' OR sql LIKE '%INSERT OR IGNORE INTO folder_usage%')").fetchall():
+                conn.execute(f"DROP TRIGGER {row['name']}")
+            conn.executescript(SEARCH_SCHEMA)
+            # Databáze ze starší verze: fulltext a fasety se jednou postaví z existujících řádků
+            if not fts_exists:
+                conn.execute("INSERT INTO files_fts(files_fts) VALUES ('rebuild')")
+                conn.execute("INSERT OR REPLACE INTO file_facets SELECT rowid, folder, name, printer_model, file_type, round(nozzle_diameter, 3), round(layer_height, 3), print_time_s, weight_g FROM files")
+            conn.executescript(USAGE_SCHEMA)
+            # Součty po složkách se jednou spočítají z indexu, dál je drží triggery
+            if not usage_exists:
+                conn.execute("INSERT INTO folder_usage SELECT folder, COUNT(*), SUM(size), SUM(COALESCE(thumb_bytes, 0)), SUM(COALESCE(extra_bytes, 0)) FROM files GROUP BY folder")
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.db_path, timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    @staticmethod
+    def _row_to_entry(row):
+        if row is None: return None
+        entry = dict(row)
+        entry["record"] = json.loads(entry["record"])
+        entry["list_meta"] = json.loads(entry["list_meta"])
+        return entry
+
+    def get(self, rel_path):
+        rel_path, _, _ = split_rel_path(rel_path)
+        return self._row_to_entry(self._conn().execute("SELECT * FROM files WHERE path = ?", (rel_path,)).fetchone())
+
+    def folder_states(self, folder):
+        # Jen to, co je potřeba k porovnání s diskem - bez parsování JSONu
+        rows = self._conn().execute("SELECT path, mtime, size, extractor_version FROM files WHERE folder = ?", (normalize_folder(folder),)).fetchall()
+        return {row["path"]: (row["mtime"], row["size"], row["extractor_version"]) for row in rows}
+
+    def add_pending(self, files):
+        # Soubory známé jen ze stat(); metadata se dopočítají, až budou potřeba
+        now = time.time()
+        rows = [(*split_rel_path(path), mtime, size, now) for path, mtime, size in files]
+        with self._conn() as conn:
+            conn.executemany(
+                f"INSERT INTO files (path, folder, name, mtime, size, extractor_version, record, list_meta, indexed_at) VALUES (?, ?, ?, ?, ?, {PENDING_VERSION}, '{{}}', '{{}}', ?) "
+                f"ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime, size = excluded.size, content_hash = NULL, extractor_version = {PENDING_VERSION}, record = '{{}}', list_meta = '{{}}', indexed_at = excluded.indexed_at, "
+                "print_time_s = NULL, weight_g = NULL, printer_model = NULL, nozzle_diameter = NULL, file_type = NULL, layer_height = NULL, search_text = NULL", rows)
+            conn.executemany("DELETE FROM file_filaments WHERE file_id = (SELECT rowid FROM files WHERE path = ?)", [(row[0],) for row in rows])
+
+    def _filter_clause(self, folder, filters):
+        clauses, args = ["folder = ?"], [normalize_folder(folder)]
+        for key in FILTERS:
+            value = filters.get(key)
+            if value in (None, ""): continue
+            if key == "nozzle_diameter":
+                clauses.append("abs(nozzle_diameter - ?) < 0.0001")
+                args.append(float(value))
+            else:
+                clauses.append(f"{key} = ?")
+                args.append(value)
+        return clauses, args
+
+    def query_folder(self, folder, sort="name", descending=False, filters=None, cursor=None, limit=100):
+        # Stránkování kurzorem (keyset): kurzor je trojice (je_null, klíč, název) posledního řádku
+        key = SORT_KEYS.get(sort, SORT_KEYS["name"])
+        direction, op = ("DESC", "<") if descending else ("ASC", ">")
+        null_flag = f"({key} IS NOT NULL)" if descending else f"({key} IS NULL)"
+        clauses, args = self._filter_clause(folder, filters or {})
+        count_args = list(args)
+        if cursor is not None:
+            clauses.append(f"({null_flag}, COALESCE({key}, 0), name) {op} (?, ?, ?)")
+            args.extend(cursor)
+        rows = self._conn().execute(
+            f"SELECT path, name, extractor_version, list_meta, {null_flag} AS k0, COALESCE({key}, 0) AS k1 FROM files WHERE {' AND '.join(clauses)} "
+            f"ORDER BY k0 {direction}, k1 {direction}, name {direction} LIMIT ?", args + [limit + 1]).fetchall()
+        total = self._conn().execute(f"SELECT COUNT(*) FROM files WHERE {' AND '.join(self._filter_clause(folder, filters or {})[0])}", count_args).fetchone()[0]
+        next_cursor = [rows[limit - 1]["k0"], rows[limit - 1]["k1"], rows[limit - 1]["name"]] if len(rows) > limit else None
+        return [dict(row) for row in rows[:limit]], next_cursor, total
+
+    def filter_options(self, folder):
+        folder = normalize_folder(folder)
+        options = {}
+        for key in FILTERS:
+            rows = self._conn().execute(f"SELECT DISTINCT {key} FROM files WHERE folder = ? AND {key} IS NOT NULL AND {key} != '' ORDER BY {key}", (folder,)).fetchall()
+            options[key] = [row[0] for row in rows]
+        return options
+
+    def find_by_hash(self, content_hash, size):
+        rows = self._conn().execute("SELECT * FROM files WHERE content_hash = ? AND size = ?", (content_hash, size)).fetchall()
+        return [self._row_to_entry(row) for row in rows]
+
+    def upsert(self, rel_path, mtime, size, content_hash, extractor_version, record, list_meta, thumb_key=None):
+        # Bez thumb_key zůstává klíč náhledů z předchozího záznamu
+        rel_path, folder, name = split_rel_path(rel_path)
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO files (path, folder, name, mtime, size, content_hash, extractor_version, record, list_meta, indexed_at, print_time_s, weight_g, printer_model, nozzle_diameter, file_type, layer_height, search_text, thumb_key) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?) "
+                "ON CONFLICT(path) DO UPDATE SET mtime = excluded.mtime, size = excluded.size, content_hash = excluded.content_hash, extractor_version = excluded.extractor_version, record = excluded.record, list_meta = excluded.list_meta, indexed_at = excluded.indexed_at, "
+                "print_time_s = excluded.print_time_s, weight_g = excluded.weight_g, printer_model = excluded.printer_model, nozzle_diameter = excluded.nozzle_diameter, file_type = excluded.file_type, "
+                "layer_height = excluded.layer_height, search_text = excluded.search_text, thumb_key = COALESCE(excluded.thumb_key, files.thumb_key)",
+                (rel_path, folder, name, mtime, size, content_hash, extractor_version, json.dumps(record), json.dumps(list_meta), time.time(), *_sort_values(list_meta), *_search_values(list_meta), thumb_key))
+            self._set_filaments(conn, rel_path, list_meta)
+
+    def thumb_key(self, rel_path):
+        rel_path, _, _ = split_rel_path(rel_path)
+        row = self._conn().execute("SELECT thumb_key FROM files WHERE path = ?", (rel_path,)).fetchone()
+        return row["thumb_key"] if row else None
+
+    def set_thumb_key(self, rel_path, thumb_key):
+        rel_path, _, _ = split_rel_path(rel_path)
+        with self._conn() as conn: conn.execute("UPDATE files SET thumb_key = ? WHERE path = ?", (thumb_key, rel_path))
+
+    def update_list_meta(self, rel_path, list_meta):
+        rel_path, _, _ = split_rel_path(rel_path)
+        with self._conn() as conn:
+            conn.execute("UPDATE files SET list_meta = ?, print_time_s = ?, weight_g = ?, printer_model = ?, nozzle_diameter = ?, file_type = ?, layer_height = ?, search_text = ? WHERE path = ?",
+                         (json.dumps(list_meta), *_sort_values(list_meta), *_search_values(list_meta), rel_path))
+            self._set_filaments(conn, rel_path, list_meta)
+
+    @staticmethod
+    def _set_filaments(conn, rel_path, list_meta):
+        row = conn.execute("SELECT rowid FROM files WHERE path = ?", (rel_path,)).fetchone()
+        if row is None: return
+        conn.execute("DELETE FROM file_filaments WHERE file_id = ?", (row[0],))
+        conn.executemany("INSERT INTO file_filaments (file_id, type, colour) VALUES (?, ?, ?)", [(row[0], *filament) for filament in _filament_values(list_meta)])
+
+    def unsearchable_paths(self, limit=1000):
+        # Zpracované soubory z doby před vyhledáváním (list_meta bez filamentů a poznámek); doplní je volající
+        rows = self._conn().execute(f"SELECT path FROM files WHERE search_text IS NULL AND extractor_version != {PENDING_VERSION} LIMIT ?", (limit,)).fetchall()
+        return [row["path"] for row in rows]
+
+    def search_changes(self, since):
+        # Řádky změněné od pořadového čísla since (pro index vyhledávání v paměti); vrací (poslední číslo, id, úplné?)
+        conn = self._conn()
+        last, first = conn.execute("SELECT COALESCE(MAX(seq), 0), COALESCE(MIN(seq), 0) FROM search_changes").fetchone()
+        if last <= since: return last, [], True
+        if first > since + 1: return last, [], False  # část záznamu už je smazaná, je potřeba načíst vše
+        ids = [row[0] for row in conn.execute("SELECT DISTINCT file_id FROM search_changes WHERE seq > ? AND seq <= ?", (since, last))]
+        return last, ids, True
+
+    def facet_rows(self, file_ids=None):
+        # (file_id, folder, name, printer_model, file_type, nozzle, layer, print_time_s, weight_g, [(typ, barva), ...])
+        conn = self._conn()
+        where, args = ("", []) if file_ids is None else (f" WHERE file_id IN ({', '.join('?' * len(file_ids))})", list(file_ids))
+        filaments = {}
+        for file_id, filament_type, colour in conn.execute(f"SELECT file_id, type, colour FROM file_filaments{where}", args): filaments.setdefault(file_id, []).append((filament_type, colour))
+        return [(*row, filaments.get(row[0], [])) for row in conn.execute(f"SELECT file_id, folder, name, printer_model, file_type, nozzle_diameter, layer_height, print_time_s, weight_g FROM file_facets{where}", args)]
+
+    def text_matches(self, text):
+        # id řádků odpovídajících textu, nejrelevantnější první (název váží víc než poznámky a ostatní)
+        match = fts_query(text)
+        if not match: return None
+        return [row[0] for row in self._conn().execute("SELECT rowid FROM files_fts WHERE files_fts MATCH ? ORDER BY bm25(files_fts, 10.0, 1.0)", (match,))]
+
+    def entries_by_id(self, file_ids):
+        if not file_ids: return []
+        rows = {row["rowid"]: row for row in self._conn().execute(f"SELECT rowid, path, name, extractor_version, list_meta FROM files WHERE rowid IN ({', '.join('?' * len(file_ids))})", list(file_ids))}
+        return [{key: rows[file_id][key] for key in ("path", "name", "extractor_version", "list_meta")} for file_id in file_ids if file_id in rows]
+
+    def set_usage(self, rel_path, thumb_bytes, extra_bytes):
+        # Velikost náhledů a poznámek souboru; originál se bere ze sloupce size
+        rel_path, _, _ = split_rel_path(rel_path)
+        with self._conn() as conn: conn.execute("UPDATE files SET thumb_bytes = ?, extra_bytes = ? WHERE path = ?", (thumb_bytes, extra_bytes, rel_path))
+
+    def unmeasured_paths(self, limit=1000):
+        # Zpracované soubory z doby před počítáním místa; změří je volající
+        rows = self._conn().execute(f"SELECT path FROM files WHERE thumb_bytes IS NULL AND extractor_version != {PENDING_VERSION} LIMIT ?", (limit,)).fetchall()
+        return [row["path"] for row in rows]
+
+    def folder_usage(self):
+        # {složka: {files, original_bytes, thumbnail_bytes, extra_bytes}} jen za soubory přímo ve složce
+        return {row["folder"]: {key: row[key] for key in USAGE_FIELDS} for row in self._conn().execute("SELECT * FROM folder_usage")}
+
+    def quotas(self):
+        return {row["folder"]: row["quota_bytes"] for row in self._conn().execute("SELECT folder, quota_bytes FROM folder_quotas")}
+
+    def set_quota(self, folder, quota_bytes):
+        # None kvótu zruší
+        folder = normalize_folder(folder)
+        with self._conn() as conn:
+            if quota_bytes is None: conn.execute("DELETE FROM folder_quotas WHERE folder = ?", (folder,))
+            else: conn.execute("INSERT INTO folder_quotas (folder, quota_bytes) VALUES (?, ?) ON CONFLICT(folder) DO UPDATE SET quota_bytes = excluded.quota_bytes", (folder, int(quota_bytes)))
+
+    def check_quota(self, folder, incoming_bytes, replaced=()):
+        # Kvóta platí pro složku včetně podsložek; kontroluje se složka i všechny nadřazené s kvótou.
+        # replaced: cesty souborů ve složce, které nahrávání přepíše - jejich místo se uvolní
+        folder = normalize_folder(folder)
+        quotas = self.quotas()
+        if not quotas: return
+        usage = self.folder_usage()
+        paths = sorted({split_rel_path(path)[0] for path in replaced})
+        freed = self._conn().execute(f"SELECT COALESCE(SUM(size + COALESCE(thumb_bytes, 0) + COALESCE(extra_bytes, 0)), 0) FROM files WHERE path IN ({', '.join('?' * len(paths))})",
+                                     paths).fetchone()[0] if paths else 0
+        for limited, quota_bytes in quotas.items():
+            if limited and folder != limited and not folder.startswith(limited + "/"): continue
+            used = sum(usage_total(row) for name, row in usage.items() if not limited or name == limited or name.startswith(limited + "/")) - freed
+            if used + incoming_bytes > quota_bytes: raise QuotaExceeded(limited, quota_bytes, used, incoming_bytes)
+
+    def move(self, old_rel_path, new_rel_path):
+        # Vrací klíče náhledů přepsaného cílového souboru, aby je volající mohl smazat
+        old_rel_path, _, _ = split_rel_path(old_rel_path)
+        new_rel_path, folder, name = split_rel_path(new_rel_path)
+        if old_rel_path == new_rel_path: return []
+        with self._conn() as conn:
+            # Zdroj už přesunul někdo jiný (aplikace vs. hlídání knihovny) - cíl se nesmí smazat
+            if conn.execute("SELECT 1 FROM files WHERE path = ?", (old_rel_path,)).fetchone() is None: return []
+            replaced = self._thumb_keys(conn, "path = ?", (new_rel_path,))
+            conn.execute("DELETE FROM files WHERE path = ?", (new_rel_path,))
+            conn.execute("UPDATE files SET path = ?, folder = ?, name = ? WHERE path = ?", (new_rel_path, folder, name, old_rel_path))
+        return replaced
+
+    def move_folder(self, old_folder, new_folder):
+        old_folder, new_folder = normalize_folder(old_folder), normalize_folder(new_folder)
+        with self._conn() as conn:
+            rows = conn.execute("SELECT path, folder FROM files WHERE folder = ? OR folder LIKE ? ESCAPE '\\'", (old_folder, _like_prefix(old_folder))).fetchall()
+            for row in rows:
+                new_path = new_folder + row["path"][len(old_folder):]
+                conn.execute("UPDATE files SET path = ?, folder = ? WHERE path = ?", (new_path, new_folder + row["folder"][len(old_folder):], row["path"]))
+            # Kvóty jdou se složkou
+            conn.execute("UPDATE OR REPLACE folder_quotas SET folder = ? || substr(folder, ?) WHERE folder = ? OR folder LIKE ? ESCAPE '\\'", (new_folder, len(old_folder) + 1, old_folder, _like_prefix(old_folder)))
+
+    # Mazání vrací klíče náhledů odebraných souborů
+    @staticmethod
+    def _thumb_keys(conn, where, args):
+        return [row["thumb_key"] for row in conn.execute(f"SELECT thumb_key FROM files WHERE ({where}) AND thumb_key IS NOT NULL", args)]
+
+    def delete(self, rel_path):
+        return self.delete_many([rel_path])
+
+    def delete_many(self, rel_paths):
+        rel_paths = [split_rel_path(p)[0] for p in rel_paths]
+        with self._conn() as conn:
+            keys = [key for p in rel_paths for key in self._thumb_keys(conn, "path = ?", (p,))]
+            conn.executemany("DELETE FROM files WHERE path = ?", [(p,) for p in rel_paths])
+        return keys
+
+    def delete_folder(self, folder):
+        folder = normalize_folder(folder)
+        with self._conn() as conn:
+            keys = self._thumb_keys(conn, "folder = ? OR folder LIKE ? ESCAPE '\\'", (folder, _like_prefix(folder)))
+            conn.execute("DELETE FROM files WHERE folder = ? OR folder LIKE ? ESCAPE '\\'", (folder, _like_prefix(folder)))
+            conn.execute("DELETE FROM folder_quotas WHERE folder = ? OR folder LIKE ? ESCAPE '\\'", (folder, _like_prefix(folder)))
+        return keys
+
+def usage_total(row):
+    return row["original_bytes"] + row["thumbnail_bytes"] + row["extra_bytes"]
+
+def _like_prefix(folder):
+    return folder.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "/%"
+
+def fts_query(text):
+    # Každé slovo jako prefix v uvozovkách (žádná FTS syntaxe od uživatele), všechna slova musí sedět
+    terms = re.findall(r"\w+", text or "")
+    return " AND ".join(f'"{term}"*' for term in terms)
+
+def _normalize_filament(key, value):
+    value = str(value or "").strip()
+    return value.lstrip("#").upper()[:6] if key == "filament_colour" else value.upper()
+
+def _filament_values(list_meta):
+    filaments = {(_normalize_filament("filament_type", f.get("type")) or None, _normalize_filament("filament_colour", f.get("color")) or None) for f in list_meta.get("filaments") or []}
+    return sorted(filaments, key=lambda f: (f[0] or "", f[1] or ""))
+
+def _search_values(list_meta):
+    # Vrací (layer_height, search_text); čekající záznam bez metadat má search_text NULL
+    if not list_meta: return None, None
+    try: layer_height = float(list_meta.get("layer_height")) if list_meta.get("layer_height") not in (None, "") else None
+    except (TypeError, ValueError): layer_height = None
+    words = [list_meta.get("printer_model") or "", list_meta.get("file_type") or ""] + list(list_meta.get("notes") or [list_meta.get("note") or ""])
+    words += [value for filament in _filament_values(list_meta) for value in filament if value]
+    return layer_height, " ".join(word for word in words if word)
+
+def _sort_values(list_meta):
+    try: nozzle = float(list_meta.get("nozzle_diameter")) if list_meta.get("nozzle_diameter") not in (None, "") else None
+    except (TypeError, ValueError): nozzle = None
+    return (list_meta.get("print_time_s"), list_meta.get("weight_g"), list_meta.get("printer_model") or None, nozzle, list_meta.get("file_type"))
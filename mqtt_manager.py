@@ -0,0 +1,163 @@
+import json
+import os
+import socket
+import ssl
+import threading
+import time
+import paho.mqtt.client as mqtt
+from payloads import payload_pushall
+
+# Jedno trvalé MQTT spojení na tiskárnu místo nového TLS handshake pro každý dotaz/příkaz.
+# Znovupřipojení řeší smyčka paho s rostoucí prodlevou RECONNECT_MIN_DELAY..RECONNECT_MAX_DELAY s.
+MQTT_PORT = 8883
+MQTT_USERNAME = "bblp"
+CONNECT_TIMEOUT = 5
+KEEPALIVE = 60
+RECONNECT_MIN_DELAY = 1
+RECONNECT_MAX_DELAY = 60
+PUBLISH_TIMEOUT = 5
+
+def _new_client(client_id):
+    # paho 2.x vyžaduje verzi API callbacků, 1.x ji nezná
+    if hasattr(mqtt, "CallbackAPIVersion"): return mqtt.Client(mqtt.CallbackAPIVersion.VERSION2, client_id=client_id)
+    return mqtt.Client(client_id=client_id)
+
+def probe(ip, timeout=CONNECT_TIMEOUT):
+    # Jen TCP + TLS handshake na MQTT port, bez přihlášení - pro tiskárny bez živého spojení
+    context = ssl.create_default_context()
+    context.check_hostname, context.verify_mode = False, ssl.CERT_NONE
+    try:
+        with socket.create_connection((ip, MQTT_PORT), timeout=timeout) as sock:
+            with context.wrap_socket(sock): return True
+    except (OSError, ValueError): return False
+
+def request_topic(serial):
+    return f"device/{serial}/request"
+
+def report_topic(serial):
+    return f"device/{serial}/report"
+
+
+class PrinterConnection:
+    def __init__(self, printer, on_report=None):
+        self.printer_id = printer["id"]
+        self.on_report = on_report
+        self.ip, self.access_code, self.serial = printer["ip"], printer["access_code"], printer["serial"]
+        self.connected = False
+        self.connected_since = None
+        self.last_error = None
+        self.attempts = 0
+        self._client = None
+
+    def config_key(self):
+        return (self.ip, self.access_code, self.serial)
+
+    def start(self):
+        client = _new_client(f"printernest-{os.getpid()}-{self.printer_id}")
+        client.username_pw_set(MQTT_USERNAME, self.access_code)
+        client.tls_set(certfile=None, keyfile=None, cert_reqs=ssl.CERT_NONE)
+        client.tls_insecure_set(True)
+        client.reconnect_delay_set(min_delay=RECONNECT_MIN_DELAY, max_delay=RECONNECT_MAX_DELAY)
+        if hasattr(client, "connect_timeout"): client.connect_timeout = CONNECT_TIMEOUT
+        client.on_connect = self._on_connect
+        client.on_disconnect = self._on_disconnect
+        client.on_connect_fail = self._on_connect_fail
+        client.on_message = self._on_message
+        self._client = client
+        self.attempts += 1
+        # connect_async + loop_start: i první připojení zkouší smyčka na pozadí, request nečeká
+        client.connect_async(self.ip, MQTT_PORT, KEEPALIVE)
+        client.loop_start()
+
+    def stop(self):
+        if self._client is None: return
+        self._client.disconnect()
+        self._client.loop_stop()
+        self._client = None
+        self.connected = False
+
+    # Signatury callbacků se mezi paho 1.x a 2.x liší, proto *args
+    def _on_connect(self, client, userdata, flags, reason_code, *args):
+        if reason_code == 0:
+            self.connected, self.connected_since, self.last_error = True, time.time(), None
+            # Po (znovu)připojení odběr reportů a jednorázová žádost o plný stav
+            client.subscribe(report_topic(self.serial))
+            client.publish(request_topic(self.serial), json.dumps(payload_pushall()))
+        else:
+            self.connected, self.last_error = False, f"Připojení odmítnuto: {reason_code}"
+
+    def _on_disconnect(self, client, userdata, *args):
+        if self.connected: print(f"[MQTT] Tiskárna {self.printer_id} odpojena")
+        self.connected, self.connected_since = False, None
+        self.attempts += 1
+
+    def _on_connect_fail(self, client, userdata, *args):
+        self.connected, self.last_error = False, "Tiskárna nedostupná"
+        self.attempts += 1
+
+    def _on_message(self, client, userdata, message):
+        if self.on_report is None: return
+        try: report = json.loads(message.payload)
+        except (ValueError, UnicodeDecodeError) as e:
+            print(f"[MQTT] Neplatná zpráva od tiskárny {self.printer_id}: {e}")
+            return
+        try:
+            if isinstance(report, dict): self.on_report(self.printer_id, report)
+        except Exception as e: print(f"[MQTT] Chyba zpracování zprávy od tiskárny {self.printer_id}: {e}")
+
+    def state(self):
+        return {"connected": self.connected, "connected_since": self.connected_since, "last_error": self.last_error, "attempts": self.attempts}
+
+    def publish(self, payload, qos=1, timeout=PUBLISH_TIMEOUT):
+        if self._client is None or not self.connected: return False, "Tiskárna není připojena"
+        if isinstance(payload, dict): payload = json.dumps(payload)
+        info = self._client.publish(request_topic(self.serial), payload, qos=qos)
+        if info.rc != mqtt.MQTT_ERR_SUCCESS: return False, mqtt.error_string(info.rc)
+        try: info.wait_for_publish(timeout)
+        except (RuntimeError, ValueError) as e: return False, str(e)
+        if not info.is_published(): return False, "Tiskárna nepotvrdila příjem"
+        return True, "Příkaz odeslán"
+
+class MqttManager:
+    def __init__(self, on_report=None):
+        # on_report(printer_id, report) se volá z vlákna paho pro každou zprávu z report topicu
+        self.on_report = on_report
+        self._connections = {}
+        self._lock = threading.Lock()
+
+    def sync(self, printers):
+        # Po změně printers.json: nové tiskárny připojí, smazané odpojí, změněné připojí znovu
+        with self._lock:
+            wanted = {p["id"]: p for p in printers if p.get("ip") and p.get("access_code") and p.get("serial")}
+            for printer_id in list(self._connections):
+                connection = self._connections[printer_id]
+                printer = wanted.get(printer_id)
+                if printer is None or connection.config_key() != (printer["ip"], printer["access_code"], printer["serial"]):
+                    connection.stop()
+                    del self._connections[printer_id]
+            for printer_id, printer in wanted.items():
+                if printer_id not in self._connections:
+                    connection = PrinterConnection(printer, self.on_report)
+                    self._connections[printer_id] = connection
+                    connection.start()
+
+    def stop(self):
+        with self._lock:
+            for connection in self._connections.values(): connection.stop()
+            self._connections.clear()
+
+    def get(self, printer_id):
+        with self._lock: return self._connections.get(printer_id)
+
+    def is_connected(self, printer_id):
+        connection = self.get(printer_id)
+        return connection is not None and connection.connected
+
+    def state(self, printer_id):
+        connection = self.get(printer_id)
+        return connection.state() if connection else {"connected": False, "connected_since": None, "last_error": "Tiskárna není nastavena", "attempts": 0}
+
+    def publish(self, printer_id, payload, qos=1):
+        connection = self.get(printer_id)
+        if connection is None: return False, "Tiskárna není nastavena"
+        return connection.publish(payload, qos=qos)
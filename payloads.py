@@ -0,0 +1,80 @@
+import itertools
+import time
+
+# Payloady příkazů pro device/<serial>/request (stejné, jaké posílá Bambu Studio).
+# sequence_id se vrací v odpovědi na report topicu, podle něj se páruje potvrzení.
+USER_ID = "123456789"
+_sequence = itertools.count(int(time.time() * 1000))
+
+def next_sequence_id():
+    # Unikátní i pro příkazy odeslané ve stejné milisekundě
+    return str(next(_sequence))
+
+def payload_gcode_line(line):
+    return {"print": {"command": "gcode_line", "param": line + "\n", "sequence_id": next_sequence_id(), "user_id": USER_ID}}
+
+def payload_home():
+    return payload_gcode_line("G28")
+
+def payload_bed_temp(temp):
+    return payload_gcode_line(f"M140 S{temp}")
+
+def payload_nozzle_temp(temp):
+    return payload_gcode_line(f"M104 S{temp}")
+
+def payload_light(mode):
+    return {"system": {"sequence_id": next_sequence_id(), "command": "ledctrl", "led_node": "chamber_light", "led_mode": mode,
+                       "led_on_time": 500, "led_off_time": 500, "loop_times": 1, "interval_time": 1000}}
+
+def payload_print_control(command):
+    # pause / resume / stop rozpracovaného tisku
+    return {"print": {"command": command, "sequence_id": next_sequence_id(), "param": ""}}
+
+def payload_print_file(remote_name):
+    # Spustí tisk G-kódu nahraného na SD kartu (print_transfer.py)
+    return {"print": {"command": "gcode_file", "param": f"/sdcard/{remote_name}", "sequence_id": next_sequence_id()}}
+
+def payload_pushall():
+    return {"pushing": {"sequence_id": next_sequence_id(), "command": "pushall"}}
+
+def payload_camera(mode):
+    return {"camera": {"mode": mode}}
+
+def _temperature(arg):
+    temp = int(arg)
+    if not 0 <= temp <= 300: raise ValueError("Teplota mimo rozsah 0-300 °C")
+    return temp
+
+# název: (sestavení payloadu z argumentu, potřebuje argument, lze bezpečně zopakovat)
+COMMANDS = {
+    "home": (lambda arg: payload_home(), False, True),
+    "light_on": (lambda arg: payload_light("on"), False, True),
+    "light_off": (lambda arg: payload_light("off"), False, True),
+    "bed_temp": (lambda arg: payload_bed_temp(_temperature(arg)), True, True),
+    "nozzle_temp": (lambda arg: payload_nozzle_temp(_temperature(arg)), True, True),
+    "pause": (lambda arg: payload_print_control("pause"), False, True),
+    "resume": (lambda arg: payload_print_control("resume"), False, True),
+    "stop": (lambda arg: payload_print_control("stop"), False, True),
+    "gcode": (lambda arg: payload_gcode_line(arg), True, False),
+}
+# Hotové sekvence pro celou farmu (příkaz, hodnota)
+FLEET_PRESETS = {
+    "end_of_shift": [("light_off", None), ("bed_temp", "0"), ("nozzle_temp", "0")],
+    "lights_off": [("light_off", None)],
+    "lights_on": [("light_on", None)],
+}
+# Tlačítka v detailu tiskárny posílají G-kódové názvy
+ALIASES = {"G28": "home", "M25": "pause", "M24": "resume", "M112": "stop"}
+
+def build_command(name, arg=None):
+    # Vrací (payload, lze_zopakovat); neznámý příkaz nebo chybný argument -> ValueError
+    name = ALIASES.get(name, name)
+    if name not in COMMANDS: raise ValueError(f"Neznámý příkaz: {name}")
+    builder, needs_arg, idempotent = COMMANDS[name]
+    if needs_arg and arg in (None, ""): raise ValueError(f"Příkaz {name} potřebuje hodnotu")
+    return builder(arg), idempotent
+
+def sequence_id_of(payload):
+    for body in payload.values():
+        if isinstance(body, dict) and "sequence_id" in body: return body["sequence_id"]
+    return None
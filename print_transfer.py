@@ -0,0 +1,159 @@
+import ftplib
+import os
+import re
+import socket
+import ssl
+import threading
+import time
+import uuid
+import zipfile
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+# Odeslání tiskové úlohy: G-kód vybraného plátu se streamuje rovnou z 3MF v knihovně
+# (bez rozbalení na disk a bez načtení do paměti) na SD kartu tiskárny přes implicitní FTPS,
+# potom se přes MQTT spustí tisk. Víc tiskáren najednou, na jednu tiskárnu vždy jen jeden přenos.
+FTP_PORT = 990
+FTP_USERNAME = "bblp"
+FTP_TIMEOUT = 30
+CHUNK_SIZE = 256 * 1024
+TRANSFER_WORKERS = 4
+FINISHED_JOBS_KEPT = 200
+ACTIVE_STATUSES = ("queued", "uploading", "starting")
+
+class ImplicitFTPS(ftplib.FTP_TLS):
+    # Tiskárna mluví TLS hned od připojení (port 990), ftplib umí jen explicitní AUTH TLS
+    def connect(self, host, port=FTP_PORT, timeout=FTP_TIMEOUT, source_address=None):
+        self.host, self.port, self.timeout = host, port, timeout
+        self.sock = self.context.wrap_socket(socket.create_connection((host, port), timeout), server_hostname=host)
+        self.af = self.sock.family
+        self.file = self.sock.makefile('r', encoding=self.encoding)
+        self.welcome = self.getresp()
+        return self.welcome
+
+    def ntransfercmd(self, cmd, rest=None):
+        # Datové spojení musí navázat TLS session řídicího spojení
+        conn, size = ftplib.FTP.ntransfercmd(self, cmd, rest)
+        if self._prot_p: conn = self.context.wrap_socket(conn, server_hostname=self.host, session=self.sock.session)
+        return conn, size
+
+def _insecure_context():
+    # Tiskárny mají certifikát podepsaný vlastní CA, na LAN se neověřuje (stejně jako MQTT)
+    context = ssl.create_default_context()
+    context.check_hostname, context.verify_mode = False, ssl.CERT_NONE
+    return context
+
+def upload_stream(printer, fp, remote_name, progress=None, chunk_size=CHUNK_SIZE, timeout=FTP_TIMEOUT):
+    # fp se čte po kusech chunk_size; progress(poslané_bajty) po každém kusu
+    ftp = ImplicitFTPS(context=_insecure_context(), timeout=timeout)
+    ftp.connect(printer["ip"], int(printer.get("ftp_port") or FTP_PORT), timeout)
+    try:
+        ftp.login(FTP_USERNAME, printer["access_code"])
+        ftp.prot_p()
+        ftp.voidcmd("TYPE I")
+        conn = ftp.transfercmd(f"STOR {remote_name}")
+        try:
+            while True:
+                chunk = fp.read(chunk_size)
+                if not chunk: break
+                conn.sendall(chunk)
+                if progress: progress(len(chunk))
+            # Konec dat bez TLS unwrap: FTP server tiskárny na close_notify neodpovídá a unwrap() (jak ho dělá
+            # ftplib.storbinary) visí do timeoutu. SSLSocket.shutdown() odpojí TLS vrstvu a pošle jen FIN,
+            # zbytek (TLS session ticket od serveru) se dočte jako surová data až do zavření ze strany serveru.
+            # Prosté close() s nepřečtenými daty v bufferu pošle RST a server zahodí konec souboru.
+            # Jestli soubor dorazil celý, rozhoduje odpověď 226 na řídicím spojení, ne tohle čekání.
+            conn.shutdown(socket.SHUT_WR)
+            conn.settimeout(timeout)
+            try:
+                while conn.recv(4096): pass
+            except socket.timeout: pass
+        finally:
+            conn.close()
+        ftp.voidresp()
+    finally:
+        try: ftp.quit()
+        except (OSError, EOFError, ftplib.Error): ftp.close()
+
+def plate_member(plate):
+    return f"Metadata/plate_{int(plate)}.gcode"
+
+def remote_file_name(rel_path, plate):
+    # Jen bezpečné znaky; SD karta tiskárny nemá podsložky pro knihovnu
+    base = re.sub(r"[^\w.-]+", "_", os.path.splitext(os.path.basename(rel_path))[0]).strip("._") or "tisk"
+    return f"{base}_plate_{int(plate)}.gcode"
+
+class PrintTransfers:
+    def __init__(self, start_print, workers=TRANSFER_WORKERS):
+        # start_print(printer_id, remote_name) -> výsledek CommandDispatcher.send
+        self.start_print = start_print
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="print-transfer")
+        self._jobs = OrderedDict()
+        self._changed = threading.Condition()
+        self._printer_locks = {}
+
+    def submit(self, printer, abs_path, rel_path, plate=1, start=True):
+        # Plát se ověří hned, ať chyba (neslicovaný projekt, chybný plát) přijde v odpovědi a ne až z fronty
+        member = plate_member(plate)
+        with zipfile.ZipFile(abs_path) as zf:
+            try: size = zf.getinfo(member).file_size
+            except KeyError: raise ValueError(f"Soubor neobsahuje G-kód plátu {plate} (je projekt vyslicovaný?)")
+        job = {"id": uuid.uuid4().hex, "printer_id": printer["id"], "path": rel_path, "plate": int(plate), "remote_name": remote_file_name(rel_path, plate),
+               "start": bool(start), "status": "queued", "bytes_sent": 0, "total_bytes": size, "bytes_per_second": None, "error": None, "command": None,
+               "queued_at": time.time(), "started_at": None, "finished_at": None}
+        with self._changed:
+            self._jobs[job["id"]] = job
+            self._trim()
+            lock = self._printer_locks.setdefault(printer["id"], threading.Lock())
+        self._executor.submit(self._run, job["id"], dict(printer), abs_path, member, lock)
+        return dict(job)
+
+    def get(self, job_ids=None):
+        with self._changed:
+            if job_ids is None: return [dict(job) for job in self._jobs.values()]
+            return [dict(self._jobs[job_id]) for job_id in job_ids if job_id in self._jobs]
+
+    def wait_for_change(self, job_ids, timeout):
+        # Long-poll jako u fronty zpracování: vrátí se po první změně průběhu nebo po timeoutu
+        with self._changed:
+            if any(self._jobs.get(job_id, {}).get("status") in ACTIVE_STATUSES for job_id in job_ids): self._changed.wait(timeout)
+        return self.get(job_ids)
+
+    def _set(self, job_id, **fields):
+        with self._changed:
+            self._jobs[job_id].update(fields)
+            self._changed.notify_all()
+
+    def _progress(self, job_id, sent):
+        with self._changed:
+            job = self._jobs[job_id]
+            job["bytes_sent"] += sent
+            elapsed = time.time() - job["started_at"]
+            if elapsed > 0: job["bytes_per_second"] = round(job["bytes_sent"] / elapsed)
+            self._changed.notify_all()
+
+    def _trim(self):
+        finished = [job_id for job_id, job in self._jobs.items() if job["status"] not in ACTIVE_STATUSES]
+        for job_id in finished[:max(0, len(finished) - FINISHED_JOBS_KEPT)]: del self._jobs[job_id]
+
+    def _run(self, job_id, printer, abs_path, member, lock):
+        # Jakákoli chyba (i neočekávaná nebo ze start_print) ukončí úlohu stavem error - nesmí zůstat viset v uploading/starting
+        job = self.get([job_id])[0]
+        stage = "Přenos selhal"
+        try:
+            with lock:
+                self._set(job_id, status="uploading", started_at=time.time())
+                with zipfile.ZipFile(abs_path) as zf, zf.open(member) as fp:
+                    upload_stream(printer, fp, job["remote_name"], progress=lambda sent: self._progress(job_id, sent))
+            if not job["start"]:
+                self._set(job_id, status="done", finished_at=time.time())
+                return
+            stage = "Tisk se nespustil"
+            self._set(job_id, status="starting")
+            result = self.start_print(printer["id"], job["remote_name"])
+        except Exception as e:
+            print(f"[TISK] {stage}: {job['remote_name']} na tiskárně {printer['id']}: {e}")
+            self._set(job_id, status="error", error=f"{stage}: {e}", finished_at=time.time())
+            return
+        if result["ok"]: self._set(job_id, status="done", command=result, finished_at=time.time())
+        else: self._set(job_id, status="error", command=result, error=f"Tisk se nespustil: {result['reason'] or result['result']}", finished_at=time.time())
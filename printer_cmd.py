@@ -3,6 +3,7 @@ import ssl
 import time
 import json
 import sys
+from payloads import payload_home, payload_gcode_line, payload_light, payload_bed_temp, payload_nozzle_temp
 
 # ==== KONFIGURACE ====
 BROKER = "10.20.10.174"
@@ -12,47 +13,6 @@ PASSWORD = "39268046"
 CA_CERT = "/home/tron02/printer.cer"
 SERIAL = "01P00A432500021"
 
-# ---- PAYLOADY ----
-def payload_home():
-    return {
-        "print": {
-            "command": "gcode_line",
-            "param": "G28 \n",
-            "sequence_id": str(int(time.time() * 1000)),
-            "user_id": "123456789"
-        }
-    }
-
-def payload_gcode_line(line):
-    return {
-        "print": {
-            "command": "gcode_line",
-            "param": line + "\n",
-            "sequence_id": str(int(time.time() * 1000)),
-            "user_id": "123456789"
-        }
-    }
-
-def payload_light(mode):
-    return {
-        "system": {
-            "sequence_id": str(int(time.time() * 1000)),
-            "command": "ledctrl",
-            "led_node": "chamber_light",
-            "led_mode": mode,
-            "led_on_time": 500,
-            "led_off_time": 500,
-            "loop_times": 1,
-            "interval_time": 1000
-        }
-    }
-
-def payload_bed_temp(temp):
-    return payload_gcode_line(f"M140 S{temp}")
-
-def payload_nozzle_temp(temp):
-    return payload_gcode_line(f"M104 S{temp}")
-
 # ---- MQTT CALLBACKY ----
 def on_connect(client, userdata, flags, rc):
     if rc != 0:
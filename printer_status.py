@@ -0,0 +1,68 @@
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+
+# Stav tiskáren pro dashboard: zjišťuje se souběžně na pozadí a stránka čte jen cache.
+# Celé obnovení má jeden limit REFRESH_DEADLINE s - nedostupná tiskárna nezdrží ostatní.
+STATUS_TTL = 15
+REFRESH_DEADLINE = 3
+PROBE_WORKERS = 8
+
+class PrinterStatusCache:
+    def __init__(self, probe, ttl=STATUS_TTL, deadline=REFRESH_DEADLINE, workers=PROBE_WORKERS):
+        self.probe = probe
+        self.ttl = ttl
+        self.deadline = deadline
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="printer-probe")
+        self._statuses = {}
+        self._lock = threading.Lock()
+        self._refreshing = False
+        self._thread = None
+
+    def _store(self, printer_id, status, started):
+        # Pozdě doběhlá sonda nesmí přepsat novější výsledek
+        with self._lock:
+            current = self._statuses.get(printer_id)
+            if current is None or current[1] <= started: self._statuses[printer_id] = (status, started)
+
+    def refresh(self, printers):
+        started = time.time()
+        futures = {self._executor.submit(self.probe, printer): printer["id"] for printer in printers}
+        for future, printer_id in futures.items():
+            future.add_done_callback(lambda f, pid=printer_id: self._store(pid, "offline" if f.exception() else f.result(), started))
+        _, not_done = wait(futures, timeout=self.deadline)
+        for future in not_done: self._store(futures[future], "offline", started)
+        with self._lock:
+            known = {printer["id"] for printer in printers}
+            for printer_id in [pid for pid in self._statuses if pid not in known]: del self._statuses[printer_id]
+
+    def _refresh_in_background(self, printers):
+        with self._lock:
+            if self._refreshing: return
+            self._refreshing = True
+        def run():
+            try: self.refresh(printers)
+            finally:
+                with self._lock: self._refreshing = False
+        threading.Thread(target=run, name="printer-status-refresh", daemon=True).start()
+
+    def get_all(self, printers):
+        # Vrací hned to, co je v cache; zastaralé nebo chybějící hodnoty se obnoví na pozadí
+        now = time.time()
+        with self._lock: cached = {printer["id"]: self._statuses.get(printer["id"]) for printer in printers}
+        if any(entry is None or now - entry[1] > self.ttl for entry in cached.values()): self._refresh_in_background(printers)
+        return {printer_id: entry[0] if entry else "offline" for printer_id, entry in cached.items()}
+
+    def invalidate(self, printer_id):
+        with self._lock: self._statuses.pop(printer_id, None)
+
+    def start(self, load_printers):
+        # Průběžné obnovování, aby dashboard nikdy nečekal ani na první sondu
+        if self._thread is not None: return
+        def loop():
+            while True:
+                try: self.refresh(load_printers())
+                except Exception as e: print(f"Chyba při zjišťování stavu tiskáren: {e}")
+                time.sleep(self.ttl)
+        self._thread = threading.Thread(target=loop, name="printer-status", daemon=True)
+        self._thread.start()
@@ -1,12 +1,142 @@
+import atexit
 import json
+import os
+import threading
+import time
+from contextlib import contextmanager
 from pathlib import Path
+from workers import WORKER_COUNT, atomic_write, file_lock
 
-DB_FILE = Path(__file__).parent / "printers.json"
+# PRINTERNEST_PRINTERS umožní spustit aplikaci nad jiným seznamem (např. ze simulátoru fake_printers.py)
+DB_FILE = Path(os.environ.get("PRINTERNEST_PRINTERS") or Path(__file__).parent / "printers.json")
+# Změny se zapisují se zpožděním, víc změn za sebou = jeden zápis
+WRITE_DELAY = 0.5
+# Běhový stav (online/offline apod.) do printers.json nepatří
+VOLATILE_FIELDS = ("status",)
+# Víc worker procesů: jak často čtení ověří, jestli soubor nezměnil jiný proces
+RELOAD_INTERVAL = 1.0
+
+class PrinterRegistry:
+    # Seznam tiskáren v paměti: načte se jednou, čtení nesahá na disk a vrací kopie,
+    # změny jdou přes metody registru a na disk se zapisují atomicky (dočasný soubor + rename).
+    # shared=True (víc procesů): změna se dělá pod zámkem souboru nad čerstvě načteným obsahem
+    # a zapíše se hned; čtení nejvýš jednou za RELOAD_INTERVAL ověří, jestli se soubor nezměnil.
+    def __init__(self, path=DB_FILE, write_delay=WRITE_DELAY, shared=False):
+        self.path = Path(path)
+        self.write_delay = write_delay
+        self.shared = shared
+        self._printers = None
+        self._version = None
+        self._checked = 0.0
+        self._lock = threading.RLock()
+        self._timer = None
+        self._dirty = False
+
+    def _file_version(self):
+        try: stat = os.stat(self.path)
+        except FileNotFoundError: return None
+        return stat.st_mtime_ns, stat.st_size, stat.st_ino
+
+    def _read(self):
+        self._version = self._file_version()
+        self._checked = time.monotonic()
+        try:
+            with open(self.path, "r", encoding="utf-8") as f: printers = json.load(f)
+        except FileNotFoundError: printers = []
+        self._printers = [_persistent(p) for p in printers]
+
+    def _loaded(self):
+        if self._printers is None: self._read()
+        elif self.shared and not self._dirty and time.monotonic() - self._checked >= RELOAD_INTERVAL:
+            self._checked = time.monotonic()
+            if self._file_version() != self._version: self._read()
+        return self._printers
+
+    @contextmanager
+    def _mutation(self):
+        # Víc procesů: zámek souboru + čerstvý obsah, ať se nepřepíše změna z jiného workeru
+        with self._lock:
+            if not self.shared:
+                yield
+                return
+            with file_lock(f"{self.path}.lock"):
+                self._read()
+                yield
+
+    def all(self):
+        with self._lock: return [dict(p) for p in self._loaded()]
+
+    def get(self, printer_id):
+        with self._lock: return next((dict(p) for p in self._loaded() if p["id"] == printer_id), None)
+
+    def add(self, fields):
+        with self._mutation():
+            printers = self._loaded()
+            printer = dict(_persistent(fields), id=max((p["id"] for p in printers), default=0) + 1)
+            printers.append(printer)
+            self._changed()
+            return dict(printer)
+
+    def update(self, printer_id, fields):
+        # Vrací upravenou tiskárnu, nebo None když neexistuje
+        with self._mutation():
+            printer = next((p for p in self._loaded() if p["id"] == printer_id), None)
+            if printer is None: return None
+            printer.update(_persistent(fields))
+            printer["id"] = printer_id
+            self._changed()
+            return dict(printer)
+
+    def remove(self, printer_id):
+        with self._mutation():
+            printers = self._loaded()
+            printer = next((p for p in printers if p["id"] == printer_id), None)
+            if printer is None: return None
+            printers.remove(printer)
+            self._changed()
+            return printer
+
+    def replace(self, printers):
+        with self._mutation():
+            self._printers = [_persistent(p) for p in printers]
+            self._changed()
+
+    def refresh(self):
+        # Víc procesů: načíst změnu z jiného workeru hned, ne až po RELOAD_INTERVAL
+        if not self.shared: return
+        with self._lock:
+            if not self._dirty: self._read()
+
+    def _changed(self):
+        self._dirty = True
+        if self.shared: return self.flush()
+        if self._timer is not None: return
+        self._timer = threading.Timer(self.write_delay, self.flush)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def flush(self):
+        with self._lock:
+            if self._timer is not None: self._timer.cancel()
+            self._timer = None
+            if not self._dirty: return
+            self._dirty = False
+            try:
+                atomic_write(self.path, json.dumps(self._printers, indent=2, ensure_ascii=False))
+                self._version = self._file_version()
+            except OSError as e:
+                print(f"Chyba při ukládání {self.path}: {e}")
+                self._dirty = True
+
+def _persistent(printer):
+    return {key: value for key, value in printer.items() if key not in VOLATILE_FIELDS}
+
+registry = PrinterRegistry(shared=WORKER_COUNT > 1)
+# Odložený zápis nesmí při ukončení procesu propadnout
+atexit.register(registry.flush)
 
 def load_printers():
-    with open(DB_FILE, "r") as f:
-        return json.load(f)
+    return registry.all()
 
 def save_printers(printers):
-    with open(DB_FILE, "w") as f:
-        json.dump(printers, f, indent=2, ensure_ascii=False)
+    registry.replace(printers)
@@ -0,0 +1,157 @@
+import bisect
+import threading
+
+# Fasetové vyhledávání v knihovně. Text hledá FTS5 v metadata_index, fasety a filtry běží v paměti:
+# pro každou hodnotu fasety (PETG, A1, 0.2 ...) bitmapa souborů jako Python int (bit = file_id),
+# takže filtr je AND bitmap a počet u fasety je popcount - milisekundy i pro desítky tisíc souborů.
+# Změny se dočítají z logu search_changes (plní ho triggery v SQLite), takže index je aktuální
+# i po zápisu z jiného worker procesu a při změně se načítají jen dotčené soubory.
+SEARCH_FACETS = ("printer_model", "nozzle_diameter", "layer_height", "file_type", "filament_type", "filament_colour", "print_time")
+# Rozsahové filtry (min_/max_) a sloupec hodnoty v řádku faset
+SEARCH_RANGES = {"print_time": 7, "weight": 8}
+PRINT_TIME_BUCKETS = (("do 1 h", 0, 3600), ("1-2 h", 3600, 7200), ("2-4 h", 7200, 14400), ("4-8 h", 14400, 28800), ("nad 8 h", 28800, None))
+FACET_LIMIT = 50
+# Kolik posledních rozsahových filtrů (bitmap) si index pamatuje
+RANGE_CACHE = 64
+# int.bit_count je až od Pythonu 3.10
+_popcount = getattr(int, "bit_count", None) or (lambda bits: bin(bits).count("1"))
+
+def _bitmap(ids):
+    ids = list(ids)
+    if not ids: return 0
+    bits = bytearray((max(ids) >> 3) + 1)
+    for i in ids: bits[i >> 3] |= 1 << (i & 7)
+    return int.from_bytes(bits, "little")
+
+def _print_time_bucket(seconds):
+    if seconds is None: return None
+    return next(label for label, low, high in PRINT_TIME_BUCKETS if high is None or seconds < high)
+
+class SearchIndex:
+    def __init__(self, metadata_index):
+        self.metadata_index = metadata_index
+        self._lock = threading.Lock()
+        self._seq = None
+        self._docs = {}
+        self._postings = {}
+        self._all = 0
+        self._order = None
+        self._range_values = {}
+        self._ranges = {}
+
+    @staticmethod
+    def _doc_values(doc):
+        # Dvojice (faseta, hodnota) jednoho souboru; složka je taky faseta, jen se nevrací v počtech
+        _, folder, _, printer_model, file_type, nozzle, layer, print_time_s, _, filaments = doc
+        values = {("folder", folder), ("print_time", _print_time_bucket(print_time_s))}
+        values |= {("printer_model", printer_model), ("file_type", file_type), ("nozzle_diameter", nozzle), ("layer_height", layer)}
+        values |= {("filament_type", filament_type) for filament_type, _ in filaments} | {("filament_colour", colour) for _, colour in filaments}
+        return [(key, value) for key, value in values if value not in (None, "")]
+
+    def _load_all(self):
+        seq, _, _ = self.metadata_index.search_changes(0)
+        rows = self.metadata_index.facet_rows()
+        postings = {}
+        for doc in rows:
+            for key, value in self._doc_values(doc): postings.setdefault(key, {}).setdefault(value, []).append(doc[0])
+        self._docs = {doc[0]: doc for doc in rows}
+        self._postings = {key: {value: _bitmap(ids) for value, ids in postings.get(key, {}).items()} for key in ("folder",) + SEARCH_FACETS}
+        self._all = _bitmap(self._docs)
+        self._order, self._range_values, self._ranges = None, {}, {}
+        self._seq = seq
+
+    def _remove(self, file_id):
+        doc = self._docs.pop(file_id, None)
+        if doc is None: return
+        mask = ~(1 << file_id)
+        for key, value in self._doc_values(doc):
+            postings = self._postings[key]
+            postings[value] &= mask
+            if not postings[value]: del postings[value]
+        self._all &= mask
+
+    def _add(self, doc):
+        self._docs[doc[0]] = doc
+        bit = 1 << doc[0]
+        for key, value in self._doc_values(doc): self._postings[key][value] = self._postings[key].get(value, 0) | bit
+        self._all |= bit
+
+    def refresh(self):
+        # Dočte změny od posledního hledání (před každým dotazem; při startu procesu načte vše předem)
+        with self._lock: self._refresh()
+
+    def _refresh(self):
+        if self._seq is None: return self._load_all()
+        seq, changed, complete = self.metadata_index.search_changes(self._seq)
+        if not complete: return self._load_all()
+        if not changed: return
+        for file_id in changed: self._remove(file_id)
+        for doc in self.metadata_index.facet_rows(changed): self._add(doc)
+        self._order, self._range_values, self._ranges = None, {}, {}
+        self._seq = seq
+
+    def _filter_parts(self, filters):
+        # Bitmapa pro každý zadaný filtr zvlášť; fasety pak kombinují všechny kromě vlastního
+        parts = {}
+        folder = (filters.get("folder") or "").replace("\\", "/").strip("/")
+        if folder: parts["folder"] = _or(bits for name, bits in self._postings["folder"].items() if name == folder or name.startswith(folder + "/"))
+        for key in SEARCH_FACETS:
+            values = filters.get(key) or []
+            if not values: continue
+            if key in ("nozzle_diameter", "layer_height"): values = [round(float(v), 3) for v in values]
+            elif key == "filament_type": values = [str(v).strip().upper() for v in values]
+            elif key == "filament_colour": values = [str(v).strip().lstrip("#").upper()[:6] for v in values]
+            parts[key] = _or(self._postings[key].get(v, 0) for v in values)
+        for key, column in SEARCH_RANGES.items():
+            low, high = filters.get(f"min_{key}"), filters.get(f"max_{key}")
+            if low is None and high is None: continue
+            # Obě meze včetně: min_print_time=3600&max_print_time=3600 najde soubor s přesně 3600 s
+            if (key, low, high) not in self._ranges:
+                if key not in self._range_values: self._range_values[key] = sorted((doc[column], doc[0]) for doc in self._docs.values() if doc[column] is not None)
+                values = self._range_values[key]
+                start = 0 if low is None else bisect.bisect_left(values, (low, -1))
+                end = len(values) if high is None else bisect.bisect_right(values, (high, float("inf")))
+                if len(self._ranges) >= RANGE_CACHE: self._ranges.pop(next(iter(self._ranges)))
+                self._ranges[(key, low, high)] = _bitmap(file_id for _, file_id in values[start:end])
+            parts[f"{key}_range"] = self._ranges[(key, low, high)]
+        return parts
+
+    def _ordered(self):
+        # Bez textu se řadí podle názvu; seřazený seznam se drží, dokud se knihovna nezmění
+        if self._order is None: self._order = [doc[0] for doc in sorted(self._docs.values(), key=lambda doc: (doc[2].lower(), doc[0]))]
+        return self._order
+
+    def search(self, text="", filters=None, limit=50, offset=0):
+        # Vrací (stránka záznamů z indexu, celkový počet, fasety s počty). Počty u fasety berou ohled na všechny
+        # ostatní filtry, ne na její vlastní - v UI jde zaškrtnout víc hodnot jedné fasety najednou.
+        filters = filters or {}
+        matches = self.metadata_index.text_matches(text)
+        with self._lock:
+            self._refresh()
+            text_bits = _bitmap(matches) if matches is not None else self._all
+            parts = self._filter_parts(filters)
+            result = _and(parts.values(), text_bits)
+            found = result.to_bytes((result.bit_length() >> 3) + 1, "little")
+            hits = (file_id for file_id in (self._ordered() if matches is None else matches) if file_id >> 3 < len(found) and found[file_id >> 3] >> (file_id & 7) & 1)
+            page = [file_id for _, file_id in zip(range(offset + limit), hits)][offset:]
+            facets = {}
+            for key in SEARCH_FACETS:
+                base = _and((bits for part, bits in parts.items() if part != key), text_bits) if key in parts else result
+                counts = [(value, _popcount(bits & base)) for value, bits in self._postings[key].items()]
+                if key == "print_time":
+                    counts = dict(counts)
+                    # max je včetně (celé sekundy), takže min_/max_print_time z bucketu vrátí přesně jeho soubory
+                    facets[key] = [{"value": label, "min": low, "max": None if high is None else high - 1, "count": counts.get(label, 0)} for label, low, high in PRINT_TIME_BUCKETS]
+                else:
+                    facets[key] = [{"value": value, "count": count} for value, count in sorted(counts, key=lambda item: (-item[1], str(item[0]))) if count][:FACET_LIMIT]
+            total = _popcount(result)
+        return self.metadata_index.entries_by_id(page), total, facets
+
+def _or(bitmaps):
+    result = 0
+    for bits in bitmaps: result |= bits
+    return result
+
+def _and(bitmaps, result):
+    for bits in bitmaps: result &= bits
+    return result
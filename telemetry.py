@@ -0,0 +1,134 @@
+import json
+import threading
+import time
+
+# Živý stav tiskáren z device/<serial>/report. Tiskárna posílá push_status většinou jen jako
+# rozdíl (třeba jen bed_temper nebo wifi_signal), plný stav jen občas (msg 0 / pushall),
+# proto se zprávy slučují do jednoho stavu na tiskárnu.
+ENVELOPE_FIELDS = ("command", "msg", "sequence_id")
+# Posílání změn klientům (SSE): nejvýš MAX_RATE událostí za sekundu na klienta,
+# změny mezi tím se slučují; při nečinnosti jen občasný keep-alive
+MAX_RATE = 2.0
+KEEPALIVE_SECONDS = 25
+KEEPALIVE_EVENT = ": keep-alive\n\n"
+
+def merge_delta(state, delta):
+    # Slovníky se slučují rekurzivně, ostatní hodnoty (i seznamy, např. AMS) se nahrazují celé.
+    # Vrací názvy polí nejvyšší úrovně, která se opravdu změnila. Hodnoty se kopírují: zprávu
+    # ještě drží záznamník telemetrie a další delta by jinak přepsala i ji.
+    changed = set()
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(state.get(key), dict):
+            if merge_delta(state[key], value): changed.add(key)
+        elif state.get(key) != value or key not in state:
+            state[key] = _copy(value)
+            changed.add(key)
+    return changed
+
+class PrinterState:
+    __slots__ = ("fields", "updated_at", "messages")
+
+    def __init__(self):
+        self.fields = {}
+        self.updated_at = None
+        self.messages = 0
+
+class Subscription:
+    # Odběr změn pro jednoho klienta; drží jen názvy změněných polí, hodnoty se čtou až při odeslání
+    def __init__(self, printer_ids=None, listener=None):
+        # listener() se volá po každé změně (z vlákna MQTT) - pro asyncio klienty místo blokujícího wait()
+        self.printer_ids = set(printer_ids) if printer_ids else None
+        self.listener = listener
+        self._pending = {}
+        self._changed = threading.Condition()
+
+    def notify(self, printer_id, fields):
+        if self.printer_ids is not None and printer_id not in self.printer_ids: return
+        with self._changed:
+            self._pending.setdefault(printer_id, set()).update(fields)
+            self._changed.notify()
+        if self.listener: self.listener()
+
+    def wait(self, timeout):
+        # Vrací {printer_id: {pole}} nasbírané od minulého volání (prázdné po timeoutu)
+        with self._changed:
+            if not self._pending: self._changed.wait(timeout)
+            pending, self._pending = self._pending, {}
+        return pending
+
+class TelemetryStore:
+    def __init__(self):
+        self._states = {}
+        self._lock = threading.Lock()
+        self._subscriptions = set()
+
+    def apply(self, printer_id, report):
+        # Zpracuje jednu zprávu z report topicu; vrací změněná pole
+        status = report.get("print")
+        if not isinstance(status, dict) or status.get("command") != "push_status": return set()
+        delta = {key: value for key, value in status.items() if key not in ENVELOPE_FIELDS}
+        with self._lock:
+            state = self._states.setdefault(printer_id, PrinterState())
+            changed = merge_delta(state.fields, delta)
+            state.updated_at = time.time()
+            state.messages += 1
+            subscriptions = list(self._subscriptions) if changed else []
+        for subscription in subscriptions: subscription.notify(printer_id, changed)
+        return changed
+
+    def subscribe(self, printer_ids=None, listener=None):
+        subscription = Subscription(printer_ids, listener)
+        with self._lock: self._subscriptions.add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self._lock: self._subscriptions.discard(subscription)
+
+    def stream(self, printer_ids, rate=MAX_RATE, keepalive=KEEPALIVE_SECONDS):
+        # Generátor SSE zpráv: nejdřív celý stav, pak jen změněná pole, nejvýš `rate` zpráv za sekundu
+        subscription = self.subscribe(printer_ids)
+        min_interval = stream_interval(rate)
+        try:
+            yield from self.snapshot_events(printer_ids)
+            while True:
+                pending = subscription.wait(keepalive)
+                if not pending:
+                    yield KEEPALIVE_EVENT
+                    continue
+                yield from self.update_events(pending)
+                # Změny, které přijdou během pauzy, se sloučí do další zprávy
+                time.sleep(min_interval)
+        finally:
+            self.unsubscribe(subscription)
+
+    def snapshot_events(self, printer_ids):
+        for printer_id in printer_ids:
+            state = self.get(printer_id)
+            if state: yield _sse("snapshot", dict(state, printer_id=printer_id))
+
+    def update_events(self, pending):
+        for printer_id, fields in pending.items():
+            state = self.get(printer_id, fields)
+            if state: yield _sse("update", dict(state, printer_id=printer_id))
+
+    def get(self, printer_id, fields=None):
+        # Kopie stavu (případně jen vybraná pole), aby volající nedržel sdílený slovník
+        with self._lock:
+            state = self._states.get(printer_id)
+            if state is None: return None
+            values = state.fields if fields is None else {key: state.fields[key] for key in fields if key in state.fields}
+            return {"fields": _copy(values), "updated_at": state.updated_at, "messages": state.messages}
+
+    def forget(self, printer_id):
+        with self._lock: self._states.pop(printer_id, None)
+
+def stream_interval(rate):
+    return 1.0 / max(min(rate, MAX_RATE), 0.01)
+
+def _sse(event, data):
+    return f"event: {event}\ndata: {json.dumps(data, separators=(',', ':'))}\n\n"
+
+def _copy(value):
+    if isinstance(value, dict): return {key: _copy(item) for key, item in value.items()}
+    if isinstance(value, list): return [_copy(item) for item in value]
+    return value
@@ -0,0 +1,211 @@
+import math
+import threading
+import time
+from array import array
+
+# Historie telemetrie v paměti s pevnou velikostí: kruhové buffery z modulu array pro každou
+# tiskárnu a veličinu ve třech rozlišeních - surové vzorky, minutové průměry a hodinové průměry
+# s min/max. Hodnoty jsou int16 v desetinách, surové časy uint32 v desetinách sekundy od prvního
+# vzorku a intervaly se ukládají podle svého pořadového čísla, takže jejich časy se neukládají vůbec.
+# Veličina má předem alokovaných ~43 kB (hodina surových vzorků, 3 dny minut, 90 dní hodin),
+# tiskárna se všemi veličinami ~260 kB; přepisují se nejstarší data.
+METRICS = ("nozzle_temper", "nozzle_target_temper", "bed_temper", "bed_target_temper", "wifi_signal", "mc_percent")
+RESOLUTIONS = {"raw": 0, "1m": 60, "1h": 3600}
+CAPACITY = {"raw": 3600, "1m": 3 * 24 * 60, "1h": 90 * 24}
+# Automatická volba rozlišení podle délky dotazovaného rozsahu (s); minuty pokrývají celou svou kapacitu
+AUTO_RESOLUTION = (("raw", 3600), ("1m", 3 * 24 * 3600), ("1h", None))
+# Tiskárna posílá jen změněná pole, hodnota tedy platí až do dalšího vzorku (sample-and-hold).
+# Déle než HOLD_LIMIT se nedrží, aby výpadek spojení nevyplnil graf poslední známou hodnotou.
+HOLD_LIMIT = 15 * 60
+# Teploty, procenta i dBm se v desetinách vejdou do int16; MISSING značí interval bez dat
+SCALE = 10
+MISSING = -32768
+
+def metric_value(value):
+    # wifi_signal chodí jako "-52dBm", ostatní jako čísla nebo číselné řetězce
+    if isinstance(value, str): value = value.replace("dBm", "").strip()
+    try: return float(value)
+    except (TypeError, ValueError): return None
+
+def _encode(value):
+    return max(-32767, min(32767, round(value * SCALE)))
+
+def _decode(value):
+    return value / SCALE
+
+class Ring:
+    # Surové vzorky podle času (přidává se jen na konec), takže dotaz na rozsah je bisekce
+    def __init__(self, capacity, base):
+        self.capacity = capacity
+        self.base = base
+        self.times = array('I', bytes(4 * capacity))
+        self.values = array('h', bytes(2 * capacity))
+        self.head = 0
+        self.count = 0
+
+    def append(self, ts, value):
+        self.times[self.head] = int((ts - self.base) * SCALE)
+        self.values[self.head] = _encode(value)
+        self.head = (self.head + 1) % self.capacity
+        self.count = min(self.count + 1, self.capacity)
+
+    def _slot(self, i):
+        return (self.head - self.count + i) % self.capacity
+
+    def _bisect(self, ts):
+        offset = (ts - self.base) * SCALE
+        lo, hi = 0, self.count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self.times[self._slot(mid)] < offset: lo = mid + 1
+            else: hi = mid
+        return lo
+
+    def query(self, start, end):
+        slots = [self._slot(i) for i in range(self._bisect(start), self._bisect(end))]
+        return [self.base + self.times[s] / SCALE for s in slots], [[_decode(self.values[s]) for s in slots]]
+
+    def nbytes(self):
+        return self.times.itemsize * len(self.times) + self.values.itemsize * len(self.values)
+
+class BucketRing:
+    # Interval n leží ve slotu n % capacity; přeskočené intervaly se vyplní MISSING
+    def __init__(self, step, capacity, columns):
+        self.step, self.capacity = step, capacity
+        self.columns = [array('h', [MISSING]) * capacity for _ in range(columns)]
+        self.latest = None
+
+    def put(self, start, *values):
+        n = start // self.step
+        if self.latest is not None:
+            if n <= self.latest - self.capacity: return
+            for skipped in range(max(self.latest + 1, n - self.capacity), n):
+                for column in self.columns: column[skipped % self.capacity] = MISSING
+        for column, value in zip(self.columns, values): column[n % self.capacity] = _encode(value)
+        self.latest = n if self.latest is None else max(self.latest, n)
+
+    def query(self, start, end):
+        # Intervaly se začátkem v <start, end), jen ty, které ring ještě drží
+        times, columns = [], [[] for _ in self.columns]
+        if self.latest is None: return times, columns
+        first = max(math.ceil(start / self.step), self.latest - self.capacity + 1)
+        last = min(math.ceil(end / self.step), self.latest + 1)
+        for n in range(first, last):
+            slot = n % self.capacity
+            if self.columns[0][slot] == MISSING: continue
+            times.append(n * self.step)
+            for values, column in zip(columns, self.columns): values.append(_decode(column[slot]))
+        return times, columns
+
+    def nbytes(self):
+        return sum(column.itemsize * len(column) for column in self.columns)
+
+class Bucket:
+    # Průměr je vážený dobou (s), po kterou hodnota v intervalu platila
+    __slots__ = ("start", "total", "weight", "low", "high", "last")
+
+    def __init__(self, start):
+        self.start, self.total, self.weight, self.low, self.high, self.last = start, 0.0, 0.0, None, None, None
+
+    def add(self, value, weight, low=None, high=None):
+        self.total += value * weight
+        self.weight += weight
+        self.last = value
+        low, high = value if low is None else low, value if high is None else high
+        self.low = low if self.low is None else min(self.low, low)
+        self.high = high if self.high is None else max(self.high, high)
+
+    def average(self):
+        return self.total / self.weight if self.weight else self.last
+
+class MetricSeries:
+    def __init__(self, ts):
+        # Minuty slouží jen pro graf průměru, min/max drží hodinové intervaly
+        self.rings = {"raw": Ring(CAPACITY["raw"], int(ts)), "1m": BucketRing(RESOLUTIONS["1m"], CAPACITY["1m"], 1),
+                      "1h": BucketRing(RESOLUTIONS["1h"], CAPACITY["1h"], 3)}
+        self.buckets = {"1m": None, "1h": None}
+        self.last = None
+
+    def add(self, ts, value):
+        # Čas nesmí jít zpět (posun hodin), jinak by nefungovala bisekce
+        if self.last is not None: ts = max(ts, self.last[0])
+        self.rings["raw"].append(ts, value)
+        if self.last is not None: self._hold(self.last[0], min(ts, self.last[0] + HOLD_LIMIT), self.last[1])
+        # Nový vzorek se hned promítne do min/max, jeho váhu doplní až další vzorek
+        self._aggregate("1m", ts, value, 0, value, value)
+        self.last = (ts, value)
+
+    def _hold(self, since, until, value):
+        # Předchozí hodnota do každé minuty, přes kterou platila, s váhou délky překryvu
+        step = RESOLUTIONS["1m"]
+        while since < until:
+            end = min(until, int(since) - int(since) % step + step)
+            self._aggregate("1m", since, value, end - since, value, value)
+            since = end
+
+    def _aggregate(self, resolution, ts, value, weight, low, high):
+        start = int(ts) - int(ts) % RESOLUTIONS[resolution]
+        bucket = self.buckets[resolution]
+        if bucket is not None and bucket.start != start:
+            self._close(resolution, bucket)
+            bucket = None
+        if bucket is None: bucket = self.buckets[resolution] = Bucket(start)
+        bucket.add(value, weight, low, high)
+
+    def _close(self, resolution, bucket):
+        average = bucket.average()
+        self.rings[resolution].put(bucket.start, average, bucket.low, bucket.high)
+        # Hodinové hodnoty vznikají z uzavřených minut (vážené dobou platnosti hodnot)
+        if resolution == "1m": self._aggregate("1h", bucket.start, average, bucket.weight, bucket.low, bucket.high)
+
+    def query(self, resolution, start, end):
+        times, columns = self.rings[resolution].query(start, end)
+        result = {"t": times, "v": columns[0]}
+        if resolution == "raw": return result
+        if len(columns) == 3: result["min"], result["max"] = columns[1], columns[2]
+        # Rozpracovaný interval se vrací taky, jinak by poslední minuta/hodina v grafu chyběla
+        bucket = self.buckets[resolution]
+        if bucket is not None and start <= bucket.start < end:
+            result["t"].append(bucket.start)
+            result["v"].append(bucket.average())
+            if "min" in result:
+                result["min"].append(bucket.low)
+                result["max"].append(bucket.high)
+        return result
+
+    def nbytes(self):
+        return sum(ring.nbytes() for ring in self.rings.values())
+
+class TelemetryHistory:
+    def __init__(self, metrics=METRICS):
+        self.metrics = metrics
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def record(self, printer_id, fields, ts=None):
+        # fields: změněná pole z TelemetryStore; ukládají se jen sledované číselné veličiny
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            for metric in self.metrics:
+                if metric not in fields: continue
+                value = metric_value(fields[metric])
+                if value is None: continue
+                series = self._series.get((printer_id, metric))
+                if series is None: series = self._series[(printer_id, metric)] = MetricSeries(ts)
+                series.add(ts, value)
+
+    def query(self, printer_id, metric, start, end, resolution="auto"):
+        if resolution == "auto":
+            resolution = next(name for name, max_range in AUTO_RESOLUTION if max_range is None or end - start <= max_range)
+        with self._lock:
+            series = self._series.get((printer_id, metric))
+            result = series.query(resolution, start, end) if series else {"t": [], "v": []}
+        return dict(result, metric=metric, resolution=resolution)
+
+    def memory_bytes(self, printer_id):
+        with self._lock:
+            return sum(series.nbytes() for (pid, _), series in self._series.items() if pid == printer_id)
+
+    def forget(self, printer_id):
+        with self._lock:
+            for key in [key for key in self._series if key[0] == printer_id]: del self._series[key]
@@ -0,0 +1,223 @@
+import argparse
+import atexit
+import collections
+import datetime
+import gzip
+import json
+import os
+import threading
+import time
+import zlib
+
+# Záznam všech zpráv z tiskáren na disk (náhrada mqtt_capture.py / mqtt_light_sniffer.py).
+# Zprávy se sbírají v paměti a zapisují po dávkách; každá dávka je samostatný gzip člen
+# připojený na konec segmentu. Vedle segmentu je řídký index (jeden řádek na dávku: pozice,
+# časový rozsah, tiskárny), takže čtení skočí rovnou na dávky v daném čase a pro danou tiskárnu.
+# Segmenty se střídají podle velikosti a stáří, nejstarší se mažou nad RETENTION_BYTES.
+#   zcat ~/printserver/telemetry/*.jsonl.gz | grep ...      (segment je běžný gzip)
+#   python telemetry_recorder.py read --since "2025-08-11 18:00" --printer 1 --format log
+DEFAULT_DIR = os.path.expanduser("~/printserver/telemetry")
+SEGMENT_PREFIX = "telemetry-"
+SEGMENT_EXT = ".jsonl.gz"
+INDEX_EXT = ".idx"
+FLUSH_INTERVAL = 5.0
+FLUSH_RECORDS = 5000
+# Když zápis nestíhá nebo selhává, drží se v paměti nejvýš tolik zpráv; nejstarší se zahazují
+MAX_BUFFER_RECORDS = 100000
+MAX_SEGMENT_BYTES = 32 * 1024 * 1024
+MAX_SEGMENT_AGE = 3600
+RETENTION_BYTES = 2 * 1024 * 1024 * 1024
+COMPRESS_LEVEL = 6
+
+class TelemetryRecorder:
+    def __init__(self, directory=DEFAULT_DIR, flush_interval=FLUSH_INTERVAL, flush_records=FLUSH_RECORDS,
+                 max_segment_bytes=MAX_SEGMENT_BYTES, max_segment_age=MAX_SEGMENT_AGE, retention_bytes=RETENTION_BYTES,
+                 max_buffer_records=MAX_BUFFER_RECORDS):
+        self.directory = directory
+        self.flush_interval, self.flush_records = flush_interval, flush_records
+        self.max_segment_bytes, self.max_segment_age = max_segment_bytes, max_segment_age
+        self.retention_bytes = retention_bytes
+        self._buffer = collections.deque(maxlen=max_buffer_records)
+        self.dropped = 0
+        self._lock = threading.Lock()
+        self._write_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stopping = False
+        self._thread = None
+        self._segment = self._index = None
+        self._segment_started = None
+
+    def record(self, printer_id, report, serial=None, ts=None):
+        # Volá se z vlákna MQTT; jen přidá zprávu do bufferu, zápis dělá vlákno na pozadí
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            if len(self._buffer) == self._buffer.maxlen: self.dropped += 1
+            self._buffer.append((ts, printer_id, serial, report))
+            full = len(self._buffer) >= self.flush_records
+        if full: self._wake.set()
+
+    def start(self):
+        if self._thread is not None: return
+        os.makedirs(self.directory, exist_ok=True)
+        self._thread = threading.Thread(target=self._run, name="telemetry-recorder", daemon=True)
+        self._thread.start()
+        atexit.register(self.stop)
+
+    def stop(self):
+        self._stopping = True
+        self._wake.set()
+        if self._thread is not None: self._thread.join(timeout=10)
+        self.flush()
+        with self._write_lock: self._close_segment()
+
+    def _run(self):
+        while not self._stopping:
+            self._wake.wait(self.flush_interval)
+            self._wake.clear()
+            # Chyba jedné dávky (disk, neserializovatelná zpráva) nesmí ukončit vlákno; dávka se zahodí
+            try: self.flush()
+            except Exception as e: print(f"[TELEMETRIE] Chyba zápisu záznamu: {e}")
+
+    def flush(self):
+        with self._lock:
+            batch, dropped = list(self._buffer), self.dropped
+            self._buffer.clear()
+            self.dropped = 0
+        if dropped: print(f"[TELEMETRIE] Plný buffer, zahozeno {dropped} nejstarších zpráv")
+        if not batch: return
+        lines = [json.dumps({"t": round(ts, 3), "printer": printer_id, "serial": serial, "report": report}, separators=(",", ":"), ensure_ascii=False)
+                 for ts, printer_id, serial, report in batch]
+        member = gzip.compress(("\n".join(lines) + "\n").encode("utf-8"), compresslevel=COMPRESS_LEVEL)
+        entry = {"t0": round(batch[0][0], 3), "t1": round(batch[-1][0], 3), "printers": sorted({str(item[1]) for item in batch}), "records": len(batch)}
+        with self._write_lock:
+            if self._segment is None: self._open_segment(batch[0][0])
+            try:
+                entry["offset"], entry["length"] = self._segment.tell(), len(member)
+                self._segment.write(member)
+                self._segment.flush()
+                # Index až po datech: čtenář nikdy nenajde záznam ukazující na nezapsaný člen
+                self._index.write(json.dumps(entry, separators=(",", ":")) + "\n")
+                self._index.flush()
+            except OSError:
+                # Po chybě zápisu není pozice v segmentu jistá; další dávka začne nový segment
+                for f in (self._segment, self._index):
+                    try: f.close()
+                    except OSError: pass
+                self._segment = self._index = None
+                raise
+            if self._segment.tell() >= self.max_segment_bytes or time.time() - self._segment_started >= self.max_segment_age:
+                self._close_segment()
+                self._prune()
+
+    def _open_segment(self, ts):
+        name = SEGMENT_PREFIX + datetime.datetime.fromtimestamp(ts).strftime("%Y%m%d-%H%M%S")
+        base, n = os.path.join(self.directory, name), 1
+        while os.path.exists(base + SEGMENT_EXT):
+            base, n = os.path.join(self.directory, f"{name}_{n}"), n + 1
+        self._segment = open(base + SEGMENT_EXT, "ab")
+        self._index = open(base + INDEX_EXT, "a", encoding="utf-8")
+        self._segment_started = time.time()
+
+    def _close_segment(self):
+        if self._segment is None: return
+        self._segment.close()
+        self._index.close()
+        self._segment = self._index = None
+
+    def _prune(self):
+        segments = list_segments(self.directory)
+        sizes = [os.path.getsize(path) for path in segments]
+        total = sum(sizes)
+        for path, size in zip(segments, sizes):
+            if total <= self.retention_bytes: break
+            for file_path in (path, index_path(path)):
+                try: os.remove(file_path)
+                except FileNotFoundError: pass
+            total -= size
+
+def index_path(segment_path):
+    return segment_path[:-len(SEGMENT_EXT)] + INDEX_EXT
+
+def list_segments(directory=DEFAULT_DIR):
+    # Názvy začínají časem vzniku, takže abecední pořadí je i časové
+    try: names = sorted(name for name in os.listdir(directory) if name.startswith(SEGMENT_PREFIX) and name.endswith(SEGMENT_EXT))
+    except FileNotFoundError: return []
+    return [os.path.join(directory, name) for name in names]
+
+def _index_entries(segment_path):
+    try:
+        with open(index_path(segment_path), encoding="utf-8") as f:
+            entries = []
+            for line in f:
+                try: entries.append(json.loads(line))
+                except ValueError: break  # useknutý poslední řádek po pádu
+            return entries
+    except FileNotFoundError: return []
+
+def read_records(directory=DEFAULT_DIR, start=None, end=None, printer_id=None):
+    # Záznamy v rozsahu <start, end> (unix čas), volitelně jen pro jednu tiskárnu.
+    # Rozbalí se jen dávky, které podle indexu do rozsahu a k tiskárně patří.
+    printer = None if printer_id is None else str(printer_id)
+    for segment_path in list_segments(directory):
+        entries = [entry for entry in _index_entries(segment_path)
+                   if (start is None or entry["t1"] >= start) and (end is None or entry["t0"] <= end) and (printer is None or printer in entry["printers"])]
+        if not entries: continue
+        with open(segment_path, "rb") as f:
+            for entry in entries:
+                f.seek(entry["offset"])
+                data = zlib.decompressobj(wbits=31).decompress(f.read(entry["length"]))
+                for line in data.decode("utf-8").splitlines():
+                    record = json.loads(line)
+                    if start is not None and record["t"] < start: continue
+                    if end is not None and record["t"] > end: continue
+                    if printer is not None and str(record["printer"]) != printer: continue
+                    yield record
+
+def format_log_line(record):
+    # Stejný formát jako původní light_capture.log (lze přehrát simulátorem fake_printers.py)
+    ts = datetime.datetime.fromtimestamp(record["t"]).strftime("%Y-%m-%d %H:%M:%S")
+    topic = f"device/{record['serial'] or record['printer']}/report"
+    return f"[{ts}] {topic}: {json.dumps(record['report'], separators=(',', ':'), ensure_ascii=False)}"
+
+def _parse_time(value):
+    if value is None: return None
+    try: return float(value)
+    except ValueError: return datetime.datetime.fromisoformat(value).timestamp()
+
+def _record_printers(args):
+    from mqtt_manager import MqttManager
+    from printers import load_printers
+    recorder = TelemetryRecorder(args.dir)
+    serials = {}
+    manager = MqttManager(on_report=lambda printer_id, report: recorder.record(printer_id, report, serials.get(printer_id)))
+    printers = load_printers()
+    serials.update({printer["id"]: printer.get("serial") for printer in printers})
+    recorder.start()
+    manager.sync(printers)
+    print(f"[TELEMETRIE] Zaznamenávám {len(serials)} tiskáren do {args.dir}")
+    try:
+        while True: time.sleep(1)
+    except KeyboardInterrupt: pass
+    finally:
+        manager.stop()
+        recorder.stop()
+
+def _read(args):
+    for record in read_records(args.dir, _parse_time(args.since), _parse_time(args.until), args.printer):
+        print(format_log_line(record) if args.format == "log" else json.dumps(record, ensure_ascii=False))
+
+def main():
+    parser = argparse.ArgumentParser(description="Záznam zpráv z tiskáren (dávkový zápis, rotace, gzip, řídký index)")
+    parser.add_argument("--dir", default=DEFAULT_DIR, help="adresář se segmenty")
+    commands = parser.add_subparsers(dest="command", required=True)
+    commands.add_parser("record", help="připojit se ke všem tiskárnám z printers.json a zaznamenávat")
+    reader = commands.add_parser("read", help="vypsat záznamy z časového rozsahu")
+    reader.add_argument("--since", help="začátek (unix čas nebo ISO, např. 2025-08-11T18:00)")
+    reader.add_argument("--until", help="konec (unix čas nebo ISO)")
+    reader.add_argument("--printer", help="ID tiskárny")
+    reader.add_argument("--format", choices=("json", "log"), default="json")
+    args = parser.parse_args()
+    _record_printers(args) if args.command == "record" else _read(args)
+
+if __name__ == "__main__":
+    main()
@@ -1,27 +1,6 @@
 import zipfile
-from io import StringIO
 import sys
-import re
-
-# Stále stejná funkce pro parsování
-def parse_gcode_header_params(gcode_content_stream):
-    params = {}
-    try:
-        lines = gcode_content_stream.readlines()
-        for line in lines[:2000]:
-            if isinstance(line, bytes):
-                line = line.decode('utf-8', 'ignore')
-            line = line.strip()
-            if line.startswith(';'):
-                if "=" in line:
-                    parts = line.lstrip('; ').split('=', 1)
-                    if len(parts) == 2:
-                        key = parts[0].strip()
-                        value = parts[1].strip().strip('"')
-                        params[key] = value
-    except Exception as e:
-        print(f"Chyba při parsování G-kódu: {e}")
-    return params
+from gcode_header import parse_zip_gcode_header
 
 # Hlavní část skriptu
 if __name__ == "__main__":
@@ -44,8 +23,7 @@ if __name__ == "__main__":
             gcode_filename = gcode_files[0]
             print(f"--- Zpracovávám první plát ({gcode_filename}) ---")
 
-            gcode_content = zf.read(gcode_filename).decode('utf-8', 'ignore')
-            params = parse_gcode_header_params(StringIO(gcode_content))
+            params = parse_zip_gcode_header(zf, gcode_filename)
 
             if not params:
                 print("V hlavičce nebyly nalezeny žádné parametry.")
@@ -0,0 +1,68 @@
+import hashlib
+import io
+import os
+import pytest
+from chunked_upload import ChunkedUploads, OffsetMismatch, SessionSuperseded, PART_SUFFIX
+
+@pytest.fixture
+def uploads(tmp_path):
+    return ChunkedUploads(str(tmp_path / "state"))
+
+def test_resume_and_finalize(uploads, tmp_path):
+    dest = str(tmp_path / "lib" / "model.3mf")
+    data = os.urandom(3000)
+    session = uploads.create(dest, "model.3mf", len(data), "v1")
+    uploads.write(session["id"], 0, io.BytesIO(data[:1000]))
+    # Stejný cíl, velikost a otisk = navázání od potvrzeného offsetu
+    resumed = uploads.create(dest, "model.3mf", len(data), "v1")
+    assert resumed["id"] == session["id"] and resumed["offset"] == 1000
+    with pytest.raises(OffsetMismatch):
+        uploads.write(session["id"], 0, io.BytesIO(data))
+    # Nová instance (restart serveru) dopočítá hash z už zapsané části
+    restarted = ChunkedUploads(uploads.state_dir)
+    restarted.write(session["id"], 1000, io.BytesIO(data[1000:]))
+    done = restarted.finalize(session["id"])
+    assert done["complete"] and done["content_hash"] == hashlib.sha256(data).hexdigest()
+    with open(dest, "rb") as f: assert f.read() == data
+
+def test_new_version_supersedes_unfinished_session(uploads, tmp_path):
+    dest = str(tmp_path / "lib" / "model.3mf")
+    old = uploads.create(dest, "model.3mf", 2000, "v1")
+    uploads.write(old["id"], 0, io.BytesIO(b"a" * 1000))
+    new = uploads.create(dest, "model.3mf", 1500, "v2")
+    assert new["id"] != old["id"]
+    # Starý klient nesmí psát do .upload_part nové relace
+    with pytest.raises(SessionSuperseded):
+        uploads.write(old["id"], 1000, io.BytesIO(b"a" * 1000))
+    with pytest.raises(SessionSuperseded):
+        uploads.finalize(old["id"])
+    uploads.write(new["id"], 0, io.BytesIO(b"b" * 1500))
+    uploads.abort(old["id"])
+    assert os.path.getsize(dest + PART_SUFFIX) == 1500
+    uploads.finalize(new["id"])
+    with open(dest, "rb") as f: assert f.read() == b"b" * 1500
+
+def test_abort_removes_part_file(uploads, tmp_path):
+    dest = str(tmp_path / "lib" / "model.3mf")
+    session = uploads.create(dest, "model.3mf", 10, "")
+    assert uploads.abort(session["id"])
+    assert not os.path.exists(dest + PART_SUFFIX) and uploads.get(session["id"]) is None
+    with pytest.raises(KeyError):
+        uploads.write(session["id"], 0, io.BytesIO(b"x"))
+
+def test_parallel_writes_from_two_workers(uploads, tmp_path):
+    # Dvě instance = dva procesy: stejnou část smí zapsat jen jeden, druhý dostane OffsetMismatch
+    import threading
+    other = ChunkedUploads(uploads.state_dir)
+    dest = str(tmp_path / "lib" / "model.3mf")
+    data = os.urandom(4 * 1024 * 1024)
+    session = uploads.create(dest, "model.3mf", len(data), "v1")
+    results = []
+    def put(instance):
+        try: results.append(instance.write(session["id"], 0, io.BytesIO(data))["offset"])
+        except OffsetMismatch as e: results.append(("mismatch", e.offset))
+    threads = [threading.Thread(target=put, args=(instance,)) for instance in (uploads, other)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    assert sorted(results, key=str) == sorted([len(data), ("mismatch", len(data))], key=str)
+    assert other.finalize(session["id"])["content_hash"] == hashlib.sha256(data).hexdigest()
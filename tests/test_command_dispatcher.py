@@ -0,0 +1,149 @@
+import threading
+import time
+import pytest
+import command_dispatcher
+from command_dispatcher import CommandDispatcher
+from payloads import payload_light, payload_home, sequence_id_of
+
+class FakeFleet:
+    # Místo MQTT: zapamatuje si odeslané příkazy a podle nastavení tiskárny pošle potvrzení do handle_report
+    def __init__(self):
+        self.sent = []
+        self.reply = {}  # printer_id -> funkce(payload, pokus) -> [(zpoždění, report), ...]
+        self.offline = set()
+        self.slow = {}  # printer_id -> jak dlouho publish blokuje (s)
+        self.dispatcher = None
+
+    def publish(self, printer_id, payload):
+        if printer_id in self.offline: return False, "Tiskárna není připojena"
+        time.sleep(self.slow.get(printer_id, 0))
+        self.sent.append((printer_id, sequence_id_of(payload)))
+        attempt = sum(1 for pid, _ in self.sent if pid == printer_id)
+        for delay, report in self.reply.get(printer_id, lambda p, a: [])(payload, attempt):
+            threading.Timer(delay, self.dispatcher.handle_report, (printer_id, report)).start()
+        return True, "Odesláno"
+
+def ack(payload, result="success", reason=None, sequence_id=None):
+    section = next(iter(payload))
+    body = {"command": payload[section].get("command"), "sequence_id": sequence_id or sequence_id_of(payload), "result": result}
+    if reason: body["reason"] = reason
+    return {section: body}
+
+@pytest.fixture
+def fleet():
+    fleet = FakeFleet()
+    fleet.dispatcher = CommandDispatcher(fleet.publish, ack_timeout=0.3, retries=1)
+    return fleet
+
+def test_ack_is_matched_by_sequence_id(fleet):
+    fleet.reply[1] = lambda payload, attempt: [(0.05, ack(payload))]
+    result = fleet.dispatcher.send(1, payload_light("on"))
+    assert result["ok"] and result["result"] == "success" and result["attempts"] == 1
+    assert result["sequence_id"] == fleet.sent[0][1] and 40 <= result["latency_ms"] < 300
+
+def test_failed_ack_carries_reason(fleet):
+    fleet.reply[1] = lambda payload, attempt: [(0, ack(payload, "failed", "heatbed error"))]
+    result = fleet.dispatcher.send(1, payload_home())
+    assert not result["ok"] and result["result"] == "failed" and result["reason"] == "heatbed error"
+
+def test_foreign_acks_are_ignored(fleet):
+    # Jiné sequence_id, jiná tiskárna se stejným sequence_id, push_status a zpráva bez result nic nepotvrdí
+    def replies(payload, attempt):
+        sequence_id = sequence_id_of(payload)
+        return [(0, ack(payload, sequence_id="999999")),
+                (0, {"print": {"command": "push_status", "sequence_id": sequence_id, "result": "success"}}),
+                (0, {"print": {"command": "gcode_line", "sequence_id": sequence_id}})]
+    fleet.reply[1] = replies
+    result = fleet.dispatcher.send(1, payload_home())
+    assert result["result"] == "timeout" and result["attempts"] == 1  # pohyb se neopakuje
+
+def test_ack_from_other_printer_does_not_count(fleet):
+    payload = payload_home()
+    threading.Timer(0.05, fleet.dispatcher.handle_report, (2, ack(payload))).start()
+    assert fleet.dispatcher.send(1, payload)["result"] == "timeout"
+
+def test_idempotent_command_is_retried_with_new_sequence_id(fleet):
+    fleet.reply[1] = lambda payload, attempt: [(0, ack(payload))] if attempt == 2 else []
+    result = fleet.dispatcher.send(1, payload_light("off"), idempotent=True)
+    assert result["ok"] and result["attempts"] == 2
+    first, second = [sequence_id for _, sequence_id in fleet.sent]
+    assert first != second and result["sequence_id"] == second
+
+def test_late_ack_of_first_attempt_completes_retry(fleet):
+    # Potvrzení prvního pokusu dorazí až během opakování - příkaz je hotový, nečeká se na druhé
+    fleet.reply[1] = lambda payload, attempt: [(0.4, ack(payload))] if attempt == 1 else []
+    result = fleet.dispatcher.send(1, payload_light("on"), idempotent=True)
+    assert result["ok"] and result["attempts"] == 2 and result["latency_ms"] < 300
+
+def test_ack_after_send_returned_is_dropped(fleet):
+    fleet.reply[1] = lambda payload, attempt: [(0.5, ack(payload))]
+    result = fleet.dispatcher.send(1, payload_home())
+    assert result["result"] == "timeout"
+    time.sleep(0.3)
+    assert fleet.dispatcher._pending == {}
+    assert fleet.dispatcher.metrics(1)["results"] == {"timeout": 1}
+
+def test_duplicate_ack_keeps_first_result(fleet):
+    fleet.reply[1] = lambda payload, attempt: [(0, ack(payload)), (0.02, ack(payload, "failed", "duplicate"))]
+    result = fleet.dispatcher.send(1, payload_light("on"))
+    time.sleep(0.05)
+    assert result["ok"] and result["reason"] is None
+    assert fleet.dispatcher.metrics(1)["results"] == {"success": 1}
+
+def test_unreachable_printer_is_not_sent(fleet, monkeypatch):
+    monkeypatch.setattr(command_dispatcher, "RETRY_DELAY", 0.01)
+    fleet.offline.add(1)
+    result = fleet.dispatcher.send(1, payload_light("on"), idempotent=True)
+    assert result["result"] == "not_sent" and result["reason"] == "Tiskárna není připojena" and result["attempts"] == 2
+    assert fleet.sent == []
+
+def test_latency_histogram(fleet):
+    fleet.reply[1] = lambda payload, attempt: [(0.03 if attempt == 1 else 0.12, ack(payload))]
+    fleet.dispatcher.send(1, payload_light("on"))
+    fleet.dispatcher.send(1, payload_light("off"))
+    fleet.reply[1] = lambda payload, attempt: []
+    fleet.dispatcher.send(1, payload_home())
+    metrics = fleet.dispatcher.metrics(1)
+    assert metrics["acked"] == 2 and metrics["results"] == {"success": 2, "timeout": 1}
+    buckets = metrics["buckets_ms"]
+    assert buckets["le_50"] == 1 and buckets["le_250"] == 1 and sum(buckets.values()) == 2
+    assert 30 <= metrics["mean_ms"] < 250
+    assert fleet.dispatcher.metrics(2) == {"buckets_ms": {**{f"le_{b}": 0 for b in command_dispatcher.LATENCY_BUCKETS_MS}, "inf": 0}, "acked": 0, "mean_ms": None, "results": {}}
+    assert set(fleet.dispatcher.metrics()) == {1}
+
+def test_batch_reports_each_printer(fleet, monkeypatch):
+    monkeypatch.setattr(command_dispatcher, "RETRY_DELAY", 0.01)
+    # 1 a 2 potvrzují, 3 potvrdí až druhý pokus, 4 mlčí, 5 hlásí chybu, 6 není připojená
+    for printer_id in (1, 2, 5): fleet.reply[printer_id] = lambda payload, attempt: [(0.02, ack(payload))]
+    fleet.reply[3] = lambda payload, attempt: [(0, ack(payload))] if attempt == 2 else []
+    fleet.reply[5] = lambda payload, attempt: [(0.02, ack(payload, "failed", "door open"))]
+    fleet.offline.add(6)
+    jobs = {printer_id: [(payload_light("on"), True), (payload_home(), False)] for printer_id in range(1, 7)}
+    started = time.monotonic()
+    table = fleet.dispatcher.send_batch(jobs, deadline=3)
+    # Tiskárny běží souběžně: celkem zhruba jako nejpomalejší z nich, ne jako součet
+    assert time.monotonic() - started < 2
+    assert set(table) == set(jobs)
+    assert table[1]["ok"] and table[2]["ok"]
+    assert [r["result"] for r in table[1]["results"]] == ["success", "success"]
+    assert [(r["result"], r["attempts"]) for r in table[3]["results"]] == [("success", 2), ("timeout", 1)]
+    assert not table[4]["ok"] and [r["result"] for r in table[4]["results"]] == ["timeout", "timeout"]
+    assert [r["reason"] for r in table[5]["results"]] == ["door open", "door open"] and not table[5]["ok"]
+    assert [r["result"] for r in table[6]["results"]] == ["not_sent", "not_sent"]
+    # Příkazy jedné tiskárny jdou po sobě: druhý se pošle až po vyřízení prvního
+    assert [sequence_id for pid, sequence_id in fleet.sent if pid == 1] == [sequence_id_of(payload) for payload, _ in jobs[1]]
+
+def test_batch_deadline_marks_unfinished_printers(fleet, monkeypatch):
+    monkeypatch.setattr(command_dispatcher, "RETRY_DELAY", 0.3)
+    # 1: pomalé odesílání, na poslední příkazy nezbyde čas; 2: potvrzuje hned; 3: publish visí přes celý limit
+    fleet.reply[1] = fleet.reply[2] = lambda payload, attempt: [(0, ack(payload))]
+    fleet.slow[1], fleet.slow[3] = 0.2, 2
+    jobs = {1: [(payload_home(), False) for _ in range(4)], 2: [(payload_home(), False)], 3: [(payload_home(), False)]}
+    started = time.monotonic()
+    table = fleet.dispatcher.send_batch(jobs, deadline=0.5)
+    assert time.monotonic() - started < 1
+    assert table[2]["ok"] and not table[1]["ok"] and not table[3]["ok"]
+    results = table[1]["results"]
+    assert len(results) == 4 and [r["result"] for r in results[:2]] == ["success", "success"]
+    assert results[-1]["reason"] == "Vypršel časový limit dávky" and results[-1]["attempts"] == 0
+    assert table[3]["results"] == [{"ok": False, "result": "timeout", "reason": "Vypršel časový limit dávky", "latency_ms": None, "attempts": None, "sequence_id": None}]
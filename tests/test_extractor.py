@@ -0,0 +1,32 @@
+from extractor import _parse_slice_info, _parse_model_settings
+
+SLICE_INFO = """<config>
+  <plate>
+    <metadata key="index" value="1"/>
+    <metadata key="prediction" value="1800"/>
+    <metadata key="weight" value="12.5"/>
+    <metadata key="weight" value="99"/>
+    <object identify_id="7" name="kostka"><metadata key="prediction" value="5"/></object>
+    <filament id="2" type="PLA" color="#FF0000"/>
+  </plate>
+  <plate>
+    <object><metadata key="index" value="9"/></object>
+  </plate>
+</config>"""
+
+MODEL_SETTINGS = """<config>
+  <plate>
+    <metadata key="plater_id" value="1"/>
+    <metadata key="plater_name" value="Díly"/>
+    <model_instance><metadata key="plater_id" value="5"/><metadata key="object_id" value="3"/></model_instance>
+  </plate>
+</config>"""
+
+def test_plate_metadata_reads_direct_children_first_match():
+    # Stejně jako původní find(): první výskyt klíče, metadata vnořených objektů se nepočítají
+    info = _parse_slice_info(SLICE_INFO)
+    assert info["plates"] == {"1": {"prediction": "1800", "weight": "12.5", "filament_id": "2"}}
+    assert info["filaments"] == {"2": {"type": "PLA", "color": "FF0000"}}
+
+def test_plate_names_ignore_instance_metadata():
+    assert _parse_model_settings(MODEL_SETTINGS)["plate_names"] == {"1": "Díly"}
@@ -0,0 +1,36 @@
+import os
+import pytest
+import folder_scanner
+from folder_scanner import scan_files
+
+@pytest.fixture
+def files(tmp_path):
+    # Prázdné "archivy" stačí - zajímá nás pool, ne obsah
+    paths = []
+    for i in range(folder_scanner.PARALLEL_THRESHOLD + 2):
+        path = tmp_path / f"model_{i}.3mf"
+        path.write_bytes(b"neni zip")
+        paths.append(str(path))
+    yield paths
+    folder_scanner.shutdown()
+
+def test_pool_is_reused_between_listings(files):
+    first = list(scan_files(files))
+    pool = folder_scanner._pool
+    second = list(scan_files(files))
+    assert folder_scanner._pool is pool
+    assert sorted(r["abs_path"] for r in first) == sorted(r["abs_path"] for r in second) == sorted(files)
+    assert all(r["record"]["error"] for r in second)
+
+def test_stuck_file_times_out_and_pool_is_replaced(files, tmp_path):
+    # Čtení z FIFO bez zapisovatele visí navždy - jako zaseknutý archiv
+    stuck = str(tmp_path / "stuck.3mf")
+    os.mkfifo(stuck)
+    list(scan_files(files))
+    pool = folder_scanner._pool
+    results = {r["abs_path"]: r for r in scan_files(files + [stuck], timeout=3)}
+    assert set(results) == set(files + [stuck])
+    assert results[stuck]["error"] == "Časový limit při čtení archivu"
+    assert folder_scanner._pool is not pool
+    # Další výpis si založí nový pool a funguje
+    assert len(list(scan_files(files))) == len(files)
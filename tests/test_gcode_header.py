@@ -0,0 +1,20 @@
+import io
+from gcode_header import parse_gcode_header_params, iter_header_lines, MAX_LINE_LENGTH
+
+HEADER = b"; HEADER_BLOCK_START\n; total layer number: 42\n; HEADER_BLOCK_END\n; CONFIG_BLOCK_START\n; nozzle_diameter = 0.4\n; CONFIG_BLOCK_END\nG28\n"
+
+def test_header_params():
+    params = parse_gcode_header_params(HEADER + b"G1 X1\n" * 1000)
+    assert params["total layer number"] == "42" and params["nozzle_diameter"] == "0.4"
+
+def test_overlong_line_is_skipped_to_its_end():
+    # Konec dlouhého řádku nesmí vypadat jako nový řádek hlavičky
+    long_line = b"; thumbnail = " + b"A" * (2 * MAX_LINE_LENGTH) + b"; layer_height = 9.9\n"
+    params = parse_gcode_header_params(b"; HEADER_BLOCK_START\n" + long_line + HEADER)
+    assert "layer_height" not in params and "A" * 100 not in "".join(params)
+    assert params["total layer number"] == "42" and params["nozzle_diameter"] == "0.4"
+
+def test_overlong_line_in_small_chunks():
+    long_line = b"; x = " + b"B" * (2 * MAX_LINE_LENGTH) + b"; y = 1\n"
+    lines = list(iter_header_lines(io.BytesIO(long_line + b"; z = 2\n"), chunk_size=4096))
+    assert lines == ["; z = 2"]
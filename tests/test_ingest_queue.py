@@ -0,0 +1,50 @@
+import sqlite3
+import threading
+import time
+import pytest
+from ingest_queue import IngestQueue, QueueFull
+
+# Dvě instance nad stejnou databází = dva worker procesy
+
+@pytest.fixture
+def db_path(tmp_path):
+    return str(tmp_path / "ingest_jobs.sqlite3")
+
+def test_job_visible_from_other_worker(db_path):
+    release = threading.Event()
+    processing = IngestQueue(lambda abs_path: release.wait(10), db_path)
+    other = IngestQueue(lambda abs_path: None, db_path)
+    job = processing.submit("/lib/a.3mf", "a.3mf") if processing.reserve(1) else None
+    assert other.is_active("a.3mf")
+    assert other.get([job["id"]])[0]["status"] in ("queued", "running")
+    threading.Timer(0.2, release.set).start()
+    # Long-poll v jiném procesu si změnu všimne i bez notifikace
+    started = time.monotonic()
+    done = other.wait_for_change([job["id"]], 10)[0]
+    assert done["status"] == "done" and time.monotonic() - started < 5
+    assert not other.is_active("a.3mf")
+
+def test_handler_error_is_recorded(db_path):
+    def fail(abs_path): raise ValueError("poškozený archiv")
+    queue = IngestQueue(fail, db_path)
+    queue.reserve(1)
+    job = queue.submit("/lib/b.3mf", "b.3mf")
+    job = queue.wait_for_change([job["id"]], 10)[0]
+    assert job["status"] == "error" and job["error"] == "poškozený archiv"
+    assert queue.has_capacity()
+
+def test_jobs_of_dead_process_are_failed(db_path):
+    queue = IngestQueue(lambda abs_path: None, db_path)
+    conn = sqlite3.connect(db_path)
+    # PID, který neexistuje (nad pid_max)
+    with conn: conn.execute("INSERT INTO ingest_jobs (id, path, status, pid, queued_at) VALUES ('dead', 'c.3mf', 'running', 99999999, 0)")
+    assert not queue.is_active("c.3mf")
+    assert queue.get(["dead"])[0]["status"] == "error"
+
+def test_capacity(db_path):
+    queue = IngestQueue(lambda abs_path: None, db_path, capacity=2)
+    queue.reserve(2)
+    with pytest.raises(QueueFull):
+        queue.reserve(1)
+    queue.release(2)
+    assert queue.has_capacity()
@@ -0,0 +1,127 @@
+import os
+import threading
+import time
+import pytest
+import library_watcher
+from library_watcher import LibraryWatcher
+
+SETTLE = 0.2
+
+class Calls(list):
+    def wait_for(self, count, timeout=3):
+        deadline = time.monotonic() + timeout
+        while len(self) < count and time.monotonic() < deadline: time.sleep(0.01)
+        return list(self)
+
+@pytest.fixture
+def library(tmp_path, monkeypatch):
+    # Bez inotify: události jdou rovnou do fronty, kterou jinak plní watchdog
+    monkeypatch.setattr(library_watcher, "POLL_INTERVAL", 0.02)
+    root = tmp_path / "files"
+    root.mkdir()
+    calls, results = Calls(), {}
+    def changed(path):
+        calls.append(("changed", path))
+        result = results.get(path, True)
+        if isinstance(result, Exception): raise result
+        return result.pop(0) if isinstance(result, list) else result
+    watcher = LibraryWatcher(str(root), on_changed=changed, on_deleted=lambda p: calls.append(("deleted", p)),
+                             on_moved=lambda s, d: calls.append(("moved", s, d)), on_folder_deleted=lambda p: calls.append(("folder_deleted", p)),
+                             on_folder_moved=lambda s, d: calls.append(("folder_moved", s, d)), ignore=lambda p: "thumbnails" in p, settle=SETTLE)
+    thread = threading.Thread(target=watcher._run, daemon=True)
+    thread.start()
+    def event(event_type, src, dst="", is_directory=False):
+        watcher._events.put((event_type, is_directory, str(src), str(dst)))
+    yield root, event, calls, results
+    watcher._events.put(None)
+    thread.join(2)
+
+def write(path, data=b"x"):
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(data)
+    return path
+
+def test_burst_of_writes_is_processed_once_after_settling(library):
+    root, event, calls, _ = library
+    path = write(root / "a.3mf")
+    started = time.monotonic()
+    event("created", path)
+    for _ in range(5):
+        time.sleep(SETTLE / 4)
+        event("modified", path)
+    assert calls.wait_for(1) == [("changed", str(path))]
+    assert time.monotonic() - started >= SETTLE * 2
+    time.sleep(SETTLE * 1.5)
+    assert len(calls) == 1
+
+def test_file_deleted_before_settling_is_not_processed(library):
+    root, event, calls, _ = library
+    path = write(root / "a.3mf")
+    event("created", path)
+    path.unlink()
+    event("deleted", path)
+    time.sleep(SETTLE * 2)
+    assert calls == [("deleted", str(path))]
+
+def test_temporary_name_is_processed_under_final_name(library):
+    # Slicer/SMB: zápis do dočasného souboru a přejmenování - zpracuje se jen cílový soubor
+    root, event, calls, _ = library
+    tmp, final = write(root / "sub" / "~a.tmp"), root / "sub" / "a.3mf"
+    event("created", tmp)
+    os.rename(tmp, final)
+    event("moved", tmp, final)
+    assert calls.wait_for(1) == [("changed", str(final))]
+
+def test_moves_into_out_of_and_within_library(library, tmp_path):
+    root, event, calls, _ = library
+    outside = write(tmp_path / "elsewhere" / "b.3mf")
+    event("moved", root / "a.3mf", root / "archiv" / "a.3mf")
+    event("moved", root / "c.3mf", outside)
+    incoming = write(root / "d.3mf")
+    event("moved", tmp_path / "elsewhere" / "d.3mf", incoming)
+    event("created", root / "thumbnails" / "x.png")
+    assert calls.wait_for(3) == [("moved", str(root / "a.3mf"), str(root / "archiv" / "a.3mf")), ("deleted", str(root / "c.3mf")), ("changed", str(incoming))]
+
+def test_folder_move_and_delete_carry_pending_files(library):
+    root, event, calls, _ = library
+    old, new = root / "old", root / "new"
+    event("created", write(old / "a.3mf"))
+    event("created", write(old / "gone" / "b.3mf"))
+    os.rename(old, new)
+    event("moved", old, new, is_directory=True)
+    event("deleted", new / "gone", is_directory=True)
+    assert calls.wait_for(3) == [("folder_moved", str(old), str(new)), ("folder_deleted", str(new / "gone")), ("changed", str(new / "a.3mf"))]
+
+def test_folder_moved_into_library_is_walked(library):
+    root, event, calls, _ = library
+    folder = root / "zakazka"
+    write(folder / "a.3mf")
+    write(folder / "sub" / "b.3mf")
+    write(folder / "thumbnails" / "c.png")
+    event("created", folder, is_directory=True)
+    assert sorted(calls.wait_for(2)) == [("changed", str(folder / "a.3mf")), ("changed", str(folder / "sub" / "b.3mf"))]
+    time.sleep(SETTLE)
+    assert len(calls) == 2
+
+def test_false_means_retry_later(library):
+    # Plná fronta ingestu: on_changed vrátí False a soubor se zkusí znovu po dalším intervalu klidu
+    root, event, calls, results = library
+    path = write(root / "a.3mf")
+    results[str(path)] = [False, False, True]
+    started = time.monotonic()
+    event("created", path)
+    assert calls.wait_for(3) == [("changed", str(path))] * 3
+    assert time.monotonic() - started >= SETTLE * 3
+    time.sleep(SETTLE * 1.5)
+    assert len(calls) == 3
+
+def test_callback_error_does_not_stop_watcher(library):
+    root, event, calls, results = library
+    broken, ok = write(root / "broken.3mf"), write(root / "ok.3mf")
+    results[str(broken)] = RuntimeError("poškozený archiv")
+    event("created", broken)
+    event("created", ok)
+    # Chybný soubor se nezkouší dokola a neblokuje ostatní; další změna ho zpracuje znovu
+    assert sorted(calls.wait_for(2)) == [("changed", str(broken)), ("changed", str(ok))]
+    time.sleep(SETTLE * 1.5)
+    assert len(calls) == 2
@@ -0,0 +1,91 @@
+import sqlite3
+import pytest
+from metadata_index import MetadataIndex, QuotaExceeded, usage_total
+
+# Spuštění:  pytest
+
+@pytest.fixture
+def index(tmp_path):
+    return MetadataIndex(str(tmp_path / "metadata_index.sqlite3"))
+
+def usage_rows(index):
+    # Součty udržované triggery musí sedět s výpočtem nad celou tabulkou files
+    conn = sqlite3.connect(index.db_path)
+    counted = {row[0]: row[1:] for row in conn.execute("SELECT folder, COUNT(*), SUM(size), SUM(COALESCE(thumb_bytes, 0)), SUM(COALESCE(extra_bytes, 0)) FROM files GROUP BY folder")}
+    kept = {row[0]: row[1:] for row in conn.execute("SELECT folder, files, original_bytes, thumbnail_bytes, extra_bytes FROM folder_usage")}
+    assert kept == counted
+    return kept
+
+def test_upsert_existing_row_after_pending(index):
+    # Výpis neindexované složky: nejdřív add_pending, pak upsert stejného řádku, pak znovu (nová verze souboru)
+    index.add_pending([("zakaznik/a.3mf", 1.0, 100)])
+    index.upsert("zakaznik/a.3mf", 1.0, 100, "hash1", 5, {"thumbnails": []}, {"printer_model": "A1", "print_time_s": 600})
+    index.upsert("zakaznik/a.3mf", 2.0, 150, "hash2", 5, {"thumbnails": []}, {"printer_model": "P1S", "print_time_s": 900})
+    entry = index.get("zakaznik/a.3mf")
+    assert entry["size"] == 150 and entry["content_hash"] == "hash2"
+    assert usage_rows(index) == {"zakaznik": (1, 150, 0, 0)}
+
+def test_add_pending_resets_indexed_row(index):
+    index.upsert("a.3mf", 1.0, 100, "hash", 5, {}, {"printer_model": "A1"})
+    index.add_pending([("a.3mf", 2.0, 120)])
+    assert index.folder_states("") == {"a.3mf": (2.0, 120, 0)}
+    assert usage_rows(index) == {"": (1, 120, 0, 0)}
+
+def test_usage_follows_move_rename_and_delete(index):
+    for path in ("a/x.3mf", "a/b/y.3mf", "c/z.3mf"): index.upsert(path, 1.0, 100, None, 5, {}, {})
+    index.set_usage("a/x.3mf", 30, 7)
+    assert usage_rows(index)["a"] == (1, 100, 30, 7)
+    index.move("a/x.3mf", "c/x.3mf")
+    assert usage_rows(index) == {"a/b": (1, 100, 0, 0), "c": (2, 200, 30, 7)}
+    index.move_folder("a", "d")
+    assert set(usage_rows(index)) == {"d/b", "c"}
+    index.delete("c/x.3mf")
+    index.delete_folder("d")
+    assert usage_rows(index) == {"c": (1, 100, 0, 0)}
+
+def test_usage_built_for_existing_database(index):
+    index.upsert("a/x.3mf", 1.0, 100, None, 5, {}, {})
+    conn = sqlite3.connect(index.db_path)
+    conn.executescript("DROP TABLE folder_usage; DROP TRIGGER files_usage_insert; DROP TRIGGER files_usage_delete; DROP TRIGGER files_usage_update;")
+    conn.close()
+    reopened = MetadataIndex(index.db_path)
+    assert usage_rows(reopened) == {"a": (1, 100, 0, 0)}
+
+def test_quota_covers_subfolders(index):
+    index.upsert("zakaznik/a.3mf", 1.0, 600, None, 5, {}, {})
+    index.upsert("zakaznik/sub/b.3mf", 1.0, 300, None, 5, {}, {})
+    index.set_usage("zakaznik/sub/b.3mf", 50, 0)
+    index.set_quota("zakaznik", 1000)
+    index.check_quota("zakaznik/sub", 50)
+    with pytest.raises(QuotaExceeded) as error:
+        index.check_quota("zakaznik/sub", 51)
+    assert error.value.folder == "zakaznik" and error.value.used_bytes == 950
+    index.check_quota("jinde", 10 ** 9)
+    index.set_quota("zakaznik", None)
+    index.check_quota("zakaznik/sub", 10 ** 9)
+
+def test_quota_moves_with_folder(index):
+    index.upsert("zakaznik/a.3mf", 1.0, 600, None, 5, {}, {})
+    index.set_quota("zakaznik", 1000)
+    index.set_quota("zakaznik/sub", 10)
+    index.move_folder("zakaznik", "archiv/zakaznik")
+    assert index.quotas() == {"archiv/zakaznik": 1000, "archiv/zakaznik/sub": 10}
+    index.delete_folder("archiv")
+    assert index.quotas() == {}
+
+def test_usage_total():
+    assert usage_total({"original_bytes": 1, "thumbnail_bytes": 2, "extra_bytes": 3}) == 6
+
+def test_quota_counts_replaced_file_as_freed(index):
+    # Plná složka: nahrazení souboru stejně velkou verzí projde, větší verze ne
+    index.upsert("zakaznik/a.3mf", 1.0, 600, None, 5, {}, {})
+    index.upsert("zakaznik/b.3mf", 1.0, 300, None, 5, {}, {})
+    index.set_usage("zakaznik/a.3mf", 100, 0)
+    index.set_quota("zakaznik", 1000)
+    with pytest.raises(QuotaExceeded):
+        index.check_quota("zakaznik", 600)
+    index.check_quota("zakaznik", 700, replaced=["zakaznik/a.3mf"])
+    index.check_quota("zakaznik", 1000, replaced=["zakaznik/a.3mf", "/zakaznik/b.3mf", "zakaznik/b.3mf"])
+    with pytest.raises(QuotaExceeded) as error:
+        index.check_quota("zakaznik", 701, replaced=["zakaznik/a.3mf", "zakaznik/novy.3mf"])
+    assert error.value.used_bytes == 300
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import shutil
+import ssl
+import threading
+import time
+import zipfile
+import pytest
+from fake_printers import FakePrinter, ensure_certificate
+from print_transfer import PrintTransfers, ACTIVE_STATUSES, remote_file_name
+
+# Přenos tiskových souborů proti FTPS simulátoru z fake_printers.py (implicitní TLS na volném portu)
+
+@pytest.fixture(scope="module")
+def fake_printer(tmp_path_factory):
+    if shutil.which("openssl") is None: pytest.skip("simulátor potřebuje openssl pro certifikát")
+    cert_path, key_path = ensure_certificate(str(tmp_path_factory.mktemp("cert")))
+    context = ssl.SSLContext(ssl.PROTOCOL_TLS_SERVER)
+    context.load_cert_chain(cert_path, key_path)
+    loop = asyncio.new_event_loop()
+    thread = threading.Thread(target=loop.run_forever, daemon=True)
+    thread.start()
+    printer = FakePrinter(1, "127.0.0.1", [], 0)
+    printer.sdcard = str(tmp_path_factory.mktemp("sdcard"))
+    server = asyncio.run_coroutine_threadsafe(printer.serve_ftp(context, 0), loop).result(10)
+    yield printer, {"id": 1, "ip": "127.0.0.1", "access_code": printer.access_code, "ftp_port": server.sockets[0].getsockname()[1]}
+    loop.call_soon_threadsafe(server.close)
+    loop.call_soon_threadsafe(loop.stop)
+    thread.join(5)
+
+@pytest.fixture
+def project(tmp_path):
+    # 3MF s G-kódem plátu 1 přes několik kusů CHUNK_SIZE
+    gcode = b"".join(b"G1 X%d Y%d E0.05\n" % (i % 250, i % 200) for i in range(60000))
+    path = tmp_path / "Držák kola.3mf"
+    with zipfile.ZipFile(path, "w", zipfile.ZIP_DEFLATED) as zf: zf.writestr("Metadata/plate_1.gcode", gcode)
+    return str(path), gcode
+
+def started(printer, calls):
+    # Jako CommandDispatcher.send: tiskárna odmítne spustit soubor, který nemá na kartě
+    def start_print(printer_id, remote_name):
+        calls.append((printer_id, remote_name))
+        reason = printer._reject_reason({"command": "gcode_file", "param": remote_name})
+        return {"ok": reason is None, "result": "failed" if reason else "success", "reason": reason}
+    return start_print
+
+def finished(transfers, job, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        current = transfers.wait_for_change([job["id"]], 1)[0]
+        if current["status"] not in ACTIVE_STATUSES: return current
+    raise AssertionError(f"Úloha {job['id']} neskončila: {current}")
+
+def test_upload_then_start_print(fake_printer, project):
+    printer, entry = fake_printer
+    path, gcode = project
+    calls = []
+    transfers = PrintTransfers(started(printer, calls))
+    job = finished(transfers, transfers.submit(entry, path, "zakaznik/Držák kola.3mf", plate=1))
+    assert job["status"] == "done" and job["error"] is None
+    assert job["bytes_sent"] == job["total_bytes"] == len(gcode)
+    assert job["remote_name"] == "Držák_kola_plate_1.gcode"
+    assert calls == [(1, job["remote_name"])] and job["command"]["ok"]
+    with open(os.path.join(printer.sdcard, printer.serial, job["remote_name"]), "rb") as f: assert f.read() == gcode
+
+def test_upload_without_start(fake_printer, project):
+    printer, entry = fake_printer
+    calls = []
+    transfers = PrintTransfers(started(printer, calls))
+    job = finished(transfers, transfers.submit(entry, project[0], "a.3mf", start=False))
+    assert job["status"] == "done" and calls == []
+
+def test_missing_plate_is_rejected_on_submit(fake_printer, project):
+    transfers = PrintTransfers(started(fake_printer[0], []))
+    with pytest.raises(ValueError):
+        transfers.submit(fake_printer[1], project[0], "a.3mf", plate=2)
+    assert transfers.get() == []
+
+def test_wrong_access_code(fake_printer, project):
+    printer, entry = fake_printer
+    calls = []
+    transfers = PrintTransfers(started(printer, calls))
+    job = finished(transfers, transfers.submit(dict(entry, access_code="spatny"), project[0], "b.3mf"))
+    assert job["status"] == "error" and job["error"].startswith("Přenos selhal") and calls == []
+
+def test_printer_unreachable(fake_printer, project):
+    transfers = PrintTransfers(started(fake_printer[0], []))
+    job = finished(transfers, transfers.submit(dict(fake_printer[1], ftp_port=1), project[0], "c.3mf"))
+    assert job["status"] == "error" and job["error"].startswith("Přenos selhal")
+
+def test_start_rejected_by_printer(fake_printer, project):
+    transfers = PrintTransfers(lambda printer_id, remote_name: {"ok": False, "result": "failed", "reason": "file not found"})
+    job = finished(transfers, transfers.submit(fake_printer[1], project[0], "d.3mf"))
+    assert job["status"] == "error" and job["error"] == "Tisk se nespustil: file not found"
+
+def test_start_raising_does_not_leave_job_running(fake_printer, project):
+    def start_print(printer_id, remote_name): raise RuntimeError("dispatcher nedostupný")
+    transfers = PrintTransfers(start_print)
+    job = finished(transfers, transfers.submit(fake_printer[1], project[0], "e.3mf"))
+    assert job["status"] == "error" and "dispatcher nedostupný" in job["error"] and job["finished_at"]
+
+def test_remote_file_name():
+    assert remote_file_name("slozka/Můj model (v2).3mf", 3) == "Můj_model_v2_plate_3.gcode"
+    assert remote_file_name("slozka/+++.3mf", 1) == "tisk_plate_1.gcode"
@@ -0,0 +1,101 @@
+import json
+import os
+import threading
+import time
+import pytest
+import printers
+from printers import PrinterRegistry
+
+def read_file(path):
+    with open(path, encoding="utf-8") as f: return json.load(f)
+
+@pytest.fixture
+def path(tmp_path):
+    # Ručně upravený printers.json: vlastní klíče, diakritika a běhový stav, který se nemá ukládat
+    path = tmp_path / "printers.json"
+    path.write_text(json.dumps([{"id": 1, "name": "Dílna A1", "ip": "10.0.0.5", "access_code": "123", "poznamka": "u okna", "status": "online"}], ensure_ascii=False), encoding="utf-8")
+    return path
+
+def test_write_behind_batches_changes(path, monkeypatch):
+    writes = []
+    real_write = printers.atomic_write
+    monkeypatch.setattr(printers, "atomic_write", lambda p, data: (writes.append(p), real_write(p, data)))
+    registry = PrinterRegistry(path, write_delay=0.2)
+    registry.add({"name": "P1S", "ip": "10.0.0.6", "status": "offline"})
+    registry.update(1, {"name": "Dílna A1 mini"})
+    # Změna je hned vidět v paměti, na disk jde až po WRITE_DELAY jedním zápisem
+    assert [p["name"] for p in registry.all()] == ["Dílna A1 mini", "P1S"]
+    assert len(read_file(path)) == 1 and writes == []
+    time.sleep(0.4)
+    assert len(writes) == 1
+    saved = read_file(path)
+    assert saved == [{"id": 1, "name": "Dílna A1 mini", "ip": "10.0.0.5", "access_code": "123", "poznamka": "u okna"},
+                     {"name": "P1S", "ip": "10.0.0.6", "id": 2}]
+    assert [name for name in os.listdir(path.parent) if name.endswith(".tmp")] == []
+
+def test_round_trip_keeps_hand_edited_fields(path):
+    registry = PrinterRegistry(path)
+    registry.update(1, {"ip": "10.0.0.9"})
+    registry.flush()
+    assert PrinterRegistry(path).all() == [{"id": 1, "name": "Dílna A1", "ip": "10.0.0.9", "access_code": "123", "poznamka": "u okna"}]
+    assert "Dílna" in path.read_text(encoding="utf-8")
+
+def test_failed_write_is_retried(path, monkeypatch):
+    real_write = printers.atomic_write
+    def broken(p, data): raise OSError("disk plný")
+    monkeypatch.setattr(printers, "atomic_write", broken)
+    registry = PrinterRegistry(path)
+    registry.remove(1)
+    registry.flush()
+    assert len(read_file(path)) == 1 and registry.all() == []
+    monkeypatch.setattr(printers, "atomic_write", real_write)
+    registry.flush()
+    assert read_file(path) == []
+
+def test_readers_get_copies(path):
+    registry = PrinterRegistry(path)
+    registry.get(1)["name"] = "změna mimo registr"
+    registry.all()[0]["ip"] = "1.1.1.1"
+    assert registry.get(1)["name"] == "Dílna A1" and registry.get(1)["ip"] == "10.0.0.5"
+
+def test_shared_mode_reloads_changes_from_other_process(path, monkeypatch):
+    monkeypatch.setattr(printers, "RELOAD_INTERVAL", 0.1)
+    first, second = PrinterRegistry(path, shared=True), PrinterRegistry(path, shared=True)
+    assert second.get(1)["name"] == "Dílna A1"
+    # Sdílený režim zapisuje hned, druhý proces to vidí po refresh() nebo po RELOAD_INTERVAL
+    first.update(1, {"name": "přejmenovaná"})
+    assert read_file(path)[0]["name"] == "přejmenovaná"
+    second.refresh()
+    assert second.get(1)["name"] == "přejmenovaná"
+    # Ruční úprava souboru se načte taky
+    data = read_file(path)
+    data.append({"id": 7, "name": "ručně přidaná"})
+    path.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    time.sleep(0.15)
+    assert [p["id"] for p in second.all()] == [1, 7]
+
+def test_concurrent_edits_from_several_processes(path):
+    # Každý registr se svým zámkem = jiný proces; spojuje je jen zámek souboru
+    registries = [PrinterRegistry(path, shared=True) for _ in range(4)]
+
+    def edit(n, registry):
+        for i in range(10):
+            registry.add({"name": f"tiskárna {n}-{i}"})
+            registry.update(1, {f"pole_{n}": i})
+
+    threads = [threading.Thread(target=edit, args=(n, registry)) for n, registry in enumerate(registries)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    saved = read_file(path)
+    assert sorted(p["id"] for p in saved) == list(range(1, 42))
+    assert len({p["name"] for p in saved}) == 41
+    assert {key: value for key, value in saved[0].items() if key.startswith("pole_")} == {f"pole_{n}": 9 for n in range(4)}
+    assert PrinterRegistry(path).all() == saved
+
+def test_concurrent_edits_within_process(path):
+    registry = PrinterRegistry(path, write_delay=0.05)
+    threads = [threading.Thread(target=lambda n=n: [registry.add({"name": f"{n}-{i}"}) for i in range(25)]) for n in range(4)]
+    for thread in threads: thread.start()
+    for thread in threads: thread.join()
+    registry.flush()
+    assert sorted(p["id"] for p in read_file(path)) == list(range(1, 102))
@@ -0,0 +1,64 @@
+import pytest
+from metadata_index import MetadataIndex
+from search_index import SearchIndex
+
+def meta(printer_model="A1", print_time_s=None, weight_g=None, filaments=(), nozzle="0.4", layer="0.2", note=""):
+    return {"printer_model": printer_model, "print_time_s": print_time_s, "weight_g": weight_g, "nozzle_diameter": nozzle, "layer_height": layer,
+            "file_type": "3mf", "filaments": [{"type": t, "color": c} for t, c in filaments], "note": note}
+
+@pytest.fixture
+def library(tmp_path):
+    index = MetadataIndex(str(tmp_path / "metadata_index.sqlite3"))
+    index.upsert("zakaznik/benchy.3mf", 1.0, 100, None, 5, {}, meta("A1", 1800, 10.0, [("PLA", "#FF0000FF")]))
+    index.upsert("zakaznik/drzak.3mf", 1.0, 100, None, 5, {}, meta("P1S", 3600, 25.0, [("PETG", "000000")], note="pro kolo"))
+    index.upsert("archiv/vaza.3mf", 1.0, 100, None, 5, {}, meta("A1", 7300, 80.0, [("PETG", "FFFFFF"), ("PLA", "FF0000")], nozzle="0.6"))
+    return index, SearchIndex(index)
+
+def names(rows):
+    return sorted(row["name"] for row in rows)
+
+def counts(facets, key):
+    return {item["value"]: item["count"] for item in facets[key] if item["count"]}
+
+def test_facet_counts_ignore_own_filter(library):
+    _, search = library
+    rows, total, facets = search.search(filters={"filament_type": ["petg"]})
+    assert total == 2 and names(rows) == ["drzak.3mf", "vaza.3mf"]
+    # Faseta vlastního filtru počítá bez něj, ostatní s ním
+    assert counts(facets, "filament_type") == {"PLA": 2, "PETG": 2}
+    assert counts(facets, "printer_model") == {"A1": 1, "P1S": 1}
+    assert counts(facets, "nozzle_diameter") == {0.4: 1, 0.6: 1}
+
+def test_text_folder_and_colour_filters(library):
+    _, search = library
+    assert names(search.search("kolo")[0]) == ["drzak.3mf"]
+    assert names(search.search("bench")[0]) == ["benchy.3mf"]
+    assert names(search.search(filters={"folder": "zakaznik"})[0]) == ["benchy.3mf", "drzak.3mf"]
+    assert names(search.search(filters={"filament_colour": ["#ff0000"]})[0]) == ["benchy.3mf", "vaza.3mf"]
+
+def test_range_bounds_are_inclusive(library):
+    _, search = library
+    assert names(search.search(filters={"max_print_time": 3600})[0]) == ["benchy.3mf", "drzak.3mf"]
+    assert names(search.search(filters={"min_print_time": 3600, "max_print_time": 3600})[0]) == ["drzak.3mf"]
+    assert names(search.search(filters={"min_weight": 25.0})[0]) == ["drzak.3mf", "vaza.3mf"]
+    # Bucket z fasety použitý jako filtr vrátí přesně tolik souborů, kolik ukazuje jeho počet
+    for bucket in search.search()[2]["print_time"]:
+        assert search.search(filters={"min_print_time": bucket["min"], "max_print_time": bucket["max"]})[1] == bucket["count"]
+
+def test_changes_are_picked_up_incrementally(library):
+    index, search = library
+    assert search.search()[1] == 3
+    index.add_pending([("zakaznik/benchy.3mf", 2.0, 120)])
+    index.upsert("zakaznik/benchy.3mf", 2.0, 120, None, 5, {}, meta("X1C", 600))
+    index.move("archiv/vaza.3mf", "zakaznik/vaza.3mf")
+    index.delete("zakaznik/drzak.3mf")
+    rows, total, facets = search.search(filters={"folder": "zakaznik"})
+    assert total == 2 and names(rows) == ["benchy.3mf", "vaza.3mf"]
+    assert counts(facets, "printer_model") == {"A1": 1, "X1C": 1}
+    assert "P1S" not in counts(search.search()[2], "printer_model")
+
+def test_paging_by_name(library):
+    _, search = library
+    first, total, _ = search.search(limit=2)
+    second, _, _ = search.search(limit=2, offset=2)
+    assert total == 3 and [row["name"] for row in first + second] == ["benchy.3mf", "drzak.3mf", "vaza.3mf"]
@@ -0,0 +1,126 @@
+import json
+import time
+import pytest
+from telemetry import TelemetryStore, merge_delta
+
+def push(**fields):
+    return {"print": dict(fields, command="push_status", msg=1, sequence_id="2001")}
+
+FULL = {"print": {"command": "push_status", "msg": 0, "sequence_id": "2000", "bed_temper": 24.0, "nozzle_temper": 25.0,
+                  "wifi_signal": "-52dBm", "gcode_state": "IDLE", "lights_report": [{"node": "chamber_light", "mode": "off"}],
+                  "ams": {"ams_exist_bits": "1", "tray_now": "255", "ams": [{"id": "0", "humidity": "4"}]}}}
+
+@pytest.fixture
+def store():
+    store = TelemetryStore()
+    store.apply(1, FULL)
+    return store
+
+def test_full_report_without_envelope(store):
+    state = store.get(1)
+    assert state["messages"] == 1 and state["updated_at"]
+    assert set(state["fields"]) == {"bed_temper", "nozzle_temper", "wifi_signal", "gcode_state", "lights_report", "ams"}
+
+def test_partial_deltas_merge_into_snapshot(store):
+    assert store.apply(1, push(bed_temper=55.5)) == {"bed_temper"}
+    assert store.apply(1, push(wifi_signal="-60dBm", mc_percent=3)) == {"wifi_signal", "mc_percent"}
+    # Vnořený slovník se slučuje po klíčích, seznam se nahrazuje celý
+    assert store.apply(1, push(ams={"tray_now": "0"})) == {"ams"}
+    assert store.apply(1, push(lights_report=[{"node": "chamber_light", "mode": "on"}])) == {"lights_report"}
+    fields = store.get(1)["fields"]
+    assert fields["bed_temper"] == 55.5 and fields["nozzle_temper"] == 25.0 and fields["mc_percent"] == 3
+    assert fields["ams"] == {"ams_exist_bits": "1", "tray_now": "0", "ams": [{"id": "0", "humidity": "4"}]}
+    assert fields["lights_report"] == [{"node": "chamber_light", "mode": "on"}]
+    assert store.get(1)["messages"] == 5
+
+def test_unchanged_values_and_other_messages_report_nothing(store):
+    assert store.apply(1, push(bed_temper=24.0, ams={"tray_now": "255"})) == set()
+    assert store.apply(1, {"print": {"command": "gcode_line", "sequence_id": "7", "result": "success"}}) == set()
+    assert store.apply(1, {"info": {"command": "get_version"}}) == set()
+    assert store.get(1)["messages"] == 2
+    assert store.get(2) is None
+
+def test_state_does_not_alias_reports():
+    # Zprávu drží i záznamník telemetrie - pozdější delta ji nesmí změnit
+    store, report = TelemetryStore(), push(ams={"tray_now": "255"}, lights_report=[{"mode": "off"}])
+    store.apply(1, report)
+    store.apply(1, push(ams={"tray_now": "1"}))
+    assert report["print"]["ams"] == {"tray_now": "255"}
+    assert store.get(1)["fields"]["ams"] == {"tray_now": "1"}
+
+def test_get_selected_fields_returns_copy(store):
+    state = store.get(1, ["ams", "neexistuje"])
+    assert list(state["fields"]) == ["ams"]
+    state["fields"]["ams"]["tray_now"] = "3"
+    assert store.get(1)["fields"]["ams"]["tray_now"] == "255"
+
+def test_merge_delta_new_nested_key():
+    state = {"a": 1}
+    assert merge_delta(state, {"b": {"c": 1}, "a": 1}) == {"b"}
+    assert merge_delta(state, {"b": {"d": None}}) == {"b"}
+    assert state == {"a": 1, "b": {"c": 1, "d": None}}
+
+def parse(message):
+    if message.startswith(":"): return "keep-alive", None
+    event, data = message.rstrip("\n").split("\n")
+    return event[len("event: "):], json.loads(data[len("data: "):])
+
+def test_stream_starts_with_snapshot_then_sends_changed_fields(store):
+    store.apply(2, push(bed_temper=60.0))
+    stream = store.stream([1, 2, 3], rate=2)
+    # Snapshot jen pro tiskárny, o kterých něco víme, s celým stavem
+    first, second = parse(next(stream)), parse(next(stream))
+    assert first[0] == "snapshot" and first[1]["printer_id"] == 1 and first[1]["fields"]["ams"]["tray_now"] == "255"
+    assert second[0] == "snapshot" and second[1]["fields"] == {"bed_temper": 60.0}
+    store.apply(1, push(bed_temper=30.0))
+    event, data = parse(next(stream))
+    assert event == "update" and data["printer_id"] == 1 and data["fields"] == {"bed_temper": 30.0} and data["messages"] == 2
+    stream.close()
+
+def test_stream_coalesces_changes_within_rate_limit(store):
+    stream = store.stream([1], rate=100)  # víc než MAX_RATE se nepovolí
+    parse(next(stream))
+    store.apply(1, push(bed_temper=30.0))
+    parse(next(stream))
+    # Během povinné pauzy po události přijdou tři delty - klient dostane jednu zprávu s posledními hodnotami
+    store.apply(1, push(bed_temper=31.0))
+    store.apply(1, push(bed_temper=32.0, mc_percent=1))
+    store.apply(1, push(ams={"tray_now": "2"}))
+    started = time.monotonic()
+    event, data = parse(next(stream))
+    assert time.monotonic() - started >= 0.45
+    assert event == "update" and data["fields"] == {"bed_temper": 32.0, "mc_percent": 1, "ams": {"ams_exist_bits": "1", "tray_now": "2", "ams": [{"id": "0", "humidity": "4"}]}}
+    stream.close()
+
+def test_stream_filters_printers_and_sends_keepalive(store):
+    stream = store.stream([1], keepalive=0.1)
+    parse(next(stream))
+    store.apply(2, push(bed_temper=99.0))
+    store.apply(1, push(bed_temper=24.0))  # beze změny
+    assert parse(next(stream)) == ("keep-alive", None)
+    stream.close()
+
+def test_closed_stream_unsubscribes_and_reconnect_resumes_from_snapshot(store):
+    stream = store.stream([1])
+    parse(next(stream))
+    assert len(store._subscriptions) == 1
+    stream.close()
+    assert store._subscriptions == set()
+    # Změny během výpadku spojení se neztratí: nové připojení (EventSource se připojí samo) začne celým stavem
+    store.apply(1, push(bed_temper=70.0, gcode_state="RUNNING"))
+    resumed = store.stream([1])
+    event, data = parse(next(resumed))
+    assert event == "snapshot" and data["fields"]["bed_temper"] == 70.0 and data["fields"]["gcode_state"] == "RUNNING"
+    assert data["fields"]["nozzle_temper"] == 25.0 and data["messages"] == 2
+    resumed.close()
+
+def test_subscription_listener_for_async_clients(store):
+    # asgi.py čeká na listener místo blokujícího wait(); změny si pak vyzvedne přes wait(0)
+    calls = []
+    subscription = store.subscribe([1], listener=lambda: calls.append(1))
+    store.apply(1, push(bed_temper=40.0))
+    store.apply(1, push(mc_percent=5))
+    store.apply(2, push(bed_temper=40.0))
+    assert calls == [1, 1]
+    assert subscription.wait(0) == {1: {"bed_temper", "mc_percent"}} and subscription.wait(0) == {}
+    store.unsubscribe(subscription)
@@ -0,0 +1,64 @@
+import pytest
+from telemetry_history import TelemetryHistory, HOLD_LIMIT, METRICS, CAPACITY
+
+def series(history, resolution, start=0, end=10 ** 6):
+    result = history.query(1, "bed_temper", start, end, resolution)
+    return dict(zip(result["t"], result["v"]))
+
+def test_minute_average_is_time_weighted():
+    history = TelemetryHistory()
+    # 20 °C platí 50 s, pak krátká špička 100 °C a zpět na 20 °C; posílají se jen změny
+    history.record(1, {"bed_temper": 20}, ts=0)
+    history.record(1, {"bed_temper": 100}, ts=50)
+    history.record(1, {"bed_temper": 20}, ts=51)
+    history.record(1, {"bed_temper": 20}, ts=60)
+    assert history.query(1, "bed_temper", 0, 60, "1m")["v"][0] == pytest.approx((20 * 59 + 100) / 60, abs=0.05)
+    # Minuty drží jen průměr, krátkou špičku ukážou min/max hodiny
+    hour = history.query(1, "bed_temper", 0, 3600, "1h")
+    assert (hour["min"][0], hour["max"][0]) == (20, 100)
+
+def test_value_is_carried_into_minutes_without_samples():
+    history = TelemetryHistory()
+    history.record(1, {"bed_temper": 60}, ts=0)
+    history.record(1, {"bed_temper": 30}, ts=150)
+    history.record(1, {"bed_temper": 30}, ts=180)
+    assert series(history, "1m") == {0: 60, 60: 60, 120: pytest.approx((60 * 30 + 30 * 30) / 60), 180: 30}
+
+def test_hold_stops_after_limit():
+    history = TelemetryHistory()
+    history.record(1, {"bed_temper": 50}, ts=0)
+    history.record(1, {"bed_temper": 50}, ts=HOLD_LIMIT + 600)
+    assert HOLD_LIMIT + 300 not in series(history, "1m")
+    assert series(history, "1m")[HOLD_LIMIT - 60] == 50
+
+def test_hour_average_is_time_weighted():
+    history = TelemetryHistory()
+    # 45 minut 0, pak 15 minut 100 s hustými vzorky - počet vzorků nesmí průměr ovlivnit
+    history.record(1, {"bed_temper": 0}, ts=0)
+    history.record(1, {"bed_temper": 0}, ts=600)
+    history.record(1, {"bed_temper": 0}, ts=1200)
+    history.record(1, {"bed_temper": 0}, ts=1800)
+    for ts in range(2700, 3600, 5): history.record(1, {"bed_temper": 100}, ts=ts)
+    history.record(1, {"bed_temper": 100}, ts=3600)
+    history.record(1, {"bed_temper": 100}, ts=3660)
+    assert series(history, "1h")[0] == pytest.approx(25)
+
+def test_printer_fits_memory_budget():
+    # Celá farma na týden v pár MB: tiskárna se všemi veličinami do 256 KiB, i po zaplnění všech ringů
+    history = TelemetryHistory()
+    history.record(1, {metric: 1 for metric in METRICS}, ts=0)
+    allocated = history.memory_bytes(1)
+    assert allocated <= 256 * 1024
+    for ts in range(0, 100 * 24 * 3600, 3 * 3600): history.record(1, {metric: ts % 300 for metric in METRICS}, ts=ts)
+    assert history.memory_bytes(1) == allocated
+
+def test_rings_keep_only_their_capacity():
+    history = TelemetryHistory()
+    for ts in range(0, 5 * 24 * 3600, 30): history.record(1, {"bed_temper": 60.25 if ts % 60 else 40}, ts=ts + 0.5)
+    raw = history.query(1, "bed_temper", 0, 10 ** 7, "raw")
+    assert len(raw["t"]) == CAPACITY["raw"] and raw["t"][-1] == 5 * 24 * 3600 - 29.5
+    assert set(raw["v"]) == {40, 60.2}
+    minutes = series(history, "1m", 0, 10 ** 7)
+    # Ring minut + rozpracovaná minuta
+    assert len(minutes) == CAPACITY["1m"] + 1 and max(minutes) - min(minutes) == CAPACITY["1m"] * 60
+    assert history.query(1, "bed_temper", 0, 10 ** 7, "auto")["resolution"] == "1h"
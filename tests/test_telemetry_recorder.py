@@ -0,0 +1,38 @@
+import time
+from telemetry_recorder import TelemetryRecorder, read_records
+
+def wait_for(condition, timeout=5):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if condition(): return True
+        time.sleep(0.02)
+    return False
+
+def test_records_round_trip(tmp_path):
+    recorder = TelemetryRecorder(str(tmp_path))
+    for i in range(10): recorder.record(i % 2, {"print": {"seq": i}}, "SN", ts=1000.0 + i)
+    recorder.flush()
+    assert [r["report"]["print"]["seq"] for r in read_records(str(tmp_path), printer_id=1)] == [1, 3, 5, 7, 9]
+    assert [r["t"] for r in read_records(str(tmp_path), start=1003, end=1004)] == [1003.0, 1004.0]
+    recorder.stop()
+
+def test_bad_batch_does_not_stop_writer(tmp_path):
+    recorder = TelemetryRecorder(str(tmp_path), flush_interval=0.05)
+    recorder.start()
+    # Neserializovatelná zpráva shodí jen svou dávku, vlákno zapisuje dál
+    recorder.record(1, {"bad": object()}, ts=1000.0)
+    assert wait_for(lambda: not recorder._buffer)
+    recorder.record(1, {"ok": True}, ts=1001.0)
+    assert wait_for(lambda: list(read_records(str(tmp_path))))
+    assert recorder._thread.is_alive()
+    recorder.stop()
+    assert [r["report"] for r in read_records(str(tmp_path))] == [{"ok": True}]
+
+def test_buffer_is_capped(tmp_path):
+    recorder = TelemetryRecorder(str(tmp_path), max_buffer_records=3)
+    for i in range(5): recorder.record(1, {"seq": i}, ts=1000.0 + i)
+    assert recorder.dropped == 2
+    recorder.flush()
+    assert [r["report"]["seq"] for r in read_records(str(tmp_path))] == [2, 3, 4]
+    assert recorder.dropped == 0
+    recorder.stop()
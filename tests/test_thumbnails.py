@@ -0,0 +1,16 @@
+import thumbnails
+from thumbnails import etag_for
+
+def test_etag_follows_content_and_cache_is_bounded(tmp_path, monkeypatch):
+    monkeypatch.setattr(thumbnails, "ETAG_CACHE_SIZE", 3)
+    monkeypatch.setattr(thumbnails, "_etag_cache", thumbnails.OrderedDict())
+    path = tmp_path / "plate_1.png"
+    path.write_bytes(b"a")
+    first = etag_for(str(path))
+    path.write_bytes(b"bb")
+    assert etag_for(str(path)) != first
+    for i in range(5):
+        other = tmp_path / f"plate_{i + 2}.png"
+        other.write_bytes(bytes([i]))
+        etag_for(str(other))
+    assert len(thumbnails._etag_cache) == 3 and str(tmp_path / "plate_6.png") in thumbnails._etag_cache
@@ -0,0 +1,9 @@
+from workers import _worker_count
+
+def test_worker_count_from_environment_or_server_arguments():
+    assert _worker_count({}, ["app.py"]) == 1
+    assert _worker_count({"WEB_CONCURRENCY": "3"}, ["uvicorn", "asgi:api", "--workers", "8"]) == 3
+    assert _worker_count({}, ["uvicorn", "asgi:api", "--workers", "4"]) == 4
+    assert _worker_count({}, ["uvicorn", "asgi:api", "--workers=2"]) == 2
+    assert _worker_count({}, ["gunicorn", "-w", "5", "app:app"]) == 5
+    assert _worker_count({}, ["gunicorn", "-w6", "app:app"]) == 6
@@ -0,0 +1,133 @@
+import hashlib
+import io
+import os
+import shutil
+import threading
+import uuid
+from collections import OrderedDict
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+# Kromě originálu z 3MF ukládáme zmenšené varianty ve WebP - karty ve výpisu nepotřebují plné PNG.
+# Bez Pillow se prostě servíruje originál.
+VARIANTS = {"grid": 192, "detail": 640}
+VARIANT_EXT = ".webp"
+VARIANT_QUALITY = 80
+
+# Náhledy souboru leží ve vlastní složce thumbnails/<klíč>/plate_<n>.png; klíč drží metadata_index.
+# Přejmenování souboru na ně nesahá a smazání je jedno rmtree - bez procházení celé složky náhledů.
+# Starší náhledy ležely přímo v thumbnails/ jako <soubor>_plate_<n>.png.
+
+# ETagy posledních ETAG_CACHE_SIZE souborů (LRU)
+ETAG_CACHE_SIZE = 4096
+_etag_cache = OrderedDict()
+_etag_lock = threading.Lock()
+
+def variant_path(original_path, variant):
+    root, _ = os.path.splitext(original_path)
+    return f"{root}_{variant}{VARIANT_EXT}"
+
+def new_thumb_key():
+    return uuid.uuid4().hex
+
+def plate_file_name(plate_index):
+    return f"plate_{plate_index}.png"
+
+def thumb_dir(thumbnails_root, thumb_key):
+    return os.path.join(thumbnails_root, thumb_key)
+
+def legacy_plate_path(thumbnails_root, base_filename, plate_index):
+    return os.path.join(thumbnails_root, f"{base_filename}_plate_{plate_index}.png")
+
+def thumbnail_files(original_path):
+    return [original_path] + [variant_path(original_path, variant) for variant in VARIANTS]
+
+def reset_thumb_dir(thumbnails_root, thumb_key):
+    # Před novou extrakcí: nesmí zůstat náhledy plátů, které v novém souboru už nejsou
+    remove_thumbnails(thumbnails_root, [thumb_key])
+    os.makedirs(thumb_dir(thumbnails_root, thumb_key), exist_ok=True)
+    return thumb_dir(thumbnails_root, thumb_key)
+
+def remove_thumbnails(thumbnails_root, thumb_keys):
+    for thumb_key in thumb_keys:
+        if thumb_key: shutil.rmtree(thumb_dir(thumbnails_root, thumb_key), ignore_errors=True)
+
+def remove_legacy_thumbnails(thumbnails_root, base_filename, plates):
+    for plate_index in plates:
+        for path in thumbnail_files(legacy_plate_path(thumbnails_root, base_filename, plate_index)):
+            if os.path.exists(path): os.remove(path)
+
+def adopt_legacy_thumbnails(thumbnails_root, base_filename, plates, thumb_key):
+    # Přesune staré náhledy <soubor>_plate_<n>.* do složky s klíčem; vrací, zda se nějaký našel
+    os.makedirs(thumb_dir(thumbnails_root, thumb_key), exist_ok=True)
+    found = False
+    for plate_index in plates:
+        new_files = thumbnail_files(os.path.join(thumb_dir(thumbnails_root, thumb_key), plate_file_name(plate_index)))
+        for old_path, new_path in zip(thumbnail_files(legacy_plate_path(thumbnails_root, base_filename, plate_index)), new_files):
+            if os.path.exists(old_path):
+                os.replace(old_path, new_path)
+                found = True
+    if not found: os.rmdir(thumb_dir(thumbnails_root, thumb_key))
+    return found
+
+def thumbnail_bytes(thumbnails_root, thumb_key):
+    # Velikost náhledů jednoho souboru (originály plátů + varianty); jen jeho složka, ne celé thumbnails/
+    try: return sum(entry.stat().st_size for entry in os.scandir(thumb_dir(thumbnails_root, thumb_key)) if entry.is_file())
+    except FileNotFoundError: return 0
+
+def legacy_thumbnail_bytes(thumbnails_root, base_filename, plates):
+    return sum(os.path.getsize(path) for plate_index in plates for path in thumbnail_files(legacy_plate_path(thumbnails_root, base_filename, plate_index)) if os.path.exists(path))
+
+def _write_atomic(path, data):
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'wb') as f: f.write(data)
+    os.replace(tmp_path, path)
+
+def _render_variant(image_bytes, variant):
+    with Image.open(io.BytesIO(image_bytes)) as image:
+        image = image.convert("RGBA") if image.mode in ("P", "LA", "RGBA") else image.convert("RGB")
+        image.thumbnail((VARIANTS[variant], VARIANTS[variant]))
+        output = io.BytesIO()
+        image.save(output, "WEBP", quality=VARIANT_QUALITY, method=4)
+        return output.getvalue()
+
+def make_variants(original_path, image_bytes=None):
+    if Image is None: return
+    if image_bytes is None:
+        with open(original_path, 'rb') as f: image_bytes = f.read()
+    for variant in VARIANTS:
+        try: _write_atomic(variant_path(original_path, variant), _render_variant(image_bytes, variant))
+        except Exception as e: print(f"Chyba při zmenšování náhledu {original_path}: {e}")
+
+def save_plate_thumbnail(original_path, image_bytes):
+    _write_atomic(original_path, image_bytes)
+    make_variants(original_path, image_bytes)
+
+def ensure_variant(original_path, variant):
+    # Starší náhledy (nebo chybějící Pillow) - varianta se dopočítá při prvním požadavku
+    if Image is None or variant not in VARIANTS: return original_path
+    path = variant_path(original_path, variant)
+    try:
+        if os.path.getmtime(path) >= os.path.getmtime(original_path): return path
+    except OSError: pass
+    make_variants(original_path)
+    return path if os.path.exists(path) else original_path
+
+def etag_for(path):
+    # Silný ETag z obsahu; přepočítá se jen když se změní mtime nebo velikost
+    file_stat = os.stat(path)
+    key = (file_stat.st_mtime_ns, file_stat.st_size)
+    with _etag_lock:
+        cached = _etag_cache.get(path)
+        if cached and cached[0] == key:
+            _etag_cache.move_to_end(path)
+            return cached[1]
+    with open(path, 'rb') as f: etag = hashlib.sha1(f.read()).hexdigest()
+    with _etag_lock:
+        _etag_cache[path] = (key, etag)
+        _etag_cache.move_to_end(path)
+        while len(_etag_cache) > ETAG_CACHE_SIZE: _etag_cache.popitem(last=False)
+    return etag
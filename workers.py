@@ -0,0 +1,193 @@
+import functools
+import hashlib
+import os
+import sys
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+from multiprocessing import AuthenticationError
+from multiprocessing.connection import Listener, Client
+try:
+    import fcntl
+except ImportError:
+    fcntl = None  # mimo POSIX jen jeden worker, zámky jsou pak jen uvnitř procesu
+
+# Provoz s více worker procesy:
+#   uvicorn asgi:api --workers 4             služby startuje lifespan v asgi.py
+#   gunicorn -c gunicorn.conf.py -w 4 app:app  služby startuje hook post_worker_init (bez --preload)
+# Jiný server s víc procesy musí v každém workeru zavolat app.start_background_services()
+# a nastavit WEB_CONCURRENCY na počet workerů.
+# Sdílené mezi procesy: index metadat (SQLite WAL), náhledy a poznámky na disku (atomické zápisy
+# pod souborovým zámkem), printers.json (zámek + znovunačtení po změně), stav úloh zpracování
+# (SQLite) a relace nahrávání po částech (JSON + souborové zámky). Spojení s tiskárnami
+# (MQTT, telemetrie, příkazy, přenosy) drží jen jeden proces - vedoucí, který vlastní zámek
+# leader.lock; ostatní mu operace předávají přes unix socket. Když vedoucí skončí, převezme to další.
+def _worker_count(environ=os.environ, argv=sys.argv):
+    # WEB_CONCURRENCY čte uvicorn i gunicorn; bez něj počet z příkazové řádky serveru
+    # (workery uvicornu i gunicornu mají argv rodičovského procesu)
+    if environ.get("WEB_CONCURRENCY"): return int(environ["WEB_CONCURRENCY"])
+    for i, arg in enumerate(argv[1:], 1):
+        if arg in ("--workers", "-w") and i + 1 < len(argv) and argv[i + 1].isdigit(): return int(argv[i + 1])
+        if arg.startswith("--workers=") and arg[10:].isdigit(): return int(arg[10:])
+        if arg.startswith("-w") and arg[2:].isdigit(): return int(arg[2:])
+    return 1
+
+WORKER_COUNT = _worker_count()
+LEADER_RETRY = 5.0
+RPC_TIMEOUT = 60
+
+class LeaderUnavailable(Exception):
+    pass
+
+@contextmanager
+def file_lock(path, shared=False):
+    # Zámek přes procesy (flock); zámkový soubor se nemaže, aby dva procesy nezamkly různé inody
+    if fcntl is None:
+        yield
+        return
+    with open(path, "a") as f:
+        fcntl.flock(f.fileno(), fcntl.LOCK_SH if shared else fcntl.LOCK_EX)
+        try: yield
+        finally: fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+def atomic_write(path, data):
+    # Čtenář vidí buď celý starý, nebo celý nový obsah (dočasný soubor ve stejné složce + rename)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb" if isinstance(data, bytes) else "w", **({} if isinstance(data, bytes) else {"encoding": "utf-8"})) as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        try: os.remove(tmp_path)
+        except OSError: pass
+        raise
+
+class WorkerGroup:
+    def __init__(self, data_dir):
+        self.lock_dir = os.path.join(data_dir, "locks")
+        self.leader_lock_path = os.path.join(data_dir, "leader.lock")
+        self.address = os.path.join(data_dir, "leader.sock")
+        self.key_path = os.path.join(data_dir, "leader.key")
+        # Dokud se nespustí služby (skripty, testovací klient), všechno běží v tomto procesu
+        self.is_leader = True
+        self._operations = {}
+        self._streams = set()
+        self._lock_file = None
+        self._listener = None
+        self._authkey = None
+
+    def path_lock(self, key):
+        # Zámek pro jednu položku knihovny (soubor, poznámka), sdílený všemi procesy
+        os.makedirs(self.lock_dir, exist_ok=True)
+        return file_lock(os.path.join(self.lock_dir, hashlib.sha1(key.encode("utf-8")).hexdigest() + ".lock"))
+
+    def operation(self, func):
+        # Funkce, která potřebuje spojení s tiskárnami: ve vedoucím procesu běží přímo, jinde se přepošle
+        self._operations[func.__name__] = func
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.is_leader: return func(*args, **kwargs)
+            return self._call(func.__name__, args, kwargs)
+        return wrapper
+
+    def stream(self, func):
+        # Jako operation, jen pro generátory (SSE): položky chodí po jedné, dokud klient neodejde
+        self._operations[func.__name__] = func
+        self._streams.add(func.__name__)
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if self.is_leader: return func(*args, **kwargs)
+            return self._call_stream(func.__name__, args, kwargs)
+        return wrapper
+
+    def start(self, on_leader):
+        # on_leader() spustí služby s tiskárnami; volá se v procesu, který získá zámek (i později po výpadku)
+        if self._try_lead(on_leader): return True
+        self.is_leader = False
+        threading.Thread(target=self._wait_for_leadership, args=(on_leader,), name="leader-election", daemon=True).start()
+        return False
+
+    def _try_lead(self, on_leader):
+        os.makedirs(os.path.dirname(self.leader_lock_path), exist_ok=True)
+        lock_file = open(self.leader_lock_path, "a")
+        if fcntl is not None:
+            try: fcntl.flock(lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                lock_file.close()
+                return False
+        self._lock_file = lock_file
+        if fcntl is not None: self._serve()
+        self.is_leader = True
+        on_leader()
+        return True
+
+    def _wait_for_leadership(self, on_leader):
+        while not self._try_lead(on_leader): time.sleep(LEADER_RETRY)
+        print(f"[WORKERS] Proces {os.getpid()} převzal spojení s tiskárnami")
+
+    def _serve(self):
+        # Nový klíč při každém převzetí; socket po mrtvém vedoucím se smaže (zámek drží tento proces)
+        self._authkey = os.urandom(32)
+        old_umask = os.umask(0o077)
+        try:
+            atomic_write(self.key_path, self._authkey)
+            try: os.remove(self.address)
+            except FileNotFoundError: pass
+            self._listener = Listener(self.address, family="AF_UNIX", authkey=self._authkey)
+        finally: os.umask(old_umask)
+        threading.Thread(target=self._accept, name="leader-rpc", daemon=True).start()
+
+    def _accept(self):
+        while True:
+            try: conn = self._listener.accept()
+            except (OSError, EOFError, AuthenticationError): continue  # chybný klíč nebo přerušené spojení
+            threading.Thread(target=self._handle, args=(conn,), name="leader-rpc-call", daemon=True).start()
+
+    def _handle(self, conn):
+        with conn:
+            try: name, args, kwargs = conn.recv()
+            except (EOFError, OSError): return
+            func = self._operations.get(name)
+            try:
+                if func is None: raise LeaderUnavailable(f"Neznámá operace {name}")
+                if name not in self._streams:
+                    conn.send(("ok", func(*args, **kwargs)))
+                    return
+                items = func(*args, **kwargs)
+                try:
+                    for item in items: conn.send(("item", item))
+                finally: items.close()
+                conn.send(("end", None))
+            except (BrokenPipeError, ConnectionResetError, EOFError): pass
+            except Exception as e:
+                try: conn.send(("error", e))
+                except (OSError, ValueError): pass
+
+    def _connect(self):
+        try:
+            with open(self.key_path, "rb") as f: authkey = f.read()
+            return Client(self.address, family="AF_UNIX", authkey=authkey)
+        except (OSError, EOFError) as e: raise LeaderUnavailable(f"Proces se spojením s tiskárnami není dostupný: {e}")
+
+    def _call(self, name, args, kwargs):
+        with self._connect() as conn:
+            conn.send((name, args, kwargs))
+            if not conn.poll(RPC_TIMEOUT): raise LeaderUnavailable("Proces se spojením s tiskárnami neodpovídá")
+            status, value = conn.recv()
+        if status == "error": raise value
+        return value
+
+    def _call_stream(self, name, args, kwargs):
+        conn = self._connect()
+        try:
+            conn.send((name, args, kwargs))
+            while True:
+                status, value = conn.recv()
+                if status == "end": return
+                if status == "error": raise value
+                yield value
+        except EOFError: return
+        finally: conn.close()